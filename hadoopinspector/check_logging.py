@@ -0,0 +1,308 @@
+#!/usr/bin/env python2
+"""
+This source code is protected by the BSD license.  See the file "LICENSE"
+in the source code root directory for the full language or refer to it here:
+   http://opensource.org/licenses/BSD-3-Clause
+Copyright 2015, 2016 Will Farmer and Ken Farmer
+"""
+
+import os, sys, threading, errno, datetime
+import traceback
+import json, gzip, zlib
+import logging
+import logging.handlers
+import collections
+from os.path import isdir, isfile, exists, dirname, basename
+from os.path import join as pjoin
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+RUN_LOG_FORMATS = ('dirs', 'jsonl')
+
+DEFAULT_MAX_OPEN_FILES = 64
+DEFAULT_QUEUE_SIZE     = 10000
+
+LOG_FORMAT  = '%(asctime)s : %(name)-12s : %(levelname)-8s : %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H.%M.%S'
+
+_STOP  = object()
+_FLUSH = object()
+
+
+
+def get_check_log_writer(run_log_format, run_log_dir, instance, database):
+    """ Returns a check log writer for the format.
+
+    :param run_log_format - str, one of RUN_LOG_FORMATS
+    """
+    assert run_log_format in RUN_LOG_FORMATS
+    if run_log_format == 'jsonl':
+        return JsonlCheckLogWriter(run_log_dir, instance, database)
+    else:
+        return CheckLogWriter(run_log_dir, instance, database)
+
+
+class CheckLogWriter(object):
+    """ Writes check log records from a single background thread.
+
+    Check code logs through the adapters returned by get_logger().  Their
+    records are formatted on the calling thread, then queued - so that
+    creating directories and opening, rotating and writing files all
+    happen on the writer thread, off the check's critical path.
+
+    Records are written to run_log_dir/instance/database/table/check/check.log
+    through RotatingFileHandlers, of which at most max_open_files are kept
+    open - the least recently used is closed when another is needed.
+
+    The queue is bounded so that a slow disk slows logging down rather than
+    exhausting memory.  Any number of threads may log at once.
+    """
+
+    def __init__(self, run_log_dir, instance, database,
+                 max_open_files=DEFAULT_MAX_OPEN_FILES, queue_size=DEFAULT_QUEUE_SIZE):
+        assert isdir(run_log_dir)
+        assert max_open_files > 0
+        self.run_log_dir    = run_log_dir
+        self.instance       = instance
+        self.database       = database
+        self.max_open_files = max_open_files
+        self.queue          = queue.Queue(maxsize=queue_size)
+        self.handlers       = collections.OrderedDict()
+        self.formatter      = logging.Formatter(LOG_FORMAT, DATE_FORMAT)
+        self._open()
+        self.thread         = threading.Thread(target=self._run, name='CheckLogWriter')
+        self.thread.daemon  = True
+        self.thread.start()
+        install_handler()
+
+    def get_logger(self, table, check, log_level='debug'):
+        """ Returns a logger for a single check's records.
+        """
+        logger = logging.getLogger('CheckLogger')
+        logger.setLevel(log_level.upper())
+        return logging.LoggerAdapter(logger, {'hapinsp_check_log': (self, table, check)})
+
+    def put(self, table, check, record):
+        self.queue.put((table, check, self._prepare(record)))
+
+    def _prepare(self, record):
+        """ Formats the record's message & any exception on the calling
+            thread - so that its args and exc_info are not used after the
+            logging call has returned.
+        """
+        prepared = logging.makeLogRecord(record.__dict__)
+        prepared.msg      = record.getMessage()
+        prepared.args     = None
+        prepared.exc_info = None
+        if record.exc_info and not record.exc_text:
+            prepared.exc_text = self.formatter.formatException(record.exc_info)
+        return prepared
+
+    def flush(self):
+        """ Blocks until every queued record has been written.
+        """
+        self.queue.put(_FLUSH)
+        self.queue.join()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join()
+
+    def _open(self):
+        pass
+
+    def _flush(self):
+        pass
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _STOP:
+                    self._close()
+                    return
+                elif item is _FLUSH:
+                    self._flush()
+                    continue
+                table, check, record = item
+                self._write(table, check, record)
+            except Exception:
+                handle_error()
+            finally:
+                self.queue.task_done()
+
+    def _write(self, table, check, record):
+        self._get_handler(table, check).handle(record)
+
+    def _get_handler(self, table, check):
+        key = (table, check)
+        try:
+            handler = self.handlers.pop(key)
+        except KeyError:
+            if len(self.handlers) >= self.max_open_files:
+                _, lru_handler = self.handlers.popitem(last=False)
+                lru_handler.close()
+            check_log_dir = pjoin(self.run_log_dir, self.instance, self.database, table, check)
+            mkdirs(check_log_dir)
+            handler = logging.handlers.RotatingFileHandler(pjoin(check_log_dir, 'check.log'),
+                                                           maxBytes=1000000, backupCount=20)
+            handler.setFormatter(self.formatter)
+        self.handlers[key] = handler
+        return handler
+
+    def _close(self):
+        for handler in self.handlers.values():
+            handler.close()
+        self.handlers = collections.OrderedDict()
+
+
+
+class JsonlCheckLogWriter(CheckLogWriter):
+    """ Writes all of a run's check log records to a single gzipped
+        json-lines file: run_log_dir/instance/database/run_<timestamp>.jsonl.gz
+
+    Each line is a json object with the record's ts, table, check, level
+    and message.  Each consecutive series of records for one check is
+    written as its own gzip member, and an index - written alongside as
+    <run log>.idx - holds the offset & length of each of a check's members
+    along with its record count and first & last timestamps.  That allows
+    read_check_log() to decompress only one check's records, while the
+    file as a whole can still be read with zcat or gzip.open().
+
+    The index is rewritten on every flush() - so a run's log can be read
+    before the run finishes.
+    """
+
+    def _open(self):
+        run_dir = pjoin(self.run_log_dir, self.instance, self.database)
+        mkdirs(run_dir)
+        self.fqfn = pjoin(run_dir, 'run_%s.jsonl.gz' % datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S_%f'))
+        self.index_fqfn = get_index_fqfn(self.fqfn)
+        self.outfile = open(self.fqfn, 'wb')
+        self.index   = collections.OrderedDict()
+        self.segment = None     # (table, check, start offset, GzipFile)
+
+    def _write(self, table, check, record):
+        if self.segment is None or self.segment[:2] != (table, check):
+            self._end_segment()
+            start_offset = self.outfile.tell()
+            gzfile = gzip.GzipFile(filename='', mode='wb', fileobj=self.outfile, mtime=0)
+            self.segment = (table, check, start_offset, gzfile)
+
+        rec_ts = datetime.datetime.utcfromtimestamp(record.created).isoformat()
+        message = record.getMessage()
+        if record.exc_text:
+            message = '%s\n%s' % (message, record.exc_text)
+        rec = {'ts':      rec_ts,
+               'table':   table,
+               'check':   check,
+               'level':   record.levelname,
+               'message': message}
+        self.segment[3].write(json.dumps(rec, sort_keys=True).encode('utf-8') + b'\n')
+
+        if (table, check) not in self.index:
+            self.index[(table, check)] = {'table':      table,
+                                          'check':      check,
+                                          'segments':   [],
+                                          'record_cnt': 0,
+                                          'first_ts':   rec_ts}
+        entry = self.index[(table, check)]
+        entry['record_cnt'] += 1
+        entry['last_ts']     = rec_ts
+
+    def _end_segment(self):
+        if self.segment is None:
+            return
+        table, check, start_offset, gzfile = self.segment
+        gzfile.close()
+        self.index[(table, check)]['segments'].append([start_offset, self.outfile.tell() - start_offset])
+        self.segment = None
+
+    def _write_index(self):
+        temp_fqfn = self.index_fqfn + '.temp'
+        with open(temp_fqfn, 'w') as outfile:
+            json.dump({'run_log': basename(self.fqfn),
+                       'checks':  list(self.index.values())}, outfile)
+        os.rename(temp_fqfn, self.index_fqfn)
+
+    def _flush(self):
+        self._end_segment()
+        self.outfile.flush()
+        self._write_index()
+
+    def _close(self):
+        self._flush()
+        self.outfile.close()
+
+
+
+def get_index_fqfn(run_log_fqfn):
+    return run_log_fqfn + '.idx'
+
+
+def read_check_log(run_log_fqfn, table, check):
+    """ Returns one check's records from a jsonl run log, using its index.
+
+    Returns: list of dicts with ts, table, check, level & message keys
+    """
+    with open(get_index_fqfn(run_log_fqfn)) as infile:
+        index = json.load(infile)
+    recs = []
+    with open(run_log_fqfn, 'rb') as infile:
+        for entry in index['checks']:
+            if entry['table'] != table or entry['check'] != check:
+                continue
+            for offset, length in entry['segments']:
+                infile.seek(offset)
+                segment = zlib.decompress(infile.read(length), 16 + zlib.MAX_WBITS)
+                recs.extend(json.loads(line) for line in segment.decode('utf-8').splitlines())
+    return recs
+
+
+
+class CheckLogHandler(logging.Handler):
+    """ Hands records logged through a CheckLogWriter's adapters to that
+        writer's queue.  Other records are ignored.
+    """
+
+    def emit(self, record):
+        try:
+            writer, table, check = record.hapinsp_check_log
+        except AttributeError:
+            return
+        try:
+            writer.put(table, check, record)
+        except Exception:
+            self.handleError(record)
+
+
+
+_handler_lock = threading.Lock()
+
+def install_handler():
+    """ Adds the single shared CheckLogHandler to the CheckLogger.
+    """
+    logger = logging.getLogger('CheckLogger')
+    with _handler_lock:
+        if not any(isinstance(x, CheckLogHandler) for x in logger.handlers):
+            logger.addHandler(CheckLogHandler())
+
+
+def handle_error():
+    """ Reports a failed write the way logging.Handler.handleError does.
+    """
+    if logging.raiseExceptions:
+        traceback.print_exc(file=sys.stderr)
+
+
+def mkdirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
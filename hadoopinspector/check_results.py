@@ -17,16 +17,104 @@ import sqlite3
 import hadoopinspector.core as core
 
 
+CHECK_RESULTS_COLUMNS = ['instance_name', 'database_name', 'table_name', 'check_name',
+                         'check_type', 'check_policy_type', 'check_mode', 'check_unit',
+                         'check_status', 'run_id', 'run_start_timestamp', 'run_stop_timestamp',
+                         'data_start_timestamp', 'data_stop_timestamp', 'check_rc', 'check_scope',
+                         'check_severity_score', 'check_violation_cnt', 'env_vars', 'check_hash',
+                         'check_cpu_user_secs', 'check_cpu_sys_secs', 'check_max_rss_kb',
+                         'check_in_blocks', 'check_out_blocks', 'check_wall_secs']
+
+#--- columns added since the original schema, in the order they were added:
+ADDED_COLUMNS = [('check_hash',          'TEXT'),
+                 ('check_cpu_user_secs', 'REAL'),
+                 ('check_cpu_sys_secs',  'REAL'),
+                 ('check_max_rss_kb',    'INT'),
+                 ('check_in_blocks',     'INT'),
+                 ('check_out_blocks',    'INT'),
+                 ('check_wall_secs',     'REAL')]
+
+#--- indexes for the dashboard's windowed reads - each ends with run_start_timestamp so
+#--- that a from/to window is a range within the rows of an instance, database or check:
+CHECK_RESULTS_INDEXES = [('check_results_check_ix',    ['instance_name', 'database_name', 'table_name',
+                                                         'check_name', 'run_start_timestamp']),
+                         ('check_results_database_ix', ['instance_name', 'database_name',
+                                                         'run_start_timestamp']),
+                         ('check_results_start_ix',    ['run_start_timestamp'])]
+
+#--- the name index - one row per check ever written, for the dashboard's search:
+CHECK_NAMES_SQL = """CREATE TABLE check_names  (
+                        instance_name       TEXT,
+                        database_name       TEXT,
+                        table_name          TEXT,
+                        check_name          TEXT,
+                        check_type          TEXT,
+                        check_description   TEXT,
+                        UNIQUE (instance_name, database_name, table_name, check_name) ) """
+#--- docid is the check_names rowid, prefix indexes speed up as-you-type searches:
+CHECK_NAMES_FTS_SQL = """CREATE VIRTUAL TABLE check_names_fts USING fts4 (
+                            instance_name, database_name, table_name, check_name, check_description,
+                            prefix="2,3,4" ) """
+
+#--- the latest result of every check - upserted as results are written, so that status
+#--- views read one row per check rather than searching every check's history:
+LATEST_RESULTS_COLUMNS = ['instance_name', 'database_name', 'table_name', 'check_name',
+                          'check_type', 'check_status', 'run_start_timestamp', 'run_stop_timestamp',
+                          'check_rc', 'check_severity_score', 'check_violation_cnt']
+LATEST_RESULTS_SQL = """CREATE TABLE latest_results  (
+                           instance_name        TEXT,
+                           database_name        TEXT,
+                           table_name           TEXT,
+                           check_name           TEXT,
+                           check_type           TEXT,
+                           check_status         TEXT,
+                           run_start_timestamp  TIMESTAMP,
+                           run_stop_timestamp   TIMESTAMP,
+                           check_rc             INT,
+                           check_severity_score INT,
+                           check_violation_cnt  INT,
+                           PRIMARY KEY (instance_name, database_name, table_name, check_name) ) """
+#--- rollups of the latest results - setup, teardown & inactive checks are left out, and
+#--- violation counts of -1 or NULL - unknown, ex: unparseable check output - count as 0:
+LATEST_ROLLUP_SQL = """CREATE VIEW {name} AS
+                          SELECT {cols},
+                                 COUNT(*)                  AS check_cnt,
+                                 SUM(CASE WHEN check_rc != 0 OR check_violation_cnt > 0 THEN 1 ELSE 0 END)
+                                                           AS failing_check_cnt,
+                                 SUM(CASE WHEN check_violation_cnt > 0 THEN check_violation_cnt ELSE 0 END)
+                                                           AS violation_cnt,
+                                 MAX(check_rc)             AS max_rc,
+                                 MAX(check_severity_score) AS max_severity_score,
+                                 MIN(run_start_timestamp)  AS run_start_timestamp,
+                                 MAX(run_stop_timestamp)   AS run_stop_timestamp
+                          FROM latest_results
+                          WHERE check_type NOT IN ('setup', 'teardown')
+                            AND check_status IS NOT 'inactive'
+                          GROUP BY {cols} """
+LATEST_ROLLUPS = [('latest_table_status',    ['instance_name', 'database_name', 'table_name']),
+                  ('latest_database_status', ['instance_name', 'database_name'])]
+
+#--- resource usage fields - from check_runner.CheckUsage:
+USAGE_FIELDS = ['cpu_user_secs', 'cpu_sys_secs', 'max_rss_kb', 'in_blocks', 'out_blocks', 'wall_secs']
+
+
 class CheckResults(object):
 
-    def __init__(self, inst, db, db_fqfn=None):
+    def __init__(self, inst, db, db_fqfn=None, report_writer=None, keep_connection=False):
+        """
+        :param keep_connection - bool - if True a single sqlite connection is
+                                 held open until close(), for long-running
+                                 processes that reuse this object via reset().
+        """
         self.inst    = inst
         self.db      = db
         self.db_fqfn = db_fqfn
         self.start_dt = datetime.datetime.utcnow()
         self.results = {}
         self.setup_results = {}
+        self.report_writer = report_writer
         self.logger = logging.getLogger('RunnerLogger')
+        self.conn = None
 
         #--- create database & table if necessary:
         if not isfile(self.db_fqfn):
@@ -36,6 +124,34 @@ class CheckResults(object):
         if not istable(conn, 'check_results'):
             self.logger.info("warning: no check_results table found - will create database")
             create_sqlite_db(self.db_fqfn)
+        else:
+            upgrade_sqlite_db(conn)
+        if keep_connection:
+            self.conn = conn
+        else:
+            conn.close()
+
+    def reset(self, report_writer=None):
+        """ Clears all results so that the object can be reused for another run.
+        """
+        self.start_dt = datetime.datetime.utcnow()
+        self.results = {}
+        self.setup_results = {}
+        self.report_writer = report_writer
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _connect(self):
+        if self.conn is not None:
+            return self.conn
+        return sqlite3.connect(self.db_fqfn)
+
+    def _disconnect(self, conn):
+        if conn is not self.conn:
+            conn.close()
 
     def _abort(self, msg):
         if self.logger:
@@ -56,7 +172,10 @@ class CheckResults(object):
             run_stop_timestamp=None,
             data_start_timestamp=None,
             data_stop_timestamp=None,
-            setup_vars=None):
+            setup_vars=None,
+            check_hash=None,
+            usage=None,
+            check_description=None):
         assert core.isnumeric(rc)
         assert violations is None or core.isnumeric(violations), "Invalid violations: %s" % violations
         assert check_type   in ('rule', 'profile', 'setup', 'teardown')
@@ -88,6 +207,48 @@ class CheckResults(object):
         self.results[table][check]['data_start_timestamp'] = data_start_timestamp
         self.results[table][check]['data_stop_timestamp']  = data_stop_timestamp
         self.results[table][check]['setup_vars']           = '' if setup_vars is None else json.dumps(setup_vars)
+        self.results[table][check]['check_hash']           = check_hash
+        self.results[table][check]['check_description']    = check_description
+        for field in USAGE_FIELDS:
+            self.results[table][check][field] = None if usage is None else getattr(usage, field)
+
+        if self.report_writer:
+            self.report_writer.write(self.get_report_rec(table, check))
+
+    def get_report_rec(self, table, check):
+        rec = dict(self.results[table][check])
+        rec['instance'] = self.inst
+        rec['database'] = self.db
+        rec['table']    = table
+        rec['check']    = check
+        return rec
+
+    def get_usage_summary(self, top_cnt=5):
+        """ Summarizes the resource usage of every check that ran.
+
+        Returns: dict of check_cnt, totals of cpu & wall secs and block i/o,
+                 the max of max_rss_kb, and top_cpu - a list of the top_cnt
+                 (table, check, cpu secs) tuples by cpu used
+        """
+        summary = {'check_cnt':          0,
+                   'cpu_user_secs':      0.0,
+                   'cpu_sys_secs':       0.0,
+                   'wall_secs':          0.0,
+                   'in_blocks':          0,
+                   'out_blocks':         0,
+                   'max_rss_kb':         0}
+        check_cpu = []
+        for table in self.results:
+            for check, check_fields in self.results[table].items():
+                if check_fields['wall_secs'] is None:
+                    continue
+                summary['check_cnt'] += 1
+                for field in ('cpu_user_secs', 'cpu_sys_secs', 'wall_secs', 'in_blocks', 'out_blocks'):
+                    summary[field] += check_fields[field]
+                summary['max_rss_kb'] = max(summary['max_rss_kb'], check_fields['max_rss_kb'])
+                check_cpu.append((table, check, check_fields['cpu_user_secs'] + check_fields['cpu_sys_secs']))
+        summary['top_cpu'] = sorted(check_cpu, key=lambda x: x[2], reverse=True)[:top_cnt]
+        return summary
 
     def get_max_rc(self):
         max_rc = 0
@@ -148,7 +309,7 @@ class CheckResults(object):
         #todo: add column to hold partitioning keys for incremental testing
         #todo: add "logical_delete" column for the deletes
         """
-        conn = sqlite3.connect(self.db_fqfn)
+        conn = self._connect()
         stop_dt = datetime.datetime.utcnow()
         run_id  = 0
         cur  = conn.cursor()
@@ -172,14 +333,24 @@ class CheckResults(object):
                         check_fields['check_scope'],
                         check_fields['check_severity_score'],
                         check_fields['violation_cnt'],
-                        check_fields['setup_vars'] ) )
+                        check_fields['setup_vars'],
+                        check_fields['check_hash'] )
+                        + tuple(check_fields[field] for field in USAGE_FIELDS) )
 
         if check_recs:
-            check_sql  = """INSERT INTO check_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)  """
+            check_sql  = """INSERT INTO check_results (%s)
+                            VALUES (%s)  """ % (', '.join(CHECK_RESULTS_COLUMNS),
+                                                ', '.join(['?'] * len(CHECK_RESULTS_COLUMNS)))
             cur.executemany(check_sql, check_recs)
+            update_latest_results(cur, check_recs)
+            update_name_index(cur, [(self.inst, self.db, table, check,
+                                     self.results[table][check]['check_type'],
+                                     self.results[table][check]['check_description'])
+                                    for table in self.results for check in self.results[table]])
             conn.commit()
 
-        conn.close()
+        cur.close()
+        self._disconnect(conn)
 
     def get_prior_setup_vars(self, table, setup_check):
         sql  = ("SELECT env_vars "
@@ -197,7 +368,7 @@ class CheckResults(object):
                 "  AND check_name    = '{cn}' "
                 " LIMIT 1"
                 ";" )
-        conn = sqlite3.connect(self.db_fqfn)
+        conn = self._connect()
         c    = conn.cursor()
         try:
             c.execute(sql.format(inst=self.inst, db=self.db, tb=table, cn=setup_check))
@@ -207,7 +378,8 @@ class CheckResults(object):
             self._abort("get_prior_setup_vars failed!")
         results = c.fetchall()
         conn.commit()
-        conn.close()
+        c.close()
+        self._disconnect(conn)
         if results == []:
             return None
         else:
@@ -236,28 +408,189 @@ def create_sqlite_db(db_fqfn):
             check_scope         INT,   \
             check_severity_score INT,  \
             check_violation_cnt INT,   \
-            env_vars              ) """
+            env_vars,                  \
+            check_hash          TEXT,  \
+            check_cpu_user_secs REAL,  \
+            check_cpu_sys_secs  REAL,  \
+            check_max_rss_kb    INT,   \
+            check_in_blocks     INT,   \
+            check_out_blocks    INT,   \
+            check_wall_secs     REAL ) """
 
     conn = sqlite3.connect(db_fqfn)
     c    = conn.cursor()
     c.execute(check_results_cmd)
     conn.commit()
+    create_check_results_indexes(conn)
+    create_name_index(conn)
+    create_latest_results(conn)
     conn.close()
 
 
 
 
+def upgrade_sqlite_db(conn):
+    """ Adds any columns missing from an older check_results table.
+    """
+    cur = conn.cursor()
+    cur.execute("PRAGMA table_info(check_results)")
+    existing_cols = [row[1] for row in cur.fetchall()]
+    for col_name, col_type in ADDED_COLUMNS:
+        if col_name not in existing_cols:
+            cur.execute("ALTER TABLE check_results ADD COLUMN %s %s" % (col_name, col_type))
+    conn.commit()
+    create_check_results_indexes(conn)
+    if not istable(conn, 'check_names'):
+        create_name_index(conn)
+        cur.execute("""SELECT DISTINCT instance_name, database_name, table_name, check_name, check_type
+                       FROM check_results""")
+        update_name_index(cur, [row + (None,) for row in cur.fetchall()])
+        conn.commit()
+    if not istable(conn, 'latest_results'):
+        create_latest_results(conn)
+        #--- sqlite takes the bare columns from the row with the max run_start_timestamp:
+        cur.execute("""INSERT INTO latest_results (%s)
+                       SELECT %s
+                       FROM check_results
+                       GROUP BY instance_name, database_name, table_name, check_name"""
+                    % (', '.join(LATEST_RESULTS_COLUMNS),
+                       ', '.join('MAX(run_start_timestamp)' if col == 'run_start_timestamp' else col
+                                 for col in LATEST_RESULTS_COLUMNS)))
+        conn.commit()
+    else:
+        #--- views from an older runner may lack later fixes to their rollups:
+        create_latest_rollups(conn, only_changed=True)
+    cur.close()
+
+
+
+def create_check_results_indexes(conn):
+    """ Creates any of CHECK_RESULTS_INDEXES that are missing.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='check_results'")
+    existing_indexes = [row[0] for row in cur.fetchall()]
+    for index_name, index_cols in CHECK_RESULTS_INDEXES:
+        if index_name not in existing_indexes:
+            logging.getLogger('RunnerLogger').info("creating check_results index: %s", index_name)
+            cur.execute("CREATE INDEX %s ON check_results (%s)" % (index_name, ', '.join(index_cols)))
+    conn.commit()
+    cur.close()
+
+
+
+def create_name_index(conn):
+    """ Creates the check_names table and its full-text index.
+
+    The full-text index is skipped, with a warning, if sqlite was built
+    without fts4 - the dashboard then searches check_names with LIKE.
+    """
+    cur = conn.cursor()
+    cur.execute(CHECK_NAMES_SQL)
+    try:
+        cur.execute(CHECK_NAMES_FTS_SQL)
+    except sqlite3.OperationalError as e:
+        logging.getLogger('RunnerLogger').warning("no full-text name index created: %s", e)
+    conn.commit()
+    cur.close()
+
+
+
+def update_name_index(cur, names):
+    """ Adds new names to the name index, and updates those whose type or
+        description have changed.  Doesn't commit.
+
+    :param names - list of (instance, database, table, check, check_type, check_description)
+    """
+    has_fts = istable(cur.connection, 'check_names_fts')
+    for inst, db, table, check, check_type, check_description in names:
+        cur.execute("""SELECT rowid, check_type, check_description
+                       FROM check_names
+                       WHERE instance_name=? AND database_name=? AND table_name=? AND check_name=?""",
+                    (inst, db, table, check))
+        row = cur.fetchone()
+        if row is None:
+            cur.execute("""INSERT INTO check_names (instance_name, database_name, table_name, check_name,
+                                                    check_type, check_description)
+                           VALUES (?, ?, ?, ?, ?, ?)""",
+                        (inst, db, table, check, check_type, check_description))
+            rowid = cur.lastrowid
+        elif (row[1], row[2]) != (check_type, check_description):
+            rowid = row[0]
+            cur.execute("UPDATE check_names SET check_type=?, check_description=? WHERE rowid=?",
+                        (check_type, check_description, rowid))
+            if has_fts:
+                cur.execute("DELETE FROM check_names_fts WHERE docid=?", (rowid,))
+        else:
+            continue
+        if has_fts:
+            cur.execute("""INSERT INTO check_names_fts (docid, instance_name, database_name, table_name,
+                                                        check_name, check_description)
+                           VALUES (?, ?, ?, ?, ?, ?)""",
+                        (rowid, inst, db, table, check, check_description))
+
+
+
+def create_latest_results(conn):
+    """ Creates the latest_results table and its rollup views.
+    """
+    cur = conn.cursor()
+    cur.execute(LATEST_RESULTS_SQL)
+    conn.commit()
+    cur.close()
+    create_latest_rollups(conn)
+
+
+
+def create_latest_rollups(conn, only_changed=False):
+    """ Creates - or recreates - the rollup views of latest_results.
+
+    With only_changed, views whose sql already matches LATEST_ROLLUP_SQL are
+    left alone - so that opening a current db doesn't write to it.
+    """
+    cur = conn.cursor()
+    changed = False
+    for view_name, group_cols in LATEST_ROLLUPS:
+        view_sql = LATEST_ROLLUP_SQL.format(name=view_name, cols=', '.join(group_cols))
+        if only_changed:
+            cur.execute("SELECT sql FROM sqlite_master WHERE type = 'view' AND name = ?", (view_name,))
+            row = cur.fetchone()
+            if row and row[0].strip() == view_sql.strip():
+                continue
+        cur.execute("DROP VIEW IF EXISTS %s" % view_name)
+        cur.execute(view_sql)
+        changed = True
+    if changed:
+        conn.commit()
+    cur.close()
+
+
+
+def update_latest_results(cur, check_recs):
+    """ Upserts check_recs into latest_results - other than over a later
+        result of the same check, ex: when an older run is written late.
+        Doesn't commit.
+
+    :param check_recs - list of check_results rows, in CHECK_RESULTS_COLUMNS order
+    """
+    col_nums = [CHECK_RESULTS_COLUMNS.index(col) for col in LATEST_RESULTS_COLUMNS]
+    start_col_num = CHECK_RESULTS_COLUMNS.index('run_start_timestamp')
+    cur.executemany("""INSERT OR REPLACE INTO latest_results (%s)
+                       SELECT %s
+                       WHERE NOT EXISTS (SELECT 1 FROM latest_results
+                                         WHERE instance_name=? AND database_name=? AND table_name=?
+                                           AND check_name=? AND run_start_timestamp > ?)"""
+                    % (', '.join(LATEST_RESULTS_COLUMNS), ', '.join(['?'] * len(LATEST_RESULTS_COLUMNS))),
+                    [tuple(rec[col_num] for col_num in col_nums) + tuple(rec[:4]) + (rec[start_col_num],)
+                     for rec in check_recs])
+
+
+
 def istable(dbcon, tablename):
     cur = dbcon.cursor()
     cur.execute("select name from sqlite_master where type='table'")
     results = cur.fetchall()
     cur.close()
-    if not results:
-        return False
-    else:
-        if tablename in results[0]:
-            return True
-        else:
-            return False
+    return tablename in [row[0] for row in results]
 
 
@@ -6,24 +6,44 @@ in the source code root directory for the full language or refer to it here:
 Copyright 2015, 2016 Will Farmer and Ken Farmer
 """
 
-import os, sys, subprocess, datetime
+import os, sys, subprocess, datetime, time
 import json, logging
+import collections
+import logging.handlers
 from os.path import isdir, isfile, exists, dirname, basename
 from os.path import join as pjoin
 import errno
 from pprint import pprint as pp
 
 import hadoopinspector.core as core
+import hadoopinspector.check_logging as check_logging
+import hadoopinspector.metrics as run_metrics
+import hadoopinspector.tracing as tracing
+import hadoopinspector.events as run_events
+
+
+CheckUsage = collections.namedtuple('CheckUsage', ['cpu_user_secs', 'cpu_sys_secs', 'max_rss_kb',
+                                                   'in_blocks', 'out_blocks', 'wall_secs'])
 
 
 class CheckRunner(object):
 
     def __init__(self, registry, check_repo, check_results, instance, database,
-                 run_log_dir, log_level='debug', user_table_vars=None):
+                 run_log_dir, log_level='debug', user_table_vars=None, run_log_format='dirs',
+                 metrics=None, tracer=None, events=None):
         """
+        :param run_log_format - str, one of check_logging.RUN_LOG_FORMATS -
+                                'dirs' writes a rotating log per check,
+                                'jsonl' writes one gzipped json-lines log per run
+        :param metrics        - metrics.RunMetrics, optional - times the run's phases
+        :param tracer         - tracing.TraceWriter, optional - records spans for
+                                the run, tables, checks & results write
+        :param events         - events.EventWriter, optional - publishes the run's
+                                progress as it happens
         """
         assert isdir(run_log_dir)
         assert log_level in ('debug', 'info', 'warning', 'error', 'critical')
+        assert run_log_format in check_logging.RUN_LOG_FORMATS
         self.repo     = check_repo
         self.registry = registry
         self.results  = check_results
@@ -39,7 +59,11 @@ class CheckRunner(object):
         self.prior_table_vars = []
         self.run_log_dir = run_log_dir
         self.log_level = log_level
-        self.check_file_handler = None
+        self.metrics = metrics or run_metrics.RunMetrics()
+        self.tracer  = tracer or tracing.NullTracer()
+        self.events  = events or run_events.NullEventWriter()
+        self.check_log_writer = check_logging.get_check_log_writer(run_log_format, run_log_dir,
+                                                                   instance, database)
         self.check_logger = logging.getLogger('CheckLogger')
         self.run_logger = logging.getLogger('RunnerLogger')
 
@@ -65,39 +89,18 @@ class CheckRunner(object):
 
 
     def _get_logger(self, table, check):
+        """ Points self.check_logger at the table & check's log - which is
+            written asynchronously by the check log writer.
+        """
+        self.check_logger = self.check_log_writer.get_logger(table, check, self.log_level)
 
-        def mkdirs(path):
-            try:
-                os.makedirs(path)
-            except OSError as exc:
-                if exc.errno != errno.EEXIST or not os.path.isdir(path):
-                    raise
-
-        assert isdir(self.run_log_dir)
-        check_log_dir = pjoin(self.run_log_dir, self.instance, self.database, table, check)
-        mkdirs(check_log_dir)
-        log_filename = pjoin(check_log_dir, 'check.log')
-
-        #--- close any prior handler:
-        if self.check_logger:
-            self.check_logger.removeHandler(self.check_file_handler)
-        if self.check_logger:
-            if self.check_logger.handlers:
-                self.check_logger.handlers[0].close()
-
-        #--- create logger
-        self.check_logger = logging.getLogger('CheckLogger')
-        self.check_logger.setLevel(self.log_level.upper())
-
-        #--- add formatting:
-        log_format = '%(asctime)s : %(name)-12s : %(levelname)-8s : %(message)s'
-        date_format = '%Y-%m-%d %H.%M.%S'
-        check_formatter = logging.Formatter(log_format, date_format)
+    def flush_logs(self):
+        self.check_log_writer.flush()
 
-        #--- create rotating file handler
-        self.check_file_handler = logging.handlers.RotatingFileHandler(log_filename, maxBytes=1000000, backupCount=20)
-        self.check_file_handler.setFormatter(check_formatter)
-        self.check_logger.addHandler(self.check_file_handler)
+    def close(self):
+        """ Writes any queued check log records and stops the log writer.
+        """
+        self.check_log_writer.close()
 
 
     def add_db_var(self, key, value):
@@ -174,37 +177,84 @@ class CheckRunner(object):
     def run_checks_for_tables(self):
         """ Runs checks on all tables, or just one if a non-None table value is provided.
         """
-        for table in self.registry.registry:
-
-            self.add_table_var('hapinsp_table', table)
-            table_status = 'active'
-            self.run_logger.debug('table: %s', table)
-
-            #------  setup checks must happen first.   -----------------------------
-            for setup_check in sorted([ x for x in self.registry.registry[table]
-                                       if self.registry.registry[table][x]['check_type'] == 'setup' ]):
-                reg_check = self.registry.registry[table][setup_check]
-                if reg_check['check_status'] == 'active':
+        start_time = time.time()
+        tables = self.registry.get_tables()
+        self.events.emit('run_started', instance=self.instance, database=self.database,
+                         table_cnt=len(tables))
+        with self.tracer.span('run', 'run', instance=self.instance, database=self.database):
+            for table_num, table in enumerate(tables):
+                with self.tracer.span(table, 'table', table=table):
+                    self._run_checks_for_table(table, table_num)
+
+            with self.tracer.span('results_write', 'results'):
+                with self.metrics.timer('results_write'):
+                    self.results.write_to_sqlite()
+        self.events.emit('run_finished', instance=self.instance, database=self.database,
+                         table_cnt=len(tables),
+                         check_cnt=sum(len(checks) for checks in self.results.results.values()),
+                         max_rc=self.results.get_max_rc(),
+                         wall_secs=round(time.time() - start_time, 3))
+        self.log_usage_summary()
+        self.flush_logs()
+
+    def _run_checks_for_table(self, table, table_num=0):
+        #--- templates are expanded here, one table at a time:
+        table_reg = self.registry.get_table_checks(table)
+        self.events.emit('table_started', table=table, table_num=table_num, check_cnt=len(table_reg))
+        self.add_table_var('hapinsp_table', table)
+        table_status = 'active'
+        self.run_logger.debug('table: %s', table)
+
+        #------  setup checks must happen first.   -----------------------------
+        for setup_check in sorted([ x for x in table_reg
+                                   if table_reg[x]['check_type'] == 'setup' ]):
+            reg_check = table_reg[setup_check]
+            if reg_check['check_status'] == 'active':
+                self.events.emit('check_started', table=table, check=setup_check, check_type='setup')
+                with self.tracer.span(setup_check, 'setup_check', table=table, check=setup_check) as span_args:
                     self._run_setup_check(table, setup_check, reg_check)
+                    span_args['rc'] = self.results.results[table][setup_check]['rc']
+                self.emit_check_finished(table, setup_check)
 
-            #------  user table vars get set next - and may override check or other vars  ----------
-            for key, val in self.user_table_vars.items():
-                self.add_table_var(key, val)
+        #------  user table vars get set next - and may override check or other vars  ----------
+        for key, val in self.user_table_vars.items():
+            self.add_table_var(key, val)
 
-            # bypass checks if setup marked this table inactive:
-            if table_status == 'inactive':
-                continue
+        # bypass checks if setup marked this table inactive:
+        if table_status == 'inactive':
+            return
 
-            #------  regular checks (rules or profiles) can now run  -----------------------------
-            for check in sorted([ x for x in self.registry.registry[table]
-                                  if self.registry.registry[table][x]['check_type']
-                                     not in ('setup', 'teardown') ]):
-                reg_check = self.registry.registry[table][check]
+        #------  regular checks (rules or profiles) can now run  -----------------------------
+        for check in sorted([ x for x in table_reg
+                              if table_reg[x]['check_type']
+                                 not in ('setup', 'teardown') ]):
+            reg_check = table_reg[check]
+            self.events.emit('check_started', table=table, check=check, check_type=reg_check['check_type'])
+            with self.tracer.span(check, 'check', table=table, check=check) as span_args:
                 self._run_check(table, check, reg_check)
-
-            self.drop_table_vars()
-
-        self.results.write_to_sqlite()
+                span_args['rc'] = self.results.results[table][check]['rc']
+            self.emit_check_finished(table, check)
+
+        self.drop_table_vars()
+
+    def emit_check_finished(self, table, check):
+        result = self.results.results[table][check]
+        violations = result['violation_cnt']
+        self.events.emit('check_finished', table=table, check=check, check_type=result['check_type'],
+                         check_status=result['check_status'], rc=result['rc'],
+                         violations=None if violations is None else int(violations),
+                         wall_secs=result['wall_secs'])
+
+    def log_usage_summary(self):
+        summary = self.results.get_usage_summary()
+        self.run_logger.info('run usage: checks: %d, cpu user secs: %.2f, cpu sys secs: %.2f, '
+                             'wall secs: %.2f, max rss kb: %d, in blocks: %d, out blocks: %d',
+                             summary['check_cnt'], summary['cpu_user_secs'], summary['cpu_sys_secs'],
+                             summary['wall_secs'], summary['max_rss_kb'], summary['in_blocks'],
+                             summary['out_blocks'])
+        for table, check, cpu_secs in summary['top_cpu']:
+            self.run_logger.info('run usage: top cpu - table: %s, check: %s, cpu secs: %.2f',
+                                 table, check, cpu_secs)
 
 
     def _run_setup_check(self, table, setup_check, reg_check):
@@ -217,7 +267,8 @@ class CheckRunner(object):
                              check_status=reg_check['check_status'],
                              check_type='setup', setup_vars='',
                              run_start_timestamp=start_iso8601ext, run_stop_timestamp=stop_iso8601ext,
-                             data_start_timestamp=None, data_stop_timestamp=None)
+                             data_start_timestamp=None, data_stop_timestamp=None,
+                             check_description=reg_check.get('check_description'))
             return
 
         # configure logger:
@@ -225,7 +276,8 @@ class CheckRunner(object):
         self.check_logger.info('check started')
 
         # write prior setup to env:
-        prior_setup_vars_string = self.results.get_prior_setup_vars(table, setup_check)
+        with self.metrics.timer('get_prior_setup_vars'):
+            prior_setup_vars_string = self.results.get_prior_setup_vars(table, setup_check)
         if prior_setup_vars_string:
             prior_setup_vars = SetupVars(prior_setup_vars_string, self.check_logger)
             for key, val in prior_setup_vars.tablecustom_vars.items():
@@ -246,11 +298,12 @@ class CheckRunner(object):
         except KeyError:
             self.both_logger('critical', "registry check not found: %s" % reg_check['check_name'])
             sys.exit(1)
-        raw_output, check_rc = self._run_check_file(check_fn)
+        raw_output, check_rc, usage = self._run_check_file(check_fn)
 
         # parse & record the output:
         try:
-            setup_vars = SetupVars(raw_output, self.check_logger)
+            with self.metrics.timer('check_output_parse'):
+                setup_vars = SetupVars(raw_output, self.check_logger)
         except ValueError as e:
             setup_vars   = SetupVars({}, self.check_logger)
             rc           = 201
@@ -277,7 +330,10 @@ class CheckRunner(object):
                           check_type='setup', setup_vars=saved_vars,
                           run_start_timestamp=start_iso8601ext, run_stop_timestamp=stop_iso8601ext,
                           data_start_timestamp=setup_vars.data_start_ts,
-                          data_stop_timestamp=setup_vars.data_stop_ts)
+                          data_stop_timestamp=setup_vars.data_stop_ts,
+                          check_hash=self.repo.get_hash(reg_check['check_name']),
+                          usage=usage,
+                          check_description=reg_check.get('check_description'))
         self.drop_prior_table_vars()
 
 
@@ -288,7 +344,8 @@ class CheckRunner(object):
             stop_iso8601ext = datetime.datetime.utcnow()
             self.results.add(table, check, check_status='inactive',
                              run_start_timestamp=start_iso8601ext, run_stop_timestamp=stop_iso8601ext,
-                             data_start_timestamp=None, data_stop_timestamp=None)
+                             data_start_timestamp=None, data_stop_timestamp=None,
+                             check_description=reg_check.get('check_description'))
             return
 
         # add envvars specific to this check from the registry
@@ -306,10 +363,11 @@ class CheckRunner(object):
         except KeyError:
             self.both_logger('Error', 'registry check not found: %s' % reg_check['check_name'])
             sys.exit(1)
-        raw_output, check_rc        = self._run_check_file(check_fn)
+        raw_output, check_rc, usage = self._run_check_file(check_fn)
 
         try:
-            check_vars   = CheckVars(raw_output, self.check_logger)
+            with self.metrics.timer('check_output_parse'):
+                check_vars   = CheckVars(raw_output, self.check_logger)
             actual_mode  = check_vars.mode
         except ValueError as e:
             count        = -1
@@ -335,21 +393,66 @@ class CheckRunner(object):
                          run_start_timestamp=start_iso8601ext,
                          run_stop_timestamp=stop_iso8601ext,
                          data_start_timestamp=actual_data_start_iso8601,
-                         data_stop_timestamp=actual_data_stop_iso8601)
+                         data_stop_timestamp=actual_data_stop_iso8601,
+                         check_hash=self.repo.get_hash(reg_check['check_name']),
+                         usage=usage,
+                         check_description=reg_check.get('check_description'))
 
         # remove any check-specific envvars:
         self.drop_check_vars()
 
 
     def _run_check_file(self, check_filename):
+        """ Runs the check and collects its resource usage from the OS.
+
+        The process is reaped with os.wait4 so that its own rusage - rather
+        than that of every child of the runner - is collected.  Output is
+        read before waiting so that large outputs cannot fill the pipe and
+        block the check.
+
+        Returns: (output str, rc int, CheckUsage or None if unavailable)
+        """
         assert isdir(self.repo.check_dir)
         assert isfile(pjoin(self.repo.check_dir, check_filename))
         check_fqfn = pjoin(self.repo.check_dir, check_filename)
+        start_time = time.time()
         process = subprocess.Popen([check_fqfn], stdout=subprocess.PIPE)
-        process.wait()
+        self.metrics.add_time('check_spawn', time.time() - start_time)
         output = process.stdout.read()
-        rc     = process.returncode
-        return output.decode(), rc
+        process.stdout.close()
+        if not hasattr(os, 'wait4'):
+            rc = process.wait()
+            self.metrics.add_time('check_exec', time.time() - start_time)
+            return output.decode(), rc, None
+
+        _, status, rusage = wait4(process.pid)
+        wall_secs = time.time() - start_time
+        self.metrics.add_time('check_exec', wall_secs)
+        if os.WIFSIGNALED(status):
+            rc = -os.WTERMSIG(status)
+        else:
+            rc = os.WEXITSTATUS(status)
+        process.returncode = rc
+        max_rss_kb = rusage.ru_maxrss
+        if sys.platform == 'darwin':
+            max_rss_kb = max_rss_kb // 1024    # reported in bytes rather than kb
+        usage = CheckUsage(cpu_user_secs=rusage.ru_utime,
+                           cpu_sys_secs=rusage.ru_stime,
+                           max_rss_kb=max_rss_kb,
+                           in_blocks=rusage.ru_inblock,
+                           out_blocks=rusage.ru_oublock,
+                           wall_secs=wall_secs)
+        return output.decode(), rc, usage
+
+
+
+def wait4(pid):
+    while True:
+        try:
+            return os.wait4(pid, 0)
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
 
 
 
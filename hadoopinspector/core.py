@@ -8,6 +8,7 @@ Copyright 2015, 2016 Will Farmer and Ken Farmer
 
 import os, sys, time, datetime, subprocess
 import json, copy, logging
+import hashlib
 from os.path import isdir, isfile, exists, dirname, basename
 from os.path import join as pjoin
 import errno
@@ -19,14 +20,138 @@ import sqlite3
 class CheckRepo(object):
     """ Maintains information about actual checks.
 
+    Indexes every file in check_dir up front with:
+        - fqfn
+        - hash        - sha1 of the file contents, recorded with each result
+        - executable  - bool
+        - interpreter - the command named by the shebang line, or None
+        - readable    - bool - False if the file's contents couldn't be read
+    so that preflight() can find missing or broken checks before any run.
+    refresh() rescans the directory, only re-hashing files whose size or
+    mtime changed, so a long-running process can keep the index current.
     """
     def __init__(self, check_dir):
         self.check_dir = check_dir
         self.repo = {}
         self.logger = logging.getLogger('RunnerLogger')
+        self.refresh()
+
+    def refresh(self):
+        """ Rebuilds the index from check_dir.
+
+        Returns: bool - True if any check was added, removed or changed
+        """
+        new_repo = {}
         for check_fn in os.listdir(self.check_dir):
-            self.repo[check_fn] = {}
-            self.repo[check_fn]['fqfn'] = pjoin(self.check_dir, check_fn)
+            check_fqfn = pjoin(self.check_dir, check_fn)
+            try:
+                check_stat = os.stat(check_fqfn)
+            except OSError as e:
+                #--- ex: a dangling symlink, or a file removed since listdir:
+                self.logger.warning("check file unreadable - left out of check repo: %s %s", check_fqfn, e)
+                continue
+            stat_key = (check_stat.st_mtime, check_stat.st_size, check_stat.st_mode)
+            prior = self.repo.get(check_fn)
+            if prior and prior['stat_key'] == stat_key and prior['readable']:
+                new_repo[check_fn] = prior
+                continue
+            new_repo[check_fn] = {}
+            new_repo[check_fn]['fqfn']     = check_fqfn
+            new_repo[check_fn]['stat_key'] = stat_key
+            new_repo[check_fn]['readable'] = True
+            if isfile(check_fqfn):
+                try:
+                    new_repo[check_fn]['hash']        = get_file_hash(check_fqfn)
+                    new_repo[check_fn]['interpreter'] = get_interpreter(check_fqfn)
+                except (IOError, OSError) as e:
+                    #--- ex: a check owned by another user that's executable but not readable:
+                    self.logger.warning("check file unreadable: %s %s", check_fqfn, e)
+                    new_repo[check_fn]['hash']        = None
+                    new_repo[check_fn]['interpreter'] = None
+                    new_repo[check_fn]['readable']    = False
+                new_repo[check_fn]['executable']  = os.access(check_fqfn, os.X_OK)
+            else:
+                new_repo[check_fn]['hash']        = None
+                new_repo[check_fn]['executable']  = False
+                new_repo[check_fn]['interpreter'] = None
+        changed = (set(new_repo) != set(self.repo)
+                   or any(new_repo[x] is not self.repo[x] for x in new_repo))
+        self.repo = new_repo
+        return changed
+
+    def get_hash(self, check_name):
+        try:
+            return self.repo[check_name]['hash']
+        except KeyError:
+            return None
+
+    def preflight(self, registry):
+        """ Verifies every active check referenced by the registry against
+            the index.
+
+        :param registry - registry.Registry
+        Returns: list of error message strings - empty if all is well
+        """
+        errors = []
+        check_refs = {}
+        for table in registry.get_tables():
+            for check, reg_check in registry.get_table_checks(table).items():
+                if reg_check.get('check_status', 'active') == 'active':
+                    check_refs.setdefault(reg_check['check_name'], (table, check))
+
+        for check_name in sorted(check_refs):
+            table, check = check_refs[check_name]
+            check_info = self.repo.get(check_name)
+            if check_info is None:
+                errors.append("check file not found: %s (table: %s, check: %s)" % (check_name, table, check))
+            elif not check_info['readable']:
+                errors.append("check file is not readable: %s" % check_name)
+            elif check_info['hash'] is None:
+                errors.append("check is not a file: %s" % check_name)
+            elif not check_info['executable']:
+                errors.append("check file is not executable: %s" % check_name)
+            elif check_info['interpreter'] and not find_executable(check_info['interpreter']):
+                errors.append("check interpreter not found: %s for: %s" % (check_info['interpreter'], check_name))
+        return errors
+
+
+
+def get_file_hash(fqfn):
+    file_hash = hashlib.sha1()
+    with open(fqfn, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(65536), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_interpreter(fqfn):
+    """ Returns the command from a file's shebang line - resolving
+        '/usr/bin/env cmd' to 'cmd' - or None if there's no shebang.
+    """
+    with open(fqfn, 'rb') as infile:
+        first_line = infile.readline(1024).decode('utf-8', 'replace')
+    if not first_line.startswith('#!'):
+        return None
+    parts = first_line[2:].split()
+    if not parts:
+        return None
+    if basename(parts[0]) == 'env':
+        args = [x for x in parts[1:] if not x.startswith('-')]
+        return args[0] if args else None
+    return parts[0]
+
+
+def find_executable(cmd):
+    """ Returns the fqfn of cmd if it is an executable path or is found on
+        the PATH, otherwise None.
+    """
+    if os.sep in cmd:
+        return cmd if (isfile(cmd) and os.access(cmd, os.X_OK)) else None
+    for path_dir in os.environ.get('PATH', '').split(os.pathsep):
+        cmd_fqfn = pjoin(path_dir, cmd)
+        if isfile(cmd_fqfn) and os.access(cmd_fqfn, os.X_OK):
+            return cmd_fqfn
+    return None
 
 
 
@@ -0,0 +1,72 @@
+#!/usr/bin/env python2
+"""
+This source code is protected by the BSD license.  See the file "LICENSE"
+in the source code root directory for the full language or refer to it here:
+   http://opensource.org/licenses/BSD-3-Clause
+Copyright 2015, 2016 Will Farmer and Ken Farmer
+"""
+
+import os, sys, time, threading
+import json
+
+EVENT_TYPES = ('run_started', 'table_started', 'check_started', 'check_finished', 'run_finished')
+
+
+
+def get_event_writer(fqfn=None):
+    """ Returns an EventWriter for fqfn - or a NullEventWriter if fqfn is None.
+    """
+    if fqfn is None:
+        return NullEventWriter()
+    return EventWriter(fqfn)
+
+
+
+class EventWriter(object):
+    """ Writes the progress of a run as newline-delimited json events - so
+        that it can be followed while the run is still going, ex: by the
+        dashboard's live run view.
+
+    Any prior file is replaced when the writer is created - rather than
+    truncated, so that a reader following it sees a new inode rather than
+    a file that shrank and regrew under it.  So the file only ever holds
+    the current - or latest - run.  Each event is flushed as it's written,
+    and is a single line - so a reader never sees a partial event other
+    than at the end of the file.  Every event has:
+        - event  - one of EVENT_TYPES
+        - ts     - epoch seconds
+        - run_id - identifies the run
+    """
+
+    def __init__(self, fqfn):
+        self.fqfn    = fqfn
+        self.lock    = threading.Lock()
+        self.run_id  = '%s.%d' % (time.strftime('%Y%m%dT%H%M%S', time.gmtime()), os.getpid())
+        if os.path.exists(fqfn):
+            os.remove(fqfn)
+        self.outfile = open(fqfn, 'w')
+
+    def emit(self, event, **fields):
+        assert event in EVENT_TYPES
+        fields.update(event=event, ts=round(time.time(), 3), run_id=self.run_id)
+        line = json.dumps(fields, sort_keys=True, default=str) + '\n'
+        with self.lock:
+            if not self.outfile.closed:
+                self.outfile.write(line)
+                self.outfile.flush()
+
+    def close(self):
+        with self.lock:
+            self.outfile.close()
+
+
+
+class NullEventWriter(object):
+    """ Used in place of an EventWriter when events are off.
+    """
+
+    def emit(self, event, **fields):
+        pass
+
+    def close(self):
+        pass
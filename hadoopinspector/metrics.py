@@ -0,0 +1,173 @@
+#!/usr/bin/env python2
+"""
+This source code is protected by the BSD license.  See the file "LICENSE"
+in the source code root directory for the full language or refer to it here:
+   http://opensource.org/licenses/BSD-3-Clause
+Copyright 2015, 2016 Will Farmer and Ken Farmer
+"""
+
+import os, sys, time, socket
+import collections, contextlib, tempfile
+import logging
+from os.path import isdir, isfile, exists, dirname, basename
+from os.path import join as pjoin
+
+
+PROMETHEUS_PREFIX = 'hadoopinspector_runner'
+STATSD_PREFIX     = 'hadoopinspector.runner'
+CHECK_OUTCOMES    = ('passed', 'violations', 'failed', 'inactive')
+
+#--- keeps statsd packets within a typical network mtu:
+MAX_STATSD_PACKET_BYTES = 1400
+
+
+
+class RunMetrics(object):
+    """ Collects the runner's own timings & counts for a single run.
+
+    Phases are timed with timer() - and may be timed many times per run,
+    ex: check_spawn once per check - so both total secs and calls are kept.
+    Checks are counted by outcome with count_outcomes().
+    """
+
+    def __init__(self):
+        self.start_time  = time.time()
+        self.phase_secs  = collections.OrderedDict()
+        self.phase_calls = collections.OrderedDict()
+        self.outcomes    = collections.OrderedDict((x, 0) for x in CHECK_OUTCOMES)
+        self.max_rc      = None
+
+    @contextlib.contextmanager
+    def timer(self, phase):
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.time() - start_time)
+
+    def add_time(self, phase, secs):
+        self.phase_secs[phase]  = self.phase_secs.get(phase, 0.0) + secs
+        self.phase_calls[phase] = self.phase_calls.get(phase, 0) + 1
+
+    def count_outcomes(self, check_results):
+        """ Counts the checks in a CheckResults by outcome, and records its max rc.
+        """
+        for table in check_results.results:
+            for check_fields in check_results.results[table].values():
+                self.outcomes[get_check_outcome(check_fields)] += 1
+        self.max_rc = check_results.get_max_rc()
+
+    def get_run_secs(self):
+        return time.time() - self.start_time
+
+
+
+def get_check_outcome(check_fields):
+    """ Returns one of CHECK_OUTCOMES for a single check's results.
+    """
+    if check_fields['check_status'] == 'inactive':
+        return 'inactive'
+    elif check_fields['rc'] != 0:
+        return 'failed'
+    try:
+        violation_cnt = int(check_fields['violation_cnt'] or 0)
+    except (TypeError, ValueError):
+        return 'failed'
+    return 'violations' if violation_cnt > 0 else 'passed'
+
+
+
+def write_prometheus_textfile(metrics, fqfn, labels=None):
+    """ Writes the metrics in the prometheus text format - for the node
+        exporter's textfile collector.
+
+    The file is written to a temp file in the same directory then renamed
+    into place, so the collector never reads a partial file.
+
+    :param metrics - RunMetrics
+    :param fqfn    - str - should end in .prom
+    :param labels  - dict, optional - added to every metric, ex: instance & database
+    """
+    labels = labels or {}
+    lines = []
+
+    def add_metric(name, help_text, samples):
+        lines.append('# HELP %s_%s %s' % (PROMETHEUS_PREFIX, name, help_text))
+        lines.append('# TYPE %s_%s gauge' % (PROMETHEUS_PREFIX, name))
+        for sample_labels, value in samples:
+            all_labels = dict(labels, **sample_labels)
+            label_str = ','.join('%s="%s"' % (key, _escape_label(all_labels[key]))
+                                 for key in sorted(all_labels))
+            lines.append('%s_%s{%s} %s' % (PROMETHEUS_PREFIX, name, label_str, _format_value(value)))
+
+    add_metric('phase_seconds', 'Seconds spent in each runner phase during the last run.',
+               [({'phase': phase}, secs) for (phase, secs) in metrics.phase_secs.items()])
+    add_metric('phase_calls', 'Times each runner phase ran during the last run.',
+               [({'phase': phase}, calls) for (phase, calls) in metrics.phase_calls.items()])
+    add_metric('checks', 'Checks run during the last run by outcome.',
+               [({'outcome': outcome}, cnt) for (outcome, cnt) in metrics.outcomes.items()])
+    add_metric('run_seconds', 'Duration of the last run.',
+               [({}, metrics.get_run_secs())])
+    add_metric('max_rc', 'Highest check rc of the last run.',
+               [({}, -1 if metrics.max_rc is None else metrics.max_rc)])
+    add_metric('last_run_timestamp_seconds', 'Unix time the last run finished.',
+               [({}, time.time())])
+
+    out_dir = dirname(os.path.abspath(fqfn))
+    (temp_fd, temp_fqfn) = tempfile.mkstemp(dir=out_dir, prefix='.%s.' % basename(fqfn))
+    with os.fdopen(temp_fd, 'w') as outfile:
+        outfile.write('\n'.join(lines) + '\n')
+    os.chmod(temp_fqfn, 0o644)
+    os.rename(temp_fqfn, fqfn)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+
+def send_statsd(metrics, host, port, prefix=STATSD_PREFIX):
+    """ Sends the metrics to a statsd-compatible daemon over udp.
+
+    Phase times are sent as timers in ms, phase calls and outcomes as
+    counters.  Multiple metrics are sent per packet, newline-delimited.
+    Failures are logged rather than raised - metrics must never fail a run.
+    """
+    stats = []
+    for phase, secs in metrics.phase_secs.items():
+        stats.append('%s.phase.%s:%d|ms' % (prefix, phase, int(secs * 1000)))
+    for phase, calls in metrics.phase_calls.items():
+        stats.append('%s.phase_calls.%s:%d|c' % (prefix, phase, calls))
+    for outcome, cnt in metrics.outcomes.items():
+        stats.append('%s.checks.%s:%d|c' % (prefix, outcome, cnt))
+    stats.append('%s.run:%d|ms' % (prefix, int(metrics.get_run_secs() * 1000)))
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for packet in _get_statsd_packets(stats):
+            sock.sendto(packet.encode('utf-8'), (host, port))
+    except (socket.error, socket.gaierror) as e:
+        logging.getLogger('RunnerLogger').warning('statsd metrics could not be sent to %s:%s - %s',
+                                                  host, port, e)
+    finally:
+        sock.close()
+
+
+def _get_statsd_packets(stats):
+    packet = []
+    packet_bytes = 0
+    for stat in stats:
+        if packet and packet_bytes + len(stat) + 1 > MAX_STATSD_PACKET_BYTES:
+            yield '\n'.join(packet)
+            packet = []
+            packet_bytes = 0
+        packet.append(stat)
+        packet_bytes += len(stat) + 1
+    if packet:
+        yield '\n'.join(packet)
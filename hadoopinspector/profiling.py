@@ -0,0 +1,126 @@
+#!/usr/bin/env python2
+"""
+This source code is protected by the BSD license.  See the file "LICENSE"
+in the source code root directory for the full language or refer to it here:
+   http://opensource.org/licenses/BSD-3-Clause
+Copyright 2015, 2016 Will Farmer and Ken Farmer
+"""
+
+import os, sys, time, datetime, gc
+import signal, collections
+import cProfile, pstats
+from os.path import isdir, isfile, exists, dirname, basename
+from os.path import join as pjoin
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None      # python 2
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DEFAULT_SAMPLE_SECS = 0.005
+DEFAULT_TOP_CNT     = 30
+
+
+
+class RunProfiler(object):
+    """ Profiles the runner's own orchestration - not the checks, which run
+        as separate processes.
+
+    Between start() and stop() three profilers run:
+        - cProfile - written as <prefix>.pstats, and summarized by
+          cumulative time in <prefix>.pstats.txt
+        - a sampling profiler driven by SIGPROF - which only counts the
+          runner's own cpu time - written as <prefix>.collapsed: one
+          'outer;inner;innermost count' line per distinct stack, the input
+          format of flamegraph.pl and speedscope
+        - tracemalloc - top allocating lines written to <prefix>.allocations.txt.
+          Where tracemalloc is unavailable (python 2) that report instead
+          lists the most common live object types and the max rss.
+    """
+
+    def __init__(self, out_dir, sample_secs=DEFAULT_SAMPLE_SECS, top_cnt=DEFAULT_TOP_CNT):
+        assert isdir(out_dir)
+        self.out_dir     = out_dir
+        self.sample_secs = sample_secs
+        self.top_cnt     = top_cnt
+        self.prefix      = pjoin(out_dir, 'profile_%s' % datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S'))
+        self.profile     = cProfile.Profile()
+        self.stacks      = collections.Counter()
+        self.prior_handler = None
+
+    def start(self):
+        if tracemalloc:
+            tracemalloc.start()
+        if hasattr(signal, 'setitimer'):
+            self.prior_handler = signal.signal(signal.SIGPROF, self._sample)
+            #--- restart rather than interrupt the runner's reads & waits on each sample:
+            signal.siginterrupt(signal.SIGPROF, False)
+            signal.setitimer(signal.ITIMER_PROF, self.sample_secs, self.sample_secs)
+        self.profile.enable()
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('%s (%s:%d)' % (code.co_name, basename(code.co_filename), code.co_firstlineno))
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        """ Stops profiling and writes the reports.
+
+        Returns: list of the fqfns written
+        """
+        self.profile.disable()
+        if hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, self.prior_handler or signal.SIG_DFL)
+
+        written = [self._write_pstats(), self._write_pstats_summary(),
+                   self._write_collapsed(), self._write_allocations()]
+        if tracemalloc:
+            tracemalloc.stop()
+        return written
+
+    def _write_pstats(self):
+        fqfn = self.prefix + '.pstats'
+        self.profile.dump_stats(fqfn)
+        return fqfn
+
+    def _write_pstats_summary(self):
+        fqfn = self.prefix + '.pstats.txt'
+        with open(fqfn, 'w') as outfile:
+            stats = pstats.Stats(self.profile, stream=outfile)
+            stats.sort_stats('cumulative').print_stats(self.top_cnt)
+        return fqfn
+
+    def _write_collapsed(self):
+        fqfn = self.prefix + '.collapsed'
+        with open(fqfn, 'w') as outfile:
+            for stack, cnt in sorted(self.stacks.items()):
+                outfile.write('%s %d\n' % (stack, cnt))
+        return fqfn
+
+    def _write_allocations(self):
+        fqfn = self.prefix + '.allocations.txt'
+        with open(fqfn, 'w') as outfile:
+            if tracemalloc:
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                outfile.write('traced memory - current: %d bytes, peak: %d bytes\n' % (current, peak))
+                outfile.write('top %d allocations by line:\n' % self.top_cnt)
+                for stat in snapshot.statistics('lineno')[:self.top_cnt]:
+                    outfile.write('%s\n' % stat)
+            else:
+                outfile.write('tracemalloc is unavailable - showing live objects by type instead\n')
+                if resource:
+                    outfile.write('max rss: %d\n' % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+                type_cnts = collections.Counter(type(x).__name__ for x in gc.get_objects())
+                outfile.write('top %d object types by count:\n' % self.top_cnt)
+                for type_name, cnt in type_cnts.most_common(self.top_cnt):
+                    outfile.write('%10d %s\n' % (cnt, type_name))
+        return fqfn
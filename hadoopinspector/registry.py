@@ -8,6 +8,7 @@ Copyright 2015, 2016 Will Farmer and Ken Farmer
 
 import os, sys, time, subprocess
 import json, logging
+import glob, hashlib, tempfile, fnmatch
 from os.path import isdir, isfile, exists, dirname, basename
 from os.path import join as pjoin
 import errno
@@ -15,6 +16,17 @@ from pprint import pprint as pp
 
 import validictory
 import demjson
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:
+    from collections import Mapping, MutableMapping
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+#--- bump whenever default() or validate() change what a compiled registry holds:
+REGISTRY_SCHEMA_VERSION = 3
 
 
 class Registry(object):
@@ -29,14 +41,30 @@ class Registry(object):
                 "check_mode":   "full",
                 "check_scope":  "row",
                 "check_status": "active"
+                "check_tags":   ["severity:high", "pk"]     # optional
+                "check_description": "asset_id is unique"   # optional
                 "hapinsp_checkcustom_cols": date_id
             }
         }
     }
+
+    Checks repeated across many tables can instead be defined once within
+    an optional list of templates - see RegistryTemplate:
+    {
+        "hapinsp_templates": [ {
+            "table_pattern": "*",
+            "checks": { "rule_pk1": { "check_name": "rule_uniqueness" } },
+            "overrides": { "asset": { "rule_pk1": { "hapinsp_checkcustom_cols": "asset_id" } } }
+        } ],
+        "asset": {}
+    }
+    Templates are expanded one table at a time by get_table_checks().
     """
 
     def __init__(self):
         self.registry       = {}
+        self.templates      = []
+        self.validated      = False
         self.logger = logging.getLogger('RunnerLogger')
 
     def _abort(self, msg):
@@ -50,6 +78,8 @@ class Registry(object):
         """load registry json file into self.registry.
 
         Does no validation other than requiring the file to be valid json.
+        If the file is the index of a sharded registry then only the index
+        is read here - each table's shard is read on first access.
 
         :param fqfn     - str
         """
@@ -58,55 +88,261 @@ class Registry(object):
 
         with open(fqfn) as infile:
             json_str = infile.read()
+        self._set_registry(self._decode(json_str), fqfn, self._load_shard)
+        self.validated = False
+
+    def get_view(self):
+        """ Returns a new Registry that shares this registry's tables, checks
+            and templates.
+
+        filter_registry() replaces rather than modifies the tables and
+        templates it is given, so a long-running process can load and
+        validate a registry once, then filter a fresh view of it per run.
+        """
+        view = Registry()
+        view.registry  = self.registry
+        view.templates = list(self.templates)
+        view.validated = self.validated
+        return view
+
+    def _set_registry(self, reg, fqfn=None, shard_loader=None):
+        """ Splits any templates out of a decoded registry, and wraps the
+            index of a sharded registry.
+        """
+        self.registry, raw_templates = split_templates(reg)
+        self.templates = self._get_templates(raw_templates)
+        if is_sharded_index(self.registry):
+            self.registry = RegistryShards(fqfn, self.registry, shard_loader)
+
+    def _get_templates(self, raw_templates):
+        try:
+            validictory.validate(raw_templates, TEMPLATES_SCHEMA)
+        except (validictory.validator.RequiredFieldValidationError, validictory.FieldValidationError) as e:
+            self._abort("Registry error in %s: %s" % (TEMPLATES_KEY, e))
+        return [RegistryTemplate(raw_template) for raw_template in raw_templates]
+
+    def _load_shard(self, shard_fqfn, table):
+        if not isfile(shard_fqfn):
+            self._abort("Invalid registry shard file for table %s: %s" % (table, shard_fqfn))
+        with open(shard_fqfn) as infile:
+            return self._decode(infile.read())
+
+    def load_compiled_registry(self, fqfn, cache_dir):
+        """load a defaulted & validated registry into self.registry.
+
+        The compiled registry is cached in cache_dir as a pickle keyed by
+        the registry file's absolute path, content hash and the
+        REGISTRY_SCHEMA_VERSION - so registries of the same name in other
+        directories can share a cache_dir.
+        On a cache miss the registry is loaded, defaulted, validated and
+        then written to the cache for later runs.  Sharded registries are
+        compiled & cached one shard at a time, as each is first accessed.
+
+        :param fqfn      - str
+        :param cache_dir - str
+        """
+        if not isfile(fqfn):
+            self._abort("Invalid registry file: %s" % fqfn)
+        if not isdir(cache_dir):
+            self._abort("Invalid registry cache dir: %s" % cache_dir)
+
+        self._set_registry(self._load_compiled(fqfn, cache_dir), fqfn,
+                           lambda shard_fqfn, table: self._load_compiled(shard_fqfn, cache_dir, table))
+        self.validated = True
+
+    def _load_compiled(self, fqfn, cache_dir, table=None):
+        """ Returns the compiled contents of a registry file, a shard index
+            or - if table is provided - a single table's shard.
+        """
+        if not isfile(fqfn):
+            self._abort("Invalid registry file: %s" % fqfn)
+        with open(fqfn, 'rb') as infile:
+            json_str = infile.read()
+        cache_prefix = 'registry_%s_%s_v%d_' % (basename(fqfn),
+                          hashlib.sha1(os.path.abspath(fqfn).encode('utf-8')).hexdigest()[:8],
+                          REGISTRY_SCHEMA_VERSION)
+        cache_fqfn   = pjoin(cache_dir, '%s%s.pickle' % (cache_prefix, hashlib.sha1(json_str).hexdigest()))
+
+        if isfile(cache_fqfn):
             try:
-                self.registry, reg_errors, reg_stats = demjson.decode(json_str, return_errors=True)
-            except demjson.JSONDecodeError as e:
-                self.logger.critical("registry json load error: %s", e)
-                for err in reg_errors:
-                    self.logger.critical(err)
-                self._abort("Invalid registry file - could not load/decode")
+                with open(cache_fqfn, 'rb') as infile:
+                    compiled = pickle.load(infile)
+            except Exception as e:
+                self.logger.warning("registry cache unreadable - will recompile: %s", e)
             else:
-                if reg_errors:
-                    self.logger.critical("registry json load error")
-                    for err in reg_errors:
-                        self.logger.critical(err)
-                    self._abort("Invalid registry file - json errors discovered during load")
+                self.logger.debug("registry loaded from cache: %s", cache_fqfn)
+                return compiled
 
-    def filter_registry(self, filter_table=None, filter_check=None):
-        """ Filter the registry to only the table and check provided.
+        compiled = self._decode(json_str)
+        if table is not None:
+            self._default_table(compiled)
+            self._validate_table(table, compiled)
+        else:
+            #--- templates are compiled in place, so are kept within the cached registry:
+            tables, raw_templates = split_templates(compiled)
+            templates = self._get_templates(raw_templates)
+            self._default_templates(templates)
+            self._validate_templates(templates)
+            if not is_sharded_index(tables):
+                self._default_tables(tables)
+                self._validate_tables(tables)
+
+        #--- write to a temp file then rename so concurrent runners never see a partial cache:
+        for old_cache_fqfn in glob.glob(pjoin(cache_dir, cache_prefix + '*.pickle')):
+            try:
+                os.remove(old_cache_fqfn)
+            except OSError:
+                pass   # another runner got to it first
+        temp_fd, temp_fqfn = tempfile.mkstemp(prefix=cache_prefix, suffix='.tmp', dir=cache_dir)
+        with os.fdopen(temp_fd, 'wb') as outfile:
+            pickle.dump(compiled, outfile, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp_fqfn, cache_fqfn)
+        self.logger.debug("registry cache written: %s", cache_fqfn)
+        return compiled
+
+    def _decode(self, json_str, context='load'):
+        """ Decodes a registry json string.
+
+        Uses the C-backed json module first since it is an order of magnitude
+        faster on large registries.  Only if that fails - or finds duplicate
+        keys, which it would otherwise silently drop - is the pure-python
+        demjson decoder run - to provide detailed error messages.
+
+        :param json_str - str
+        :param context  - str, used in error messages
+        """
+        try:
+            return json.loads(json_str, object_pairs_hook=reject_duplicate_keys)
+        except ValueError:
+            self.logger.debug("registry json fast decode failed - retrying with demjson")
 
-        :param table    - str, optional
-        :param check    - str, optional
+        reg_errors = []
+        try:
+            registry, reg_errors, reg_stats = demjson.decode(json_str, return_errors=True)
+        except demjson.JSONDecodeError as e:
+            self.logger.critical("registry json %s error: %s", context, e)
+            for err in reg_errors:
+                self.logger.critical(err)
+            self._abort("Invalid registry file - could not %s/decode" % context)
+        else:
+            if reg_errors:
+                self.logger.critical("registry json %s error", context)
+                for err in reg_errors:
+                    self.logger.critical(err)
+                self._abort("Invalid registry file - json errors discovered during %s" % context)
+        return registry
+
+    def filter_registry(self, filter_table=None, filter_check=None, filter_tag=None):
+        """ Filter the registry to only the tables, checks and tags provided.
+
+        Each filter may be a single value or a list.  Tables and checks match
+        if they match any of their filter values, which may be glob patterns.
+        Checks must match every tag filter value - each of which may also be
+        a glob pattern, ex: 'severity:high'.  Lookups go through the
+        RegistryIndex - so only the selected tables of a sharded registry are
+        loaded, and selected checks are referenced rather than copied.
+
+        :param table    - str or list of str, optional
+        :param check    - str or list of str, optional
+        :param tag      - str or list of str, optional
         """
-        if not self.registry:
+        if not self.registry and not self.templates:
             self.logger.critical('invalid registry file - it is empty')
             raise EOFError("Registry is empty")
 
+        table_patterns = _as_list(filter_table)
+        check_patterns = _as_list(filter_check)
+        tag_patterns   = _as_list(filter_tag)
+
+        #--- templates are restricted by name, without expanding them:
+        universe = self._get_template_universe()
+        new_templates = []
+        for template in self.templates:
+            template_tables = template.get_target_tables(universe)
+            if table_patterns:
+                template_tables = match_names(template_tables, table_patterns)
+            if check_patterns or tag_patterns:
+                template_checks = RegistryIndex({None: template.get_check_tags()}) \
+                                      .get_checks(check_patterns, tag_patterns).get(None, set())
+            else:
+                template_checks = set(template.checks)
+            if template_tables and template_checks:
+                new_templates.append(template.restrict(template_tables, template_checks))
+        self.templates = new_templates
+
+        if table_patterns:
+            tables = match_names(self.registry, table_patterns)
+        else:
+            tables = set(self.registry)
+
         new_reg = {}
-        for loaded_table in self.registry:
-            if filter_table is None and filter_check is None:
-                new_reg[loaded_table] = self.registry[loaded_table]
-            elif filter_table == loaded_table and filter_check is None:
-                new_reg[loaded_table] = self.registry[loaded_table]
-            elif filter_table == loaded_table and filter_check:
-                for loaded_check in self.registry[loaded_table]:
-                    if loaded_check == filter_check:
-                        if loaded_table not in new_reg:
-                            new_reg[loaded_table] = {}
-                        new_reg[loaded_table][loaded_check] = self.registry[loaded_table][filter_check]
-            elif filter_table is None and filter_check:
-                for loaded_check in self.registry[loaded_table]:
-                    if loaded_check == filter_check:
-                        if loaded_table not in new_reg:
-                            new_reg[loaded_table] = {}
-                        new_reg[loaded_table][loaded_check] = self.registry[loaded_table][filter_check]
+        if not check_patterns and not tag_patterns:
+            for table in tables:
+                new_reg[table] = self.registry[table]
+        else:
+            selected_checks = self.get_index().get_checks(check_patterns, tag_patterns)
+            for table in tables & set(selected_checks):
+                table_reg = self.registry[table]
+                new_reg[table] = {check: table_reg[check] for check in selected_checks[table]
+                                  if check in table_reg}
         self.registry = new_reg
 
+    def get_index(self):
+        """ Returns a RegistryIndex of the registry's checks & tags.  Sharded
+            registries written by write_sharded() are indexed from their index
+            file without loading any shards - other than those changed since.
+        """
+        if isinstance(self.registry, RegistryShards) and self.registry.check_index is not None:
+            return RegistryIndex(self.registry.get_check_index())
+        table_checks = {}
+        for table in self.registry:
+            table_reg = self.registry[table]
+            table_checks[table] = {check: table_reg[check].get('check_tags') or []
+                                   for check in table_reg}
+        return RegistryIndex(table_checks)
+
+    def _get_template_universe(self):
+        """ Returns the set of table names that template patterns can match:
+            every table in the registry plus those listed by any template.
+        """
+        universe = set(self.registry)
+        for template in self.templates:
+            universe.update(template.tables)
+        return universe
+
+    def get_tables(self):
+        """ Returns the sorted names of all tables with checks - whether
+            defined directly or through templates.
+        """
+        tables = set(self.registry)
+        if self.templates:
+            universe = self._get_template_universe()
+            for template in self.templates:
+                tables.update(template.get_target_tables(universe))
+        return sorted(tables)
+
+    def get_table_checks(self, table):
+        """ Returns {check: check_reg} for a single table, expanding any
+            templates that apply to it.  Checks defined directly on the table
+            take precedence over template checks of the same name.  Nothing
+            is retained - so callers iterating over tables never hold more
+            than one table's expansion.
+        """
+        table_checks = {}
+        if self.templates and (table in self.registry
+                               or any(table in template.tables for template in self.templates)):
+            for template in self.templates:
+                if template.applies_to(table):
+                    table_checks.update(template.get_checks(table))
+        if table in self.registry:
+            table_checks.update(self.registry[table])
+        return table_checks
+
     def add_table(self, table):
         self.registry[table] = {}
 
     def add_check(self, table, check, check_name, check_status, check_type,
-                  check_mode, check_scope, **checkvars):
+                  check_mode, check_scope, check_tags=None, check_description=None, **checkvars):
         """ Add a check structure to registry.  If no registry is provided,
             then it'll add this to the registry.
         """
@@ -120,6 +356,10 @@ class Registry(object):
                'check_type':    check_type,
                'check_mode':    check_mode,
                'check_scope':   check_scope }
+        if check_tags:
+            self.registry[table][check]['check_tags'] = list(check_tags)
+        if check_description:
+            self.registry[table][check]['check_description'] = check_description
         for key in checkvars:
             if not key.startswith('hapinsp_checkcustom_'):
                 self.logger.critical("Invalid registry check (%s) - invalid checkvar (%s)", check, key)
@@ -127,7 +367,7 @@ class Registry(object):
             self.registry[table][check][key] = checkvars[key]
 
     def add_setup_check(self, table, check, check_name, check_status, check_type,
-                  check_mode, **checkvars):
+                  check_mode, check_tags=None, check_description=None, **checkvars):
         """ Add a check structure to registry.  If no registry is provided,
             then it'll add this to the registry.
         """
@@ -140,6 +380,10 @@ class Registry(object):
                'check_status':  check_status,
                'check_type':    check_type,
                'check_mode':    check_mode }
+        if check_tags:
+            self.registry[table][check]['check_tags'] = list(check_tags)
+        if check_description:
+            self.registry[table][check]['check_description'] = check_description
         for key in checkvars:
             if not key.startswith('hapinsp_checkcustom_'):
                 self.logger.critical("Invalid registry check (%s) - invalid checkvar (%s)", check, key)
@@ -148,7 +392,9 @@ class Registry(object):
 
     def write(self, filename=None, registry=None):
         if registry is None:
-            registry = self.registry
+            registry = dict(self.registry)
+            if self.templates:
+                registry[TEMPLATES_KEY] = [template.raw for template in self.templates]
         if not filename:
             filename = 'registry.json'
         with open(filename, 'w') as outfile:
@@ -156,6 +402,27 @@ class Registry(object):
         assert isfile(filename)
         return filename
 
+    def write_sharded(self, index_filename, registry=None):
+        """ Writes the registry as an index file plus one shard file per
+            table within the index file's directory.
+        """
+        if registry is None:
+            registry = self.registry
+        shard_dir = dirname(os.path.abspath(index_filename))
+        index = {'hapinsp_registry_format': 'sharded', 'tables': {}}
+        for table in registry:
+            shard_fn = '%s.json' % table
+            with open(pjoin(shard_dir, shard_fn), 'w') as outfile:
+                json.dump(registry[table], outfile)
+            index['tables'][table] = {'file':   shard_fn,
+                                      'stat':   get_file_stat(pjoin(shard_dir, shard_fn)),
+                                      'checks': {check: registry[table][check].get('check_tags') or []
+                                                 for check in registry[table]}}
+        with open(index_filename, 'w') as outfile:
+            json.dump(index, outfile)
+        assert isfile(index_filename)
+        return index_filename
+
     def validate_file(self, filename):
 
         if not isfile(filename):
@@ -165,21 +432,9 @@ class Registry(object):
         try:
             with open(filename) as infile:
                 json_str = infile.read()
-                try:
-                    self.registry, reg_errors, reg_stats = demjson.decode(json_str, return_errors=True)
-                except demjson.JSONDecodeError as e:
-                    self.logger.critical("registry json validation error: %s", e)
-                    for err in reg_errors:
-                        self.logger.critical(err)
-                    self._abort("Invalid registry file - could not decode")
-                else:
-                    if reg_errors:
-                        self.logger.critical("registry json validation error")
-                        for err in reg_errors:
-                            self.logger.critical(err)
-                        self._abort("Invalid registry file - json errors discovered")
         except IOError:
             self._abort("Invalid registry file - could not open")
+        self._set_registry(self._decode(json_str, 'validation'), filename, self._load_shard)
 
         try:
             self.validate()
@@ -189,87 +444,399 @@ class Registry(object):
 
 
     def default(self):
-        for table in self.registry:
-            for check in self.registry[table]:
-                checkobj = self.registry[table][check]
+        self._default_tables(self.registry)
+        self._default_templates(self.templates)
+
+    def _default_templates(self, templates):
+        for template in templates:
+            self._default_table(template.checks)
 
-                if checkobj.get('check_type', None) is None:
-                    checkobj['check_type'] = 'rule'
+    def _default_tables(self, tables):
+        for table in tables:
+            self._default_table(tables[table])
 
-                if checkobj['check_type'] == 'setup':
-                    if 'check_mode' not in checkobj:
-                        checkobj['check_mode'] = None
-                    if 'check_scope' not in checkobj:
-                        checkobj['check_scope'] = None
-                elif checkobj['check_type'] == 'rule':
-                    if 'check_mode' not in checkobj:
-                        checkobj['check_mode'] = 'full'
-                    if 'check_scope' not in checkobj:
-                        checkobj['check_scope'] = 'row'
+    def _default_table(self, table_reg):
+        for check in table_reg:
+            checkobj = table_reg[check]
 
-                if checkobj.get('check_status', None) is None:
-                    checkobj['check_status'] = 'active'
+            if checkobj.get('check_type', None) is None:
+                checkobj['check_type'] = 'rule'
+
+            if checkobj['check_type'] == 'setup':
+                if 'check_mode' not in checkobj:
+                    checkobj['check_mode'] = None
+                if 'check_scope' not in checkobj:
+                    checkobj['check_scope'] = None
+            elif checkobj['check_type'] == 'rule':
+                if 'check_mode' not in checkobj:
+                    checkobj['check_mode'] = 'full'
+                if 'check_scope' not in checkobj:
+                    checkobj['check_scope'] = 'row'
+
+            if checkobj.get('check_status', None) is None:
+                checkobj['check_status'] = 'active'
 
 
     def validate(self):
+        self._validate_tables(self.registry)
+        self._validate_templates(self.templates)
+        self.validated = True
+
+    def _validate_templates(self, templates):
+        """ Validates each template's checks once, plus each override merged
+            into its check - so that every expansion is valid without being
+            validated itself.
+        """
+        for template_num, template in enumerate(templates):
+            self._validate_table('%s[%d]' % (TEMPLATES_KEY, template_num), template.checks)
+            for table in template.overrides:
+                for check, override in template.overrides[table].items():
+                    if check not in template.checks:
+                        self._abort("Invalid template override - unknown check: %s for table: %s" % (check, table))
+                    for key in ('check_type', 'check_tags'):
+                        if key in override:
+                            self._abort("Invalid template override - %s may not be overridden for table: %s" % (key, table))
+                    self._validate_table(table, {check: template.get_check(table, check)})
+
+    def _validate_tables(self, tables):
+        if not isinstance(tables, Mapping):
+            self._abort(msg="Invalid registry")
+        for table in tables:
+            self._validate_table(table, tables[table])
+
+    def _validate_table(self, table, table_reg):
+        if not isinstance(table_reg, dict):
+            self._abort(msg="Invalid registry table: %s" % table)
+        for check in table_reg:
+            check_type = table_reg[check].get('check_type', None)
+            if check_type is None:
+                self._abort(msg="Missing check_type for: %s" % table )
+            else:
+                try:
+                    self._validate_check(table_reg[check], check_type)
+                except:
+                    self.logger.debug('table: %s', table)
+                    self.logger.debug('check: %s', check)
+                    self.logger.debug(table_reg[check])
+                    self.logger.critical('table: %s check: %s failure!', table, check)
+                    raise
+
+    def _validate_check(self, check_reg, check_type):
+        assert check_type in ['rule', 'profile', 'setup', 'teardown']
+        try:
+            if check_type in ['setup', 'teardown']:
+                validictory.validate(check_reg, SETUPTEARDOWN_CHECK_SCHEMA)
+            else:
+                validictory.validate(check_reg, REGULAR_CHECK_SCHEMA)
+        except validictory.validator.RequiredFieldValidationError as e:
+            self._abort("Registry error on field: %s" % e)
+        except validictory.FieldValidationError as e:
+            self._abort("Registry error on field: %s with value: %s with check_type: %s" \
+                 % (e.fieldname, check_reg[e.fieldname], check_type))
+        except:
+            self._abort("Error encountered while processing Registry")
 
-        regular_check_schema = {
-             "type": "object",
-             "properties": {
-                    "check_name":   {"type": "string"},
-                    "check_status": {"type": "string",
-                                    "enum": ["active", "inactive"] },
-                    "check_type":   {"type": "string",
-                                    "enum": ["rule", "profile"] },
-                    "check_mode":   {"type": "string",
-                                    "enum": ["full", "incremental"] },
-                    "check_scope":  {"type": "string",
-                                    "enum": ["row", "table", "database"] }
-                           }
-        }
-        setupteardown_check_schema = {
-             "type": "object",
-             "properties": {
-                    "check_name":   {"type": "string"},
-                    "check_status": {"type": "string",
-                                    "enum": ["active", "inactive"] },
-                    "check_type":   {"type": "string",
-                                    "enum": ["setup", "teardown"] },
-                    "check_mode":   {"type": "any"},
-                    "check_scope":  {"type": "null"}
-                           }
+
+
+class RegistryTemplate(object):
+    """ A set of checks applied to many tables.  A template applies to every
+    table listed in "tables" and to every table matching the "table_pattern"
+    glob - out of the tables defined in the registry or listed by any
+    template.  "overrides" holds per-table, per-check fields to replace,
+    typically the hapinsp_checkcustom_ vars:
+    {
+        "tables":        ["asset", "cust"],
+        "table_pattern": "*_events",
+        "checks":        { "stats_exist": { "check_name": "stats_exist" } },
+        "overrides":     { "asset": { "stats_exist": { "check_status": "inactive" } } }
+    }
+    """
+
+    def __init__(self, raw):
+        self.raw           = raw
+        self.tables        = set(raw.get('tables') or [])
+        self.table_pattern = raw.get('table_pattern')
+        self.checks        = raw['checks']
+        self.overrides     = raw.get('overrides') or {}
+
+    def get_target_tables(self, universe):
+        if self.table_pattern:
+            return self.tables | set(fnmatch.filter(universe, self.table_pattern))
+        else:
+            return set(self.tables)
+
+    def applies_to(self, table):
+        if table in self.tables:
+            return True
+        elif self.table_pattern:
+            return fnmatch.fnmatch(table, self.table_pattern)
+        else:
+            return False
+
+    def get_check(self, table, check):
+        override = self.overrides.get(table, {}).get(check)
+        if override:
+            check_reg = dict(self.checks[check])
+            check_reg.update(override)
+            return check_reg
+        else:
+            return self.checks[check]
+
+    def get_checks(self, table):
+        return {check: self.get_check(table, check) for check in self.checks}
+
+    def get_check_tags(self):
+        return {check: self.checks[check].get('check_tags') or [] for check in self.checks}
+
+    def restrict(self, tables, checks):
+        """ Returns a copy of this template limited to the tables & checks.
+        """
+        raw = {'tables':    sorted(tables),
+               'checks':    {check: self.checks[check] for check in checks},
+               'overrides': {table: {check: fields for (check, fields) in self.overrides[table].items()
+                                     if check in checks}
+                             for table in self.overrides if table in tables}}
+        return RegistryTemplate(raw)
+
+
+
+def split_templates(reg):
+    """ Returns the registry's tables and its list of raw templates.
+    """
+    if isinstance(reg, dict) and TEMPLATES_KEY in reg:
+        tables = {key: val for (key, val) in reg.items() if key != TEMPLATES_KEY}
+        return tables, reg[TEMPLATES_KEY]
+    else:
+        return reg, []
+
+
+
+class RegistryIndex(object):
+    """ Lookups of a registry's checks by check name and by tag.
+
+    :param table_checks - dict of {table: {check: [tags]}}
+    """
+
+    def __init__(self, table_checks):
+        self.check_tables = {}   # check -> set of tables
+        self.tag_checks   = {}   # tag   -> set of (table, check)
+        for table in table_checks:
+            for check, tags in table_checks[table].items():
+                self.check_tables.setdefault(check, set()).add(table)
+                for tag in tags:
+                    self.tag_checks.setdefault(tag, set()).add((table, check))
+
+    def get_checks(self, check_patterns=None, tag_patterns=None):
+        """ Returns {table: set of checks} for the checks that match any of
+            the check_patterns and all of the tag_patterns.
+        """
+        selected = None
+        if check_patterns:
+            selected = set()
+            for check in match_names(self.check_tables, check_patterns):
+                selected.update((table, check) for table in self.check_tables[check])
+        for tag_pattern in (tag_patterns or []):
+            tagged = set()
+            for tag in match_names(self.tag_checks, [tag_pattern]):
+                tagged.update(self.tag_checks[tag])
+            selected = tagged if selected is None else (selected & tagged)
+
+        table_checks = {}
+        for table, check in (selected or []):
+            table_checks.setdefault(table, set()).add(check)
+        return table_checks
+
+
+
+def match_names(names, patterns):
+    """ Returns the set of names matching any of the patterns.  Patterns
+        without glob characters are looked up directly rather than scanned.
+    """
+    matches = set()
+    for pattern in patterns:
+        if any(char in pattern for char in '*?['):
+            matches.update(fnmatch.filter(names, pattern))
+        elif pattern in names:
+            matches.add(pattern)
+    return matches
+
+
+def _as_list(val):
+    if val is None:
+        return []
+    elif isinstance(val, (list, tuple, set)):
+        return list(val)
+    else:
+        return [val]
+
+
+
+class RegistryShards(MutableMapping):
+    """ The tables of a sharded registry - loaded lazily, one shard file per
+    table, the first time each table is accessed.  Iterating over the tables
+    only reads the index.  A sharded registry's index file looks like:
+    {
+        "hapinsp_registry_format": "sharded",
+        "tables": {
+            "asset": {"file": "asset.json"}
         }
+    }
+    Each shard file holds just the checks for its table:
+    {
+        "rule_pk1": { "check_type": "rule", "check_name": "rule_uniqueness" }
+    }
+    Shard file names are relative to the index file's directory.  The
+    optional checks & tags of each table, along with the (mtime, size) of
+    its shard, are maintained by write_sharded().  Since shards may be
+    edited on their own, the checks & tags of a shard whose stat no longer
+    matches are read from the shard itself.
+    """
 
-        def validate_check(check_reg, check_type):
-            assert check_type in ['rule', 'profile', 'setup', 'teardown']
-            try:
-                if check_type in ['setup', 'teardown']:
-                    validictory.validate(check_reg, setupteardown_check_schema)
-                else:
-                    validictory.validate(check_reg, regular_check_schema)
-            except validictory.validator.RequiredFieldValidationError as e:
-                self._abort("Registry error on field: %s" % e)
-            except validictory.FieldValidationError as e:
-                self._abort("Registry error on field: %s with value: %s with check_type: %s" \
-                     % (e.fieldname, check_reg[e.fieldname], check_type))
-            except:
-                self._abort("Error encountered while processing Registry")
-
-        if not isinstance(self.registry, dict):
-            self._abort(msg="Invalid registry")
-        for table in self.registry:
-            if not isinstance(self.registry[table], dict):
-                self._abort(msg="Invalid registry table: %s" % table)
-            for check in self.registry[table]:
-                check_type = self.registry[table][check].get('check_type', None)
-                if check_type is None:
-                    self._abort(msg="Missing check_type for: %s" % table )
-                else:
-                    try:
-                        validate_check(self.registry[table][check], check_type)
-                    except:
-                        self.logger.debug('table: %s', table)
-                        self.logger.debug('check: %s', check)
-                        self.logger.debug(self.registry[table][check])
-                        self.logger.critical('table: %s check: %s failure!', table, check)
-                        raise
+    def __init__(self, index_fqfn, index, shard_loader):
+        self.shard_dir    = dirname(os.path.abspath(index_fqfn))
+        self.shard_loader = shard_loader
+        self.shard_fns    = {table: index['tables'][table]['file'] for table in index['tables']}
+        self.loaded       = {}
+        self.loaded_stats = {}   # {shard fqfn: (mtime, size)} as of when it was read
+        #--- optional {table: {check: [tags]}} lets filters run without loading shards:
+        if all('checks' in entry for entry in index['tables'].values()):
+            self.check_index = {table: index['tables'][table]['checks'] for table in index['tables']}
+            self.check_index_stats = {table: index['tables'][table].get('stat') for table in index['tables']}
+        else:
+            self.check_index = None
+
+    def __getitem__(self, table):
+        if table not in self.loaded:
+            shard_fqfn = pjoin(self.shard_dir, self.shard_fns[table])   # raises KeyError for unknown tables
+            shard_stat = get_file_stat(shard_fqfn)
+            self.loaded[table] = self.shard_loader(shard_fqfn, table)
+            self.loaded_stats[shard_fqfn] = shard_stat
+        return self.loaded[table]
+
+    def get_check_index(self):
+        """ Returns {table: {check: [tags]}} - from the index for the shards
+            unchanged since it was written, otherwise from the shards.
+        """
+        check_index = {}
+        for table in self.shard_fns:
+            index_stat = self.check_index_stats.get(table)
+            if (table not in self.loaded and index_stat is not None
+                    and list(get_file_stat(pjoin(self.shard_dir, self.shard_fns[table])) or []) == index_stat):
+                check_index[table] = self.check_index[table]
+            else:
+                table_reg = self[table]
+                check_index[table] = {check: table_reg[check].get('check_tags') or [] for check in table_reg}
+        return check_index
+
+    def shards_changed(self):
+        """ Returns True if any shard file has changed since it was loaded.
+        """
+        return any(get_file_stat(shard_fqfn) != shard_stat
+                   for shard_fqfn, shard_stat in self.loaded_stats.items())
+
+    def __setitem__(self, table, table_reg):
+        self.shard_fns.setdefault(table, None)
+        self.loaded[table] = table_reg
+        self.check_index = None   # may no longer match the loaded checks
+
+    def __delitem__(self, table):
+        del self.shard_fns[table]
+        self.loaded.pop(table, None)
+        if self.check_index is not None:
+            self.check_index.pop(table, None)
+
+    def __contains__(self, table):
+        return table in self.shard_fns
+
+    def __iter__(self):
+        return iter(self.shard_fns)
+
+    def __len__(self):
+        return len(self.shard_fns)
+
+
+
+def reject_duplicate_keys(pairs):
+    """ json object_pairs_hook that raises ValueError on any duplicate key.
+    """
+    obj = dict(pairs)
+    if len(obj) != len(pairs):
+        raise ValueError("duplicate key in json object")
+    return obj
+
+
+
+def get_file_stat(fqfn):
+    """ Returns the (mtime, size) of a file - or None if it's missing.
+    """
+    try:
+        file_stat = os.stat(fqfn)
+    except OSError:
+        return None
+    return (file_stat.st_mtime, file_stat.st_size)
+
+
+
+def is_sharded_index(reg):
+    return isinstance(reg, dict) and reg.get('hapinsp_registry_format') == 'sharded'
+
+
+
+TEMPLATES_KEY = 'hapinsp_templates'
+
+TEMPLATES_SCHEMA = {
+     "type": "array",
+     "items": {
+         "type": "object",
+         "properties": {
+                "tables":        {"type": "array",
+                                  "items": {"type": "string"},
+                                  "required": False },
+                "table_pattern": {"type": "string",
+                                  "required": False },
+                "checks":        {"type": "object"},
+                "overrides":     {"type": "object",
+                                  "additionalProperties": {"type": "object",
+                                      "additionalProperties": {"type": "object"}},
+                                  "required": False }
+                       }
+     }
+}
+
+REGULAR_CHECK_SCHEMA = {
+     "type": "object",
+     "properties": {
+            "check_name":   {"type": "string"},
+            "check_status": {"type": "string",
+                            "enum": ["active", "inactive"] },
+            "check_type":   {"type": "string",
+                            "enum": ["rule", "profile"] },
+            "check_mode":   {"type": "string",
+                            "enum": ["full", "incremental"] },
+            "check_scope":  {"type": "string",
+                            "enum": ["row", "table", "database"] },
+            "check_tags":   {"type": "array",
+                            "items": {"type": "string"},
+                            "required": False },
+            "check_description": {"type": "string",
+                            "required": False }
+                   }
+}
+
+SETUPTEARDOWN_CHECK_SCHEMA = {
+     "type": "object",
+     "properties": {
+            "check_name":   {"type": "string"},
+            "check_status": {"type": "string",
+                            "enum": ["active", "inactive"] },
+            "check_type":   {"type": "string",
+                            "enum": ["setup", "teardown"] },
+            "check_mode":   {"type": "any"},
+            "check_scope":  {"type": "null"},
+            "check_tags":   {"type": "array",
+                            "items": {"type": "string"},
+                            "required": False },
+            "check_description": {"type": "string",
+                            "required": False }
+                   }
+}
@@ -0,0 +1,116 @@
+#!/usr/bin/env python2
+"""
+This source code is protected by the BSD license.  See the file "LICENSE"
+in the source code root directory for the full language or refer to it here:
+   http://opensource.org/licenses/BSD-3-Clause
+Copyright 2015, 2016 Will Farmer and Ken Farmer
+"""
+
+import sys, datetime
+import json, csv
+
+REPORT_FORMATS = ('json', 'csv', 'ndjson')
+
+REPORT_FIELDS = ['instance', 'database', 'table', 'check', 'check_type',
+                 'check_mode', 'check_status', 'rc', 'violation_cnt',
+                 'run_start_timestamp', 'run_stop_timestamp',
+                 'data_start_timestamp', 'data_stop_timestamp', 'setup_vars',
+                 'check_hash', 'cpu_user_secs', 'cpu_sys_secs', 'max_rss_kb',
+                 'in_blocks', 'out_blocks', 'wall_secs']
+
+
+def get_report_writer(report_format, fqfn=None):
+    """ Returns a report writer for the format.
+
+    :param report_format - str, one of REPORT_FORMATS
+    :param fqfn          - str, optional - None or '-' writes to stdout
+    """
+    assert report_format in REPORT_FORMATS
+    if report_format == 'json':
+        return JsonReportWriter(fqfn)
+    elif report_format == 'csv':
+        return CsvReportWriter(fqfn)
+    else:
+        return NdjsonReportWriter(fqfn)
+
+
+class ReportWriter(object):
+    """ Writes one report record per completed check as soon as it is added,
+        and flushes after each so that downstream consumers can read results
+        before the run finishes.  Nothing is retained after the write.
+    """
+
+    def __init__(self, fqfn=None):
+        if fqfn is None or fqfn == '-':
+            self.outfile  = sys.stdout
+            self.is_stdout = True
+        else:
+            self.outfile  = open(fqfn, 'w')
+            self.is_stdout = False
+        self.rec_cnt = 0
+
+    def write(self, rec):
+        self._write(self._format_rec(rec))
+        self.rec_cnt += 1
+        self.outfile.flush()
+
+    def _write(self, rec):
+        raise NotImplementedError
+
+    def _format_rec(self, rec):
+        formatted_rec = {}
+        for field in REPORT_FIELDS:
+            val = rec.get(field)
+            if isinstance(val, datetime.datetime):
+                val = val.isoformat()
+            formatted_rec[field] = val
+        return formatted_rec
+
+    def close(self):
+        self.outfile.flush()
+        if not self.is_stdout:
+            self.outfile.close()
+
+
+class NdjsonReportWriter(ReportWriter):
+
+    def _write(self, rec):
+        self.outfile.write(json.dumps(rec, sort_keys=True))
+        self.outfile.write('\n')
+
+
+class JsonReportWriter(ReportWriter):
+    """ Writes a single json array - the opening bracket is written with the
+        first record and the closing bracket on close.
+    """
+
+    def _write(self, rec):
+        self.outfile.write('[\n' if self.rec_cnt == 0 else ',\n')
+        self.outfile.write(json.dumps(rec, sort_keys=True))
+
+    def close(self):
+        self.outfile.write('[]\n' if self.rec_cnt == 0 else '\n]\n')
+        super(JsonReportWriter, self).close()
+
+
+class CsvReportWriter(ReportWriter):
+
+    def __init__(self, fqfn=None):
+        super(CsvReportWriter, self).__init__(fqfn)
+        self.writer = csv.DictWriter(self.outfile, fieldnames=REPORT_FIELDS)
+        self.writer.writeheader()
+        self.outfile.flush()
+
+    def _write(self, rec):
+        self.writer.writerow({key: _to_csv_value(val) for (key, val) in rec.items()})
+
+
+def _to_csv_value(val):
+    """ The python2 csv module cannot write non-ascii unicode.
+    """
+    if sys.version_info[0] == 2 and isinstance(val, unicode):
+        return val.encode('utf-8')
+    elif val is None:
+        return ''
+    else:
+        return val
@@ -0,0 +1,384 @@
+#!/usr/bin/env python2
+"""
+This source code is protected by the BSD license.  See the file "LICENSE"
+in the source code root directory for the full language or refer to it here:
+   http://opensource.org/licenses/BSD-3-Clause
+Copyright 2015, 2016 Will Farmer and Ken Farmer
+"""
+
+import os, sys, time, datetime
+import json, logging
+from os.path import isdir, isfile, exists, dirname, basename
+from os.path import join as pjoin
+from pprint import pprint as pp
+
+import validictory
+
+import hadoopinspector.core as core
+import hadoopinspector.registry as registry
+import hadoopinspector.check_results as chk_results
+import hadoopinspector.check_runner as check_engine
+
+
+CRON_FIELDS = (('minute',   0, 59),
+               ('hour',     0, 23),
+               ('day',      1, 31),
+               ('month',    1, 12),
+               ('weekday',  0,  7))
+
+CRON_ALIASES = {'@yearly':   '0 0 1 1 *',
+                '@annually': '0 0 1 1 *',
+                '@monthly':  '0 0 1 * *',
+                '@weekly':   '0 0 * * 0',
+                '@daily':    '0 0 * * *',
+                '@hourly':   '0 * * * *'}
+
+
+
+class CronSchedule(object):
+    """ A standard 5-field cron expression: minute hour day month weekday.
+
+    Fields may be *, a value, a range (1-5), a step (*/15 or 0-30/10) or
+    a comma-separated list of these.  Weekdays run from 0 (Sunday) to 6,
+    and 7 is also accepted for Sunday.  As with cron, if both day and
+    weekday are restricted then a time matches if either one does.  The
+    @hourly, @daily, @weekly, @monthly and @yearly aliases are supported.
+    """
+
+    def __init__(self, expr):
+        self.expr = expr
+        fields = CRON_ALIASES.get(expr.strip(), expr).split()
+        if len(fields) != 5:
+            raise ValueError("Invalid cron schedule - must have 5 fields: %s" % expr)
+        values = {}
+        for field, (name, low, high) in zip(fields, CRON_FIELDS):
+            values[name] = _parse_cron_field(field, low, high, expr)
+        self.minutes  = values['minute']
+        self.hours    = values['hour']
+        self.days     = values['day']
+        self.months   = values['month']
+        self.weekdays = {0 if x == 7 else x for x in values['weekday']}
+        self.day_restricted     = not fields[2].startswith('*')
+        self.weekday_restricted = not fields[4].startswith('*')
+
+    def _day_matches(self, dt):
+        day_match     = dt.day in self.days
+        weekday_match = (dt.weekday() + 1) % 7 in self.weekdays
+        if self.day_restricted and self.weekday_restricted:
+            return day_match or weekday_match
+        return day_match and weekday_match
+
+    def matches(self, dt):
+        return (dt.minute in self.minutes
+                and dt.hour in self.hours
+                and dt.month in self.months
+                and self._day_matches(dt))
+
+    def get_next_run(self, after_dt):
+        """ Returns the first minute after after_dt that matches the schedule.
+
+        Skips whole months, days and hours that cannot match, so this is
+        cheap even for schedules that run once a year.
+        """
+        dt = after_dt.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit_dt = dt + datetime.timedelta(days=366 * 5)
+        while dt <= limit_dt:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + datetime.timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += datetime.timedelta(minutes=1)
+            else:
+                return dt
+        raise ValueError("Cron schedule never runs: %s" % self.expr)
+
+
+
+def _parse_cron_field(field, low, high, expr):
+    values = set()
+    try:
+        for part in field.split(','):
+            if '/' in part:
+                value_range, step = part.split('/', 1)
+                step = int(step)
+            else:
+                value_range, step = part, 1
+            if value_range == '*':
+                start, stop = low, high
+            elif '-' in value_range:
+                start, stop = [int(x) for x in value_range.split('-', 1)]
+            else:
+                start = int(value_range)
+                stop  = high if '/' in part else start
+            if step < 1 or start < low or stop > high or start > stop:
+                raise ValueError
+            values.update(range(start, stop + 1, step))
+    except ValueError:
+        raise ValueError("Invalid cron schedule field: %s in: %s" % (field, expr))
+    return values
+
+
+
+class Scheduler(object):
+    """ Runs checks on cron-style schedules from within a single long-running
+        process.
+
+    Everything that a cold start of hadoopinspector_runner.py would have to
+    rebuild is kept warm between runs:
+        - registries - loaded, defaulted and validated once, then reloaded
+          only when the registry file's mtime or size changes.  Each run
+          filters a view of the registry rather than reloading it.
+        - the check repo index - refreshed before each run, which only
+          re-hashes check files that have changed.
+        - check results - one CheckResults object, with an open sqlite
+          connection, per results file, instance & database.
+    The schedule file is reloaded the same way.  Times are in UTC, like
+    all other hadoopinspector timestamps.
+
+    Runs happen one at a time - checks are configured through environment
+    variables, so they cannot run concurrently within one process.  A job
+    whose scheduled times pass while other runs are in progress runs once
+    as soon as they finish - missed runs are not queued up.
+    """
+
+    def __init__(self, check_dir, log_dir, log_level='debug',
+                 registry_cache_dir=None, results_filename=None, run_log_format='dirs'):
+        assert isdir(check_dir)
+        assert isdir(log_dir)
+        self.check_dir          = check_dir
+        self.log_dir            = log_dir
+        self.log_level          = log_level
+        self.registry_cache_dir = registry_cache_dir
+        self.results_filename   = results_filename
+        self.run_log_format     = run_log_format
+        self.logger             = logging.getLogger('RunnerLogger')
+
+        self.check_repo     = core.CheckRepo(check_dir)
+        self.jobs           = {}
+        self.next_runs      = {}
+        self.schedule_fqfn  = None
+        self.schedule_key   = None
+        self.registries     = {}   # fqfn: (stat_key, Registry)
+        self.check_results  = {}   # (results fqfn, instance, database): CheckResults
+
+    def load_schedule(self, fqfn, now=None):
+        """ Loads the schedule file if it is new or has changed since it was
+            last loaded.
+
+        Jobs whose schedule is unchanged keep their next run time.
+        Returns: bool - True if the schedule was (re)loaded
+        """
+        stat_key = get_stat_key(fqfn)
+        if fqfn == self.schedule_fqfn and stat_key == self.schedule_key:
+            return False
+        now = now or datetime.datetime.utcnow()
+
+        with open(fqfn) as infile:
+            try:
+                schedule = json.load(infile)
+            except ValueError as e:
+                raise ValueError("Invalid schedule file %s: %s" % (fqfn, e))
+        try:
+            validictory.validate(schedule, SCHEDULE_SCHEMA)
+        except (validictory.validator.RequiredFieldValidationError, validictory.FieldValidationError) as e:
+            raise ValueError("Invalid schedule file %s: %s" % (fqfn, e))
+
+        jobs = {}
+        next_runs = {}
+        for job in schedule['jobs']:
+            if job['name'] in jobs:
+                raise ValueError("Invalid schedule file %s: duplicate job name: %s" % (fqfn, job['name']))
+            job = dict(job)
+            job['cron'] = CronSchedule(job['schedule'])
+            job['registry_filename'] = pjoin(dirname(os.path.abspath(fqfn)), job['registry_filename'])
+            if 'results_filename' in job:
+                job['results_filename'] = pjoin(dirname(os.path.abspath(fqfn)), job['results_filename'])
+            elif self.results_filename:
+                job['results_filename'] = self.results_filename
+            else:
+                raise ValueError("Invalid schedule file %s: no results_filename for job: %s" % (fqfn, job['name']))
+            prior_job = self.jobs.get(job['name'])
+            if prior_job and prior_job['schedule'] == job['schedule']:
+                next_runs[job['name']] = self.next_runs[job['name']]
+            else:
+                next_runs[job['name']] = job['cron'].get_next_run(now)
+            jobs[job['name']] = job
+
+        self.jobs          = jobs
+        self.next_runs     = next_runs
+        self.schedule_fqfn = fqfn
+        self.schedule_key  = stat_key
+        self.logger.info("loaded schedule: %s with %d jobs", fqfn, len(jobs))
+        return True
+
+    def get_registry(self, fqfn):
+        """ Returns the warm registry for fqfn - reloading it only if the
+            file has changed.
+
+        A sharded registry is reloaded when its index or any of its loaded
+        shards change.  If a changed registry fails to load or validate then the prior
+        version continues to be used.
+        """
+        stat_key = get_stat_key(fqfn)
+        if fqfn in self.registries:
+            prior_key, prior_reg = self.registries[fqfn]
+            if prior_key == stat_key and not (isinstance(prior_reg.registry, registry.RegistryShards)
+                                              and prior_reg.registry.shards_changed()):
+                return prior_reg
+        else:
+            prior_reg = None
+
+        reg = registry.Registry()
+        try:
+            if self.registry_cache_dir:
+                reg.load_compiled_registry(fqfn, self.registry_cache_dir)
+            else:
+                reg.load_registry(fqfn)
+                #--- shards are validated per run - as they're loaded:
+                if not isinstance(reg.registry, registry.RegistryShards):
+                    reg.default()
+                    reg.validate()
+        except (SystemExit, EOFError, ValueError) as e:
+            if prior_reg is None:
+                raise
+            self.logger.error("registry reload failed - continuing with prior version: %s %s", fqfn, e)
+            self.registries[fqfn] = (stat_key, prior_reg)
+            return prior_reg
+        self.logger.info("loaded registry: %s", fqfn)
+        self.registries[fqfn] = (stat_key, reg)
+        return reg
+
+    def get_check_results(self, results_fqfn, instance, database):
+        key = (results_fqfn, instance, database)
+        if key not in self.check_results:
+            self.check_results[key] = chk_results.CheckResults(instance, database, db_fqfn=results_fqfn,
+                                                               keep_connection=True)
+        return self.check_results[key]
+
+    def get_due_jobs(self, now):
+        return sorted([name for name in self.jobs if self.next_runs[name] <= now],
+                      key=lambda name: (self.next_runs[name], name))
+
+    def run_pending(self, now=None):
+        """ Runs every job that is due, then schedules its next run.
+
+        Returns: dict of job name: max rc for each job run
+        """
+        now = now or datetime.datetime.utcnow()
+        due_jobs = self.get_due_jobs(now)
+        if not due_jobs:
+            return {}
+        if self.check_repo.refresh():
+            self.logger.info("check repo changed - index refreshed")
+
+        job_rcs = {}
+        for name in due_jobs:
+            try:
+                job_rcs[name] = self.run_job(self.jobs[name])
+            finally:
+                self.next_runs[name] = self.jobs[name]['cron'].get_next_run(now)
+        return job_rcs
+
+    def run_job(self, job):
+        """ Runs a single job against the warm registry, repo & results.
+
+        Returns: int - the max rc of the job's checks, or 1 if the job
+                 could not run
+        """
+        self.logger.info("job starting: %s instance: %s database: %s",
+                         job['name'], job['instance'], job['database'])
+        checker = None
+        try:
+            reg = self.get_registry(job['registry_filename']).get_view()
+            reg.filter_registry(job.get('table'), job.get('check'), job.get('tag'))
+            if not reg.validated:
+                reg.default()
+                reg.validate()
+
+            preflight_errors = self.check_repo.preflight(reg)
+            if preflight_errors:
+                for error in preflight_errors:
+                    self.logger.critical("job: %s preflight failed: %s", job['name'], error)
+                return 1
+
+            results = self.get_check_results(job['results_filename'], job['instance'], job['database'])
+            results.reset()
+            checker = check_engine.CheckRunner(reg, self.check_repo, results, job['instance'],
+                                               job['database'], self.log_dir, self.log_level,
+                                               job.get('user_table_vars'), self.run_log_format)
+            checker.add_db_var('hapinsp_instance', job['instance'])
+            checker.add_db_var('hapinsp_database', job['database'])
+            checker.add_db_var('hapinsp_ssl',      job.get('ssl', False))
+            checker.run_checks_for_tables()
+        except (SystemExit, Exception) as e:
+            #--- neither the runner's exits on fatal errors nor any other failure of
+            #--- a single job may stop the scheduler:
+            self.logger.exception("job failed: %s - %r", job['name'], e)
+            return 1
+        finally:
+            if checker:
+                checker.close()
+                checker.drop_table_vars()
+                checker.drop_prior_table_vars()
+                checker.drop_check_vars()
+                checker.drop_db_vars()
+
+        rc = results.get_max_rc()
+        self.logger.info("job terminating: %s with rc: %s", job['name'], rc)
+        return rc
+
+    def run_forever(self, schedule_fqfn, max_sleep_secs=60):
+        """ Runs jobs as they come due, checking the schedule file for
+            changes at least every max_sleep_secs.
+        """
+        while True:
+            try:
+                self.load_schedule(schedule_fqfn)
+            except (IOError, OSError, ValueError) as e:
+                if not self.jobs:
+                    raise
+                self.logger.error("schedule reload failed - continuing with prior version: %s", e)
+            self.run_pending()
+            now = datetime.datetime.utcnow()
+            sleep_secs = max_sleep_secs
+            if self.next_runs:
+                next_run_secs = (min(self.next_runs.values()) - now).total_seconds()
+                sleep_secs = min(sleep_secs, next_run_secs)
+            time.sleep(max(sleep_secs, 1))
+
+    def close(self):
+        for results in self.check_results.values():
+            results.close()
+        self.check_results = {}
+
+
+
+def get_stat_key(fqfn):
+    file_stat = os.stat(fqfn)
+    return (file_stat.st_mtime, file_stat.st_size)
+
+
+
+SCHEDULE_SCHEMA = {'type': 'object',
+                   'properties': {
+                       'jobs': {'type': 'array',
+                                'items': {'type': 'object',
+                                          'properties': {
+                                              'name':              {'type': 'string'},
+                                              'schedule':          {'type': 'string'},
+                                              'instance':          {'type': 'string'},
+                                              'database':          {'type': 'string'},
+                                              'registry_filename': {'type': 'string'},
+                                              'results_filename':  {'type': 'string', 'required': False},
+                                              'table':             {'type': 'array', 'required': False,
+                                                                    'items': {'type': 'string'}},
+                                              'check':             {'type': 'array', 'required': False,
+                                                                    'items': {'type': 'string'}},
+                                              'tag':               {'type': 'array', 'required': False,
+                                                                    'items': {'type': 'string'}},
+                                              'user_table_vars':   {'type': 'object', 'required': False},
+                                              'ssl':               {'type': 'boolean', 'required': False}},
+                                          'additionalProperties': False}}}}
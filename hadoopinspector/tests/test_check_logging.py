@@ -0,0 +1,149 @@
+#!/usr/bin/env python2
+"""
+This source code is protected by the BSD license.  See the file "LICENSE"
+in the source code root directory for the full language or refer to it here:
+   http://opensource.org/licenses/BSD-3-Clause
+Copyright 2015, 2016 Will Farmer and Ken Farmer
+"""
+
+from __future__ import division
+import sys, os, shutil
+import logging, threading
+import tempfile, json, gzip
+from pprint import pprint as pp
+from os.path import exists, isdir, isfile
+from os.path import join as pjoin
+from os.path import dirname
+
+sys.path.insert(0, dirname(dirname(dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, dirname(dirname(os.path.abspath(__file__))))
+
+import hadoopinspector.check_logging as mod
+
+logging.basicConfig()
+
+
+
+class TestCheckLogWriter(object):
+
+    def setup_method(self, method):
+        self.log_dir = tempfile.mkdtemp(prefix='hadinsp_l_')
+        self.writer  = mod.CheckLogWriter(self.log_dir, 'inst1', 'db1', max_open_files=2)
+
+    def teardown_method(self, method):
+        self.writer.close()
+        shutil.rmtree(self.log_dir)
+
+    def read_log(self, table, check, log_dir=None):
+        with open(pjoin(log_dir or self.log_dir, 'inst1', 'db1', table, check, 'check.log')) as f:
+            return f.read().splitlines()
+
+    def test_records_go_to_each_checks_log(self):
+        logger1 = self.writer.get_logger('cust', 'ck1')
+        logger2 = self.writer.get_logger('cust', 'ck2')
+        logger1.info('check %s started', 'ck1')
+        logger2.error('check failed')
+        self.writer.flush()
+        assert self.read_log('cust', 'ck1')[0].endswith(': INFO     : check ck1 started')
+        assert self.read_log('cust', 'ck2')[0].endswith(': ERROR    : check failed')
+
+    def test_open_files_are_bounded(self):
+        for check_id in range(5):
+            self.writer.get_logger('cust', 'ck%d' % check_id).info('first')
+        for check_id in range(5):
+            self.writer.get_logger('cust', 'ck%d' % check_id).info('second')
+        self.writer.flush()
+        assert len(self.writer.handlers) == 2
+        for check_id in range(5):
+            assert len(self.read_log('cust', 'ck%d' % check_id)) == 2
+
+    def test_log_level(self):
+        logger = self.writer.get_logger('cust', 'ck1', 'warning')
+        logger.info('not written')
+        logger.warning('written')
+        self.writer.flush()
+        assert len(self.read_log('cust', 'ck1')) == 1
+
+    def test_parallel_checks(self):
+        def run_check(check):
+            logger = self.writer.get_logger('cust', check)
+            for rec_id in range(200):
+                logger.info('%s rec %d', check, rec_id)
+        threads = [threading.Thread(target=run_check, args=('ck%d' % x,)) for x in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.writer.flush()
+        for check_id in range(4):
+            recs = self.read_log('cust', 'ck%d' % check_id)
+            assert len(recs) == 200
+            assert all(': ck%d rec' % check_id in rec for rec in recs)
+
+    def test_writers_only_write_their_own_records(self):
+        other_log_dir = tempfile.mkdtemp(prefix='hadinsp_l_')
+        other_writer  = mod.CheckLogWriter(other_log_dir, 'inst1', 'db1')
+        try:
+            self.writer.get_logger('cust', 'ck1').info('mine')
+            other_writer.get_logger('cust', 'ck1').info('theirs')
+            self.writer.flush()
+            other_writer.close()
+            assert len(self.read_log('cust', 'ck1')) == 1
+            assert self.read_log('cust', 'ck1', other_log_dir)[0].endswith('theirs')
+        finally:
+            shutil.rmtree(other_log_dir)
+
+
+
+class TestJsonlCheckLogWriter(object):
+
+    def setup_method(self, method):
+        self.log_dir = tempfile.mkdtemp(prefix='hadinsp_l_')
+        self.writer  = mod.get_check_log_writer('jsonl', self.log_dir, 'inst1', 'db1')
+
+    def teardown_method(self, method):
+        self.writer.close()
+        shutil.rmtree(self.log_dir)
+
+    def test_read_check_log(self):
+        self.writer.get_logger('cust', 'ck1').info('ck1 started')
+        self.writer.get_logger('cust', 'ck2').warning('ck2 rec %d', 1)
+        self.writer.get_logger('cust', 'ck1').info('ck1 continued')
+        try:
+            raise ValueError('bad output')
+        except ValueError:
+            self.writer.get_logger('asset', 'ck1').exception('ck1 failed')
+        self.writer.close()
+
+        assert dirname(self.writer.fqfn) == pjoin(self.log_dir, 'inst1', 'db1')
+        recs = mod.read_check_log(self.writer.fqfn, 'cust', 'ck1')
+        assert [x['message'] for x in recs] == ['ck1 started', 'ck1 continued']
+        assert recs[0]['level'] == 'INFO'
+        assert recs[0]['table'] == 'cust'
+        recs = mod.read_check_log(self.writer.fqfn, 'asset', 'ck1')
+        assert recs[0]['level'] == 'ERROR'
+        assert 'ValueError: bad output' in recs[0]['message']
+        assert mod.read_check_log(self.writer.fqfn, 'cust', 'ck9') == []
+
+        with open(mod.get_index_fqfn(self.writer.fqfn)) as f:
+            index = json.load(f)
+        entries = {(x['table'], x['check']): x for x in index['checks']}
+        assert len(entries[('cust', 'ck1')]['segments']) == 2
+        assert entries[('cust', 'ck1')]['record_cnt'] == 2
+        assert entries[('cust', 'ck1')]['first_ts'] <= entries[('cust', 'ck1')]['last_ts']
+
+    def test_whole_file_is_gzip(self):
+        for check_id in range(3):
+            self.writer.get_logger('cust', 'ck%d' % check_id).info('rec')
+        self.writer.close()
+        with gzip.open(self.writer.fqfn) as f:
+            recs = [json.loads(line.decode('utf-8')) for line in f]
+        assert [x['check'] for x in recs] == ['ck0', 'ck1', 'ck2']
+
+    def test_readable_after_flush(self):
+        self.writer.get_logger('cust', 'ck1').info('rec')
+        self.writer.flush()
+        assert len(mod.read_check_log(self.writer.fqfn, 'cust', 'ck1')) == 1
+        self.writer.get_logger('cust', 'ck1').info('rec')
+        self.writer.flush()
+        assert len(mod.read_check_log(self.writer.fqfn, 'cust', 'ck1')) == 2
@@ -21,6 +21,7 @@ sys.path.insert(0, dirname(dirname(dirname(os.path.abspath(__file__)))))
 sys.path.insert(0, dirname(dirname(os.path.abspath(__file__))))
 
 import hadoopinspector.check_results as mod
+import hadoopinspector.check_runner as check_runner
 
 #logging.getLogger('RunnerLogger')
 logging.basicConfig()
@@ -101,9 +102,9 @@ class TestCheckResults(object):
         cur.execute(sql)
         results = cur.fetchall()
         assert len(results)    == 2
-        assert len(results[0]) == 19
-        assert results[0][-2]  == 3   #check_violations_cnt
-        assert results[1][-2]  == 3   #check_violations_cnt
+        assert len(results[0]) == 26
+        assert results[0][17]  == 3   #check_violations_cnt
+        assert results[1][17]  == 3   #check_violations_cnt
 
         sql  = "SELECT max(run_start_timestamp), current_timestamp, \
                        max(run_start_timestamp) - current_timestamp  as time_diff\
@@ -113,6 +114,205 @@ class TestCheckResults(object):
         assert results[0][2] in (0, 1), "should run in 0 seconds normally, 1 second worst-case"
         conn.close()
 
+    def test_usage(self):
+        usage = check_runner.CheckUsage(cpu_user_secs=1.5, cpu_sys_secs=0.5, max_rss_kb=2048,
+                                        in_blocks=8, out_blocks=16, wall_secs=3.0)
+        start_dt = dtdt.utcnow()
+        self.check_results.add('customer', 'check_fk1', 0, 0, usage=usage,
+                               run_start_timestamp=start_dt, run_stop_timestamp=start_dt)
+        self.check_results.add('customer', 'check_fk2', 0, 0, usage=usage._replace(cpu_user_secs=4.0),
+                               run_start_timestamp=start_dt, run_stop_timestamp=start_dt)
+        self.check_results.add('customer', 'check_fk3', check_status='inactive',
+                               run_start_timestamp=start_dt, run_stop_timestamp=start_dt)
+        summary = self.check_results.get_usage_summary(top_cnt=1)
+        assert summary['check_cnt'] == 2
+        assert summary['cpu_user_secs'] == 5.5
+        assert summary['wall_secs'] == 6.0
+        assert summary['max_rss_kb'] == 2048
+        assert summary['top_cpu'] == [('customer', 'check_fk2', 4.5)]
+
+        self.check_results.write_to_sqlite()
+        conn = sqlite3.connect(self.fqfn)
+        cur  = conn.cursor()
+        cur.execute("SELECT check_name, check_cpu_user_secs, check_max_rss_kb, check_wall_secs \
+                     FROM check_results ORDER BY check_name")
+        assert cur.fetchall() == [('check_fk1', 1.5, 2048, 3.0),
+                                  ('check_fk2', 4.0, 2048, 3.0),
+                                  ('check_fk3', None, None, None)]
+        conn.close()
+
+    def test_upgrading_old_sqlite_table(self):
+        shutil.rmtree(self.temp_dir)
+        os.mkdir(self.temp_dir)
+        conn = sqlite3.connect(self.fqfn)
+        conn.execute("CREATE TABLE other_table (foo TEXT)")
+        conn.execute("CREATE TABLE check_results (%s)"
+                     % ', '.join(mod.CHECK_RESULTS_COLUMNS[:-len(mod.ADDED_COLUMNS)]))
+        conn.commit()
+        conn.close()
+
+        self.check_results = mod.CheckResults(self.inst, self.db, self.fqfn)
+        self.check_results.add('customer', 'check_fk1', 3, 0, check_hash='abc123',
+                               run_start_timestamp=dtdt.utcnow(),
+                               run_stop_timestamp=dtdt.utcnow())
+        self.check_results.write_to_sqlite()
+
+        conn = sqlite3.connect(self.fqfn)
+        cur  = conn.cursor()
+        cur.execute("SELECT check_name, check_violation_cnt, check_hash FROM check_results")
+        assert cur.fetchall() == [('check_fk1', 3, 'abc123')]
+        cur.execute("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='check_results'")
+        assert sorted(row[0] for row in cur.fetchall()) == sorted(x[0] for x in mod.CHECK_RESULTS_INDEXES)
+        conn.close()
+
+    def test_windowed_reads_use_indexes(self):
+        self.add_2_checks_to_1_table('customer')
+        self.check_results.write_to_sqlite()
+        conn = sqlite3.connect(self.fqfn)
+        cur  = conn.cursor()
+        for where_sql, args in [("instance_name=? AND database_name=? AND table_name=? AND check_name=?",
+                                 [self.inst, self.db, 'customer', 'check_fk1']),
+                                ("instance_name=? AND database_name=?", [self.inst, self.db]),
+                                ("1=1", [])]:
+            cur.execute("EXPLAIN QUERY PLAN SELECT * FROM check_results WHERE %s "
+                        "AND run_start_timestamp >= ? AND run_start_timestamp < ?" % where_sql,
+                        args + ['2016-01-01', '2016-02-01'])
+            plan = ' '.join(row[-1] for row in cur.fetchall())
+            assert 'USING INDEX' in plan and 'run_start_timestamp>' in plan
+        conn.close()
+
+
+    def get_names(self, search=None):
+        conn = sqlite3.connect(self.fqfn)
+        cur  = conn.cursor()
+        if search:
+            cur.execute("""SELECT table_name, check_name, check_description FROM check_names
+                           WHERE rowid IN (SELECT docid FROM check_names_fts WHERE check_names_fts MATCH ?)
+                           ORDER BY 1, 2""", (search,))
+        else:
+            cur.execute("SELECT table_name, check_name, check_description FROM check_names ORDER BY 1, 2")
+        names = cur.fetchall()
+        conn.close()
+        return names
+
+    def test_name_index(self):
+        self.add_2_checks_to_1_table('customer')
+        self.check_results.add('customer', 'check_fk3', 0, 0, check_description='orphaned orders',
+                               run_start_timestamp=dtdt.utcnow(), run_stop_timestamp=dtdt.utcnow())
+        self.check_results.write_to_sqlite()
+        assert self.get_names() == [('customer', 'check_fk1', None), ('customer', 'check_fk2', None),
+                                    ('customer', 'check_fk3', 'orphaned orders')]
+        assert self.get_names('orphan*') == [('customer', 'check_fk3', 'orphaned orders')]
+        assert len(self.get_names('cust*')) == 3
+
+        self.check_results = mod.CheckResults(self.inst, self.db, self.fqfn)
+        self.check_results.add('customer', 'check_fk3', 0, 0, check_description='orders without customers',
+                               run_start_timestamp=dtdt.utcnow(), run_stop_timestamp=dtdt.utcnow())
+        self.check_results.write_to_sqlite()
+        assert len(self.get_names()) == 3
+        assert self.get_names('orphan*') == []
+        assert self.get_names('without') == [('customer', 'check_fk3', 'orders without customers')]
+
+    def test_name_index_backfilled_on_upgrade(self):
+        self.add_2_checks_to_1_table('customer')
+        self.check_results.write_to_sqlite()
+        conn = sqlite3.connect(self.fqfn)
+        conn.execute("DROP TABLE check_names")
+        conn.execute("DROP TABLE check_names_fts")
+        conn.commit()
+        conn.close()
+
+        self.check_results = mod.CheckResults(self.inst, self.db, self.fqfn)
+        self.add_2_checks_to_1_table('supplier')
+        self.check_results.write_to_sqlite()
+        assert [x[:2] for x in self.get_names()] == [('customer', 'check_fk1'), ('customer', 'check_fk2'),
+                                                     ('supplier', 'check_fk1'), ('supplier', 'check_fk2')]
+        assert len(self.get_names('fk1')) == 2
+
+
+    def get_latest(self, table='latest_results', cols='table_name, check_name, check_violation_cnt'):
+        conn = sqlite3.connect(self.fqfn)
+        cur  = conn.cursor()
+        cur.execute("SELECT %s FROM %s ORDER BY 1, 2" % (cols, table))
+        rows = cur.fetchall()
+        conn.close()
+        return rows
+
+    def write_run(self, table, violations, start_dt, check='check_fk1'):
+        self.check_results = mod.CheckResults(self.inst, self.db, self.fqfn)
+        self.check_results.add(table, check, violations, 0,
+                               run_start_timestamp=start_dt, run_stop_timestamp=start_dt)
+        self.check_results.write_to_sqlite()
+
+    def test_latest_results(self):
+        self.add_2_checks_to_1_table('customer', 3)
+        self.check_results.write_to_sqlite()
+        assert self.get_latest() == [('customer', 'check_fk1', 3), ('customer', 'check_fk2', 3)]
+
+        now = dtdt.utcnow()
+        self.write_run('customer', 0, now)
+        assert self.get_latest() == [('customer', 'check_fk1', 0), ('customer', 'check_fk2', 3)]
+        #--- an older run written late doesn't replace the latest result:
+        self.write_run('customer', 7, now - datetime.timedelta(days=1))
+        assert self.get_latest() == [('customer', 'check_fk1', 0), ('customer', 'check_fk2', 3)]
+
+    def test_latest_rollups(self):
+        self.add_2_checks_to_1_table('customer', 3)
+        self.add_2_checks_to_1_table('supplier', 0, rc=1)
+        self.check_results.add('supplier', 'setup_check', 0, 0, check_type='setup',
+                               run_start_timestamp=dtdt.utcnow(), run_stop_timestamp=dtdt.utcnow())
+        self.check_results.write_to_sqlite()
+        assert self.get_latest('latest_table_status',
+                               'table_name, check_cnt, failing_check_cnt, violation_cnt, max_rc') == \
+            [('customer', 2, 2, 6, 0), ('supplier', 2, 2, 0, 1)]
+        assert self.get_latest('latest_database_status',
+                               'database_name, check_cnt, failing_check_cnt, violation_cnt, max_rc') == \
+            [('db2', 4, 4, 6, 1)]
+
+    def test_latest_rollups_skip_sentinels(self):
+        #--- inactive checks & unparseable output are recorded with -1 violations:
+        self.add_2_checks_to_1_table('customer', 1)
+        now = dtdt.utcnow()
+        self.check_results.add('customer', 'check_inactive', -1, -1, check_status='inactive',
+                               run_start_timestamp=now, run_stop_timestamp=now)
+        self.check_results.add('customer', 'check_unparseable', -1, 202,
+                               run_start_timestamp=now, run_stop_timestamp=now)
+        self.check_results.write_to_sqlite()
+        assert self.get_latest('latest_table_status',
+                               'table_name, check_cnt, failing_check_cnt, violation_cnt, max_rc') == \
+            [('customer', 3, 3, 2, 202)]
+
+    def test_latest_rollups_recreated_only_when_changed(self):
+        self.write_run('customer', 3, dtdt.utcnow())
+        conn = sqlite3.connect(self.fqfn)
+        conn.execute("DROP VIEW latest_database_status")
+        conn.execute("CREATE VIEW latest_database_status AS SELECT database_name FROM latest_results")
+        conn.commit()
+        conn.close()
+
+        #--- an outdated view is recreated when the db is opened:
+        mod.CheckResults(self.inst, self.db, self.fqfn)
+        assert self.get_latest('latest_database_status', 'database_name, violation_cnt') == [('db2', 3)]
+        #--- while a current db isn't written to at all:
+        os.utime(self.fqfn, (1000000000, 1000000000))
+        mod.CheckResults(self.inst, self.db, self.fqfn)
+        assert os.stat(self.fqfn).st_mtime == 1000000000
+
+    def test_latest_results_backfilled_on_upgrade(self):
+        now = dtdt.utcnow()
+        self.write_run('customer', 3, now - datetime.timedelta(days=1))
+        self.write_run('customer', 0, now)
+        self.write_run('customer', 5, now - datetime.timedelta(days=2))
+        conn = sqlite3.connect(self.fqfn)
+        conn.execute("DROP VIEW latest_table_status")
+        conn.execute("DROP VIEW latest_database_status")
+        conn.execute("DROP TABLE latest_results")
+        conn.commit()
+        conn.close()
+
+        self.write_run('supplier', 2, now)
+        assert self.get_latest() == [('customer', 'check_fk1', 0), ('supplier', 'check_fk1', 2)]
+
 
 
 def add_check(check_dir, rc=0, out_count=0):
@@ -20,6 +20,7 @@ sys.path.insert(0, dirname(dirname(dirname(os.path.abspath(__file__)))))
 sys.path.insert(0, dirname(dirname(os.path.abspath(__file__))))
 
 import hadoopinspector.check_results as check_results
+import hadoopinspector.check_runner as check_runner
 import hadoopinspector.core as core
 
 logging.basicConfig()
@@ -119,9 +120,9 @@ class TestCheckResults(object):
         cur.execute(sql)
         results = cur.fetchall()
         assert len(results)    == 2
-        assert len(results[0]) == 19
-        assert results[0][-2]  == 3   #check_violations_cnt
-        assert results[1][-2]  == 3   #check_violations_cnt
+        assert len(results[0]) == 26
+        assert results[0][17]  == 3   #check_violations_cnt
+        assert results[1][17]  == 3   #check_violations_cnt
 
         sql  = "SELECT max(run_start_timestamp), current_timestamp, \
                        max(run_start_timestamp) - current_timestamp  as time_diff\
@@ -133,6 +134,47 @@ class TestCheckResults(object):
 
 
 
+class TestRunCheckFile(object):
+
+    def setup_method(self, method):
+        self.check_dir = tempfile.mkdtemp(prefix='hadinsp_ckdir_')
+        self.log_dir   = tempfile.mkdtemp(prefix='hadinsp_logdir_')
+        self.runner    = check_runner.CheckRunner(None, core.CheckRepo(self.check_dir), None,
+                                                  'inst1', 'db1', self.log_dir)
+
+    def teardown_method(self, method):
+        self.runner.close()
+        shutil.rmtree(self.check_dir)
+        shutil.rmtree(self.log_dir)
+
+    def add_script(self, body):
+        fqfn = pjoin(self.check_dir, 'check.bash')
+        with open(fqfn, 'w') as f:
+            f.write(u'#!/usr/bin/env bash \n')
+            f.write(body)
+        os.chmod(fqfn, os.stat(fqfn).st_mode | stat.S_IEXEC)
+        return 'check.bash'
+
+    def test_usage(self):
+        check_fn = self.add_script(u'for i in $(seq 20000); do : ; done \n'
+                                   u'echo "{}" \n'
+                                   u'exit 3 \n')
+        output, rc, usage = self.runner._run_check_file(check_fn)
+        assert output.strip() == '{}'
+        assert rc == 3
+        assert usage.wall_secs > 0
+        assert usage.cpu_user_secs + usage.cpu_sys_secs > 0
+        assert usage.max_rss_kb > 0
+
+    def test_large_output_and_signal(self):
+        check_fn = self.add_script(u'head -c 1000000 /dev/zero | tr "\\0" "x" \n'
+                                   u'kill -9 $$ \n')
+        output, rc, usage = self.runner._run_check_file(check_fn)
+        assert len(output) == 1000000
+        assert rc == -9
+
+
+
 def add_check(check_dir, rc=0, out_count=0):
     if not isdir(check_dir):
         os.mkdir(check_dir)
@@ -6,7 +6,7 @@ in the source code root directory for the full language or refer to it here:
 Copyright 2015, 2016 Will Farmer and Ken Farmer
 """
 from __future__ import division
-import sys, os, shutil, stat
+import sys, os, shutil, stat, errno
 import logging
 import time, datetime
 import tempfile, json
@@ -46,6 +46,82 @@ class TestCheckRepo(object):
         assert len(self.repo.repo) == 3
         for check in self.repo.repo:
             assert isfile(self.repo.repo[check]['fqfn'])
+            assert len(self.repo.repo[check]['hash']) == 40
+            assert self.repo.repo[check]['executable']
+            assert self.repo.repo[check]['interpreter'] == 'bash'
+
+    def test_get_hash_changes_with_content(self):
+        add_check(self.check_dir, rc=0)
+        hash1 = mod.CheckRepo(self.check_dir).get_hash('rule_0.bash')
+        os.remove(pjoin(self.check_dir, 'rule_0.bash'))
+        add_check(self.check_dir, rc=1)
+        hash2 = mod.CheckRepo(self.check_dir).get_hash('rule_0.bash')
+        assert hash1 != hash2
+        assert mod.CheckRepo(self.check_dir).get_hash('rule_99.bash') is None
+
+    def test_refresh_skips_missing_files(self, monkeypatch):
+        add_check(self.check_dir)
+        add_check(self.check_dir)
+        self.repo = mod.CheckRepo(self.check_dir)
+        os.remove(pjoin(self.check_dir, 'rule_1.bash'))
+        os.symlink(pjoin(self.check_dir, 'missing.bash'), pjoin(self.check_dir, 'rule_2.bash'))
+        #--- a file removed between listing the dir & reading it:
+        listdir = os.listdir
+        monkeypatch.setattr(mod.os, 'listdir', lambda path: listdir(path) + ['rule_3.bash'])
+        assert self.repo.refresh()
+        assert list(self.repo.repo) == ['rule_0.bash']
+        assert self.repo.get_hash('rule_2.bash') is None
+
+    def test_refresh_records_unreadable_files(self, monkeypatch):
+        add_check(self.check_dir)
+        add_check(self.check_dir)
+        get_file_hash = mod.get_file_hash
+        def denied_get_file_hash(fqfn):
+            if fqfn.endswith('rule_1.bash'):
+                raise IOError(errno.EACCES, 'Permission denied', fqfn)
+            return get_file_hash(fqfn)
+        monkeypatch.setattr(mod, 'get_file_hash', denied_get_file_hash)
+        self.repo = mod.CheckRepo(self.check_dir)
+        assert self.repo.repo['rule_0.bash']['readable']
+        assert not self.repo.repo['rule_1.bash']['readable']
+        assert self.repo.get_hash('rule_1.bash') is None
+
+        reg = FakeRegistry({'cust': {'c0': {'check_name': 'rule_0.bash', 'check_status': 'active'},
+                                     'c1': {'check_name': 'rule_1.bash', 'check_status': 'active'}}})
+        assert self.repo.preflight(reg) == ['check file is not readable: rule_1.bash']
+
+        #--- an unreadable check is retried on refresh:
+        monkeypatch.undo()
+        assert self.repo.refresh()
+        assert self.repo.preflight(reg) == []
+
+    def test_preflight(self):
+        add_check(self.check_dir)
+        add_check(self.check_dir)
+        os.chmod(pjoin(self.check_dir, 'rule_1.bash'), stat.S_IRUSR | stat.S_IWUSR)
+        self.repo = mod.CheckRepo(self.check_dir)
+
+        reg = FakeRegistry({'cust': {'c0': {'check_name': 'rule_0.bash', 'check_status': 'active'},
+                                     'c1': {'check_name': 'rule_1.bash', 'check_status': 'active'},
+                                     'c2': {'check_name': 'rule_2.bash', 'check_status': 'active'},
+                                     'c3': {'check_name': 'rule_3.bash', 'check_status': 'inactive'}}})
+        errors = self.repo.preflight(reg)
+        assert len(errors) == 2
+        assert 'not executable: rule_1.bash' in errors[0]
+        assert 'not found: rule_2.bash' in errors[1]
+
+
+
+class FakeRegistry(object):
+
+    def __init__(self, reg):
+        self.registry = reg
+
+    def get_tables(self):
+        return sorted(self.registry)
+
+    def get_table_checks(self, table):
+        return self.registry[table]
 
 
 
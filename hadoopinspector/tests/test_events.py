@@ -0,0 +1,77 @@
+#!/usr/bin/env python2
+"""
+This source code is protected by the BSD license.  See the file "LICENSE"
+in the source code root directory for the full language or refer to it here:
+   http://opensource.org/licenses/BSD-3-Clause
+Copyright 2015, 2016 Will Farmer and Ken Farmer
+"""
+
+from __future__ import division
+import sys, os, shutil
+import logging
+import tempfile, json
+from os.path import exists, isdir, isfile
+from os.path import join as pjoin
+from os.path import dirname
+import pytest
+
+sys.path.insert(0, dirname(dirname(dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, dirname(dirname(os.path.abspath(__file__))))
+
+import hadoopinspector.events as mod
+
+logging.basicConfig()
+
+
+
+class TestEventWriter(object):
+
+    def setup_method(self, method):
+        self.temp_dir    = tempfile.mkdtemp(prefix='hadinsp_')
+        self.events_fqfn = pjoin(self.temp_dir, 'events.ndjson')
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.temp_dir)
+
+    def read_events(self):
+        with open(self.events_fqfn) as f:
+            return [json.loads(line) for line in f]
+
+    def test_events(self):
+        events = mod.get_event_writer(self.events_fqfn)
+        events.emit('run_started', instance='inst1', database='db1', table_cnt=1)
+        events.emit('check_finished', table='cust', check='ck1', rc=0, violations=3)
+        #--- readable before close:
+        recs = self.read_events()
+        assert [x['event'] for x in recs] == ['run_started', 'check_finished']
+        assert recs[1]['violations'] == 3
+        assert recs[0]['run_id'] == recs[1]['run_id']
+        assert recs[0]['ts'] <= recs[1]['ts']
+        events.close()
+        events.emit('run_finished', max_rc=0)
+        assert len(self.read_events()) == 2
+
+    def test_new_run_replaces_file(self):
+        events = mod.get_event_writer(self.events_fqfn)
+        events.emit('run_started', instance='inst1', database='db1', table_cnt=1)
+        events.close()
+        inode = os.stat(self.events_fqfn).st_ino
+        with open(self.events_fqfn) as prior_run:
+            events = mod.get_event_writer(self.events_fqfn)
+            events.emit('table_started', table='cust', table_num=0, check_cnt=1)
+            events.close()
+            assert json.loads(prior_run.read())['event'] == 'run_started'
+        assert [x['event'] for x in self.read_events()] == ['table_started']
+        assert os.stat(self.events_fqfn).st_ino != inode
+
+    def test_invalid_event(self):
+        events = mod.get_event_writer(self.events_fqfn)
+        with pytest.raises(AssertionError):
+            events.emit('check_exploded')
+        events.close()
+
+    def test_null_event_writer(self):
+        events = mod.get_event_writer(None)
+        events.emit('run_started', instance='inst1')
+        events.close()
+        assert not exists(self.events_fqfn)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python2
+"""
+This source code is protected by the BSD license.  See the file "LICENSE"
+in the source code root directory for the full language or refer to it here:
+   http://opensource.org/licenses/BSD-3-Clause
+Copyright 2015, 2016 Will Farmer and Ken Farmer
+"""
+
+from __future__ import division
+import sys, os, shutil, time
+import logging, datetime, socket
+import tempfile
+from datetime import datetime as dtdt
+from pprint import pprint as pp
+from os.path import exists, isdir, isfile
+from os.path import join as pjoin
+from os.path import dirname
+
+sys.path.insert(0, dirname(dirname(dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, dirname(dirname(os.path.abspath(__file__))))
+
+import hadoopinspector.metrics as mod
+import hadoopinspector.check_results as check_results
+
+logging.basicConfig()
+
+
+
+class TestRunMetrics(object):
+
+    def setup_method(self, method):
+        self.temp_dir = tempfile.mkdtemp(prefix='hadinsp_')
+        self.metrics  = mod.RunMetrics()
+        with self.metrics.timer('registry_load'):
+            time.sleep(0.01)
+        self.metrics.add_time('check_spawn', 0.5)
+        self.metrics.add_time('check_spawn', 0.25)
+
+        results  = check_results.CheckResults('inst1', 'db1', pjoin(self.temp_dir, 'results.sqlite'))
+        start_dt = dtdt.utcnow()
+        results.add('cust', 'ck1', 0, 0, run_start_timestamp=start_dt, run_stop_timestamp=start_dt)
+        results.add('cust', 'ck2', '3', 0, run_start_timestamp=start_dt, run_stop_timestamp=start_dt)
+        results.add('cust', 'ck3', 0, 4, run_start_timestamp=start_dt, run_stop_timestamp=start_dt)
+        results.add('cust', 'ck4', check_status='inactive',
+                    run_start_timestamp=start_dt, run_stop_timestamp=start_dt)
+        self.metrics.count_outcomes(results)
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.temp_dir)
+
+    def test_phases_and_outcomes(self):
+        assert self.metrics.phase_secs['registry_load'] >= 0.01
+        assert self.metrics.phase_secs['check_spawn'] == 0.75
+        assert self.metrics.phase_calls['check_spawn'] == 2
+        assert dict(self.metrics.outcomes) == {'passed': 1, 'violations': 1, 'failed': 1, 'inactive': 1}
+        assert self.metrics.max_rc == 4
+
+    def test_prometheus_textfile(self):
+        prom_fqfn = pjoin(self.temp_dir, 'runner.prom')
+        mod.write_prometheus_textfile(self.metrics, prom_fqfn, {'instance': 'inst1', 'database': 'db"1'})
+        assert sorted(os.listdir(self.temp_dir)) == ['results.sqlite', 'runner.prom']
+        with open(prom_fqfn) as f:
+            lines = f.read().splitlines()
+        assert '# TYPE hadoopinspector_runner_phase_seconds gauge' in lines
+        assert ('hadoopinspector_runner_phase_seconds{database="db\\"1",instance="inst1",phase="check_spawn"} 0.75'
+                in lines)
+        assert ('hadoopinspector_runner_phase_calls{database="db\\"1",instance="inst1",phase="check_spawn"} 2'
+                in lines)
+        assert 'hadoopinspector_runner_checks{database="db\\"1",instance="inst1",outcome="failed"} 1' in lines
+        assert 'hadoopinspector_runner_max_rc{database="db\\"1",instance="inst1"} 4' in lines
+
+    def test_statsd(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+        try:
+            mod.send_statsd(self.metrics, '127.0.0.1', server.getsockname()[1])
+            stats = server.recv(65536).decode('utf-8').split('\n')
+        finally:
+            server.close()
+        assert 'hadoopinspector.runner.phase.check_spawn:750|ms' in stats
+        assert 'hadoopinspector.runner.phase_calls.check_spawn:2|c' in stats
+        assert 'hadoopinspector.runner.checks.violations:1|c' in stats
+
+    def test_statsd_packets_are_bounded(self):
+        stats = ['stat_%04d:1|c' % x for x in range(1000)]
+        packets = list(mod._get_statsd_packets(stats))
+        assert len(packets) > 1
+        assert all(len(x) <= mod.MAX_STATSD_PACKET_BYTES for x in packets)
+        assert sum(len(x.split('\n')) for x in packets) == 1000
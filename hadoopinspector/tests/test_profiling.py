@@ -0,0 +1,69 @@
+#!/usr/bin/env python2
+"""
+This source code is protected by the BSD license.  See the file "LICENSE"
+in the source code root directory for the full language or refer to it here:
+   http://opensource.org/licenses/BSD-3-Clause
+Copyright 2015, 2016 Will Farmer and Ken Farmer
+"""
+
+from __future__ import division
+import sys, os, shutil, time
+import logging, signal
+import tempfile, pstats
+from pprint import pprint as pp
+from os.path import exists, isdir, isfile, basename
+from os.path import join as pjoin
+from os.path import dirname
+
+sys.path.insert(0, dirname(dirname(dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, dirname(dirname(os.path.abspath(__file__))))
+
+import hadoopinspector.profiling as mod
+
+logging.basicConfig()
+
+
+
+def burn_cpu(secs):
+    stop_time = time.time() + secs
+    total = 0
+    while time.time() < stop_time:
+        total += sum(range(1000))
+    return total
+
+
+
+class TestRunProfiler(object):
+
+    def setup_method(self, method):
+        self.temp_dir = tempfile.mkdtemp(prefix='hadinsp_')
+        self.profiler = mod.RunProfiler(self.temp_dir, sample_secs=0.001)
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.temp_dir)
+
+    def test_reports(self):
+        self.profiler.start()
+        burn_cpu(0.3)
+        written = self.profiler.stop()
+
+        assert sorted(os.listdir(self.temp_dir)) == sorted(basename(x) for x in written)
+        assert [basename(x).split('.', 1)[1] for x in written] == ['pstats', 'pstats.txt',
+                                                                  'collapsed', 'allocations.txt']
+        stats = pstats.Stats(written[0])
+        assert any(func[2] == 'burn_cpu' for func in stats.stats)
+
+        with open(written[2]) as f:
+            stacks = [line.rsplit(' ', 1) for line in f.read().splitlines()]
+        assert stacks
+        assert all(int(cnt) > 0 for (stack, cnt) in stacks)
+        assert any('burn_cpu (test_profiling.py:' in stack for (stack, cnt) in stacks)
+
+        with open(written[3]) as f:
+            assert 'top %d' % mod.DEFAULT_TOP_CNT in f.read()
+
+    def test_signal_handler_restored(self):
+        prior_handler = signal.getsignal(signal.SIGPROF)
+        self.profiler.start()
+        self.profiler.stop()
+        assert signal.getsignal(signal.SIGPROF) == prior_handler
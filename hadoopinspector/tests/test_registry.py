@@ -61,6 +61,122 @@ class TestRegistry(object):
         #reg.validate_file(pjoin(self.temp_dir, 'registry.json'))
         reg.validate_file(pjoin(self.temp_dir))
 
+    def test_loading_good_registry_skips_demjson(self, monkeypatch):
+        def fail_decode(*args, **kwargs):
+            raise AssertionError('demjson should only be used after a json error')
+        monkeypatch.setattr(mod.demjson, 'decode', fail_decode)
+        good_data = {"asset": {"rule_pk1": {"check_type": "rule",
+                                            "check_name": "rule_uniqueness"}}}
+        with open(pjoin(self.temp_dir, 'registry.json'), 'w') as f:
+            json.dump(good_data, f)
+        reg = mod.Registry()
+        reg.load_registry(pjoin(self.temp_dir, 'registry.json'))
+        assert reg.registry == good_data
+
+    def test_loading_registry_with_duplicate_check(self):
+        with open(pjoin(self.temp_dir, 'registry.json'), 'w') as f:
+            f.write('{"asset": {"rule_pk1": {"check_type": "rule", "check_name": "rule_uniqueness"},\n'
+                    '           "rule_pk1": {"check_type": "rule", "check_name": "rule_foreign_key"}}}')
+        reg = mod.Registry()
+        with pytest.raises(SystemExit):
+            reg.load_registry(pjoin(self.temp_dir, 'registry.json'))
+
+    def test_compiled_registry_cache(self, monkeypatch):
+        reg1 = mod.Registry()
+        reg1.add_check('asset', 'rule_pk1',
+               check_name='rule_uniqueness', check_status='active',
+               check_type='rule', check_mode='full', check_scope='row')
+        reg_fqfn = reg1.write(pjoin(self.temp_dir, 'registry.json'))
+        cache_dir = tempfile.mkdtemp(dir=self.temp_dir)
+
+        reg2 = mod.Registry()
+        reg2.load_compiled_registry(reg_fqfn, cache_dir)
+        assert reg2.validated
+        assert len(os.listdir(cache_dir)) == 1
+
+        #--- second load must come from the cache without any validation:
+        def fail_validate(*args, **kwargs):
+            raise AssertionError('cached registry should not be revalidated')
+        monkeypatch.setattr(mod.Registry, 'validate', fail_validate)
+        reg3 = mod.Registry()
+        reg3.load_compiled_registry(reg_fqfn, cache_dir)
+        assert reg3.validated
+        assert reg3.registry == reg2.registry
+        monkeypatch.undo()
+
+        #--- a changed registry file must miss the cache & replace the old entry:
+        reg1.add_check('asset', 'rule_fk1',
+               check_name='rule_foreign_key', check_status='active',
+               check_type='rule', check_mode='full', check_scope='row')
+        reg1.write(reg_fqfn)
+        reg4 = mod.Registry()
+        reg4.load_compiled_registry(reg_fqfn, cache_dir)
+        assert 'rule_fk1' in reg4.registry['asset']
+        assert len(os.listdir(cache_dir)) == 1
+
+    def test_compiled_registry_cache_keyed_by_path(self):
+        cache_dir = tempfile.mkdtemp(dir=self.temp_dir)
+        reg_fqfns = []
+        for table in ('asset', 'cust'):
+            reg1 = mod.Registry()
+            reg1.add_check(table, 'rule_pk1',
+                   check_name='rule_uniqueness', check_status='active',
+                   check_type='rule', check_mode='full', check_scope='row')
+            reg_dir = tempfile.mkdtemp(dir=self.temp_dir)
+            reg_fqfns.append(reg1.write(pjoin(reg_dir, 'registry.json')))
+            reg2 = mod.Registry()
+            reg2.load_compiled_registry(reg_fqfns[-1], cache_dir)
+
+        #--- a same-named registry in another dir must not evict the first's cache entry:
+        assert len(os.listdir(cache_dir)) == 2
+        for reg_fqfn, table in zip(reg_fqfns, ('asset', 'cust')):
+            reg3 = mod.Registry()
+            reg3.load_compiled_registry(reg_fqfn, cache_dir)
+            assert list(reg3.registry) == [table]
+        assert len(os.listdir(cache_dir)) == 2
+
+    def _create_sharded_registry(self):
+        reg1 = mod.Registry()
+        for table in ('asset', 'cust', 'event'):
+            reg1.add_check(table, 'rule_pk1',
+                   check_name='rule_uniqueness', check_status='active',
+                   check_type='rule', check_mode='full', check_scope='row')
+        index_fqfn = reg1.write_sharded(pjoin(self.temp_dir, 'index.json'))
+        return reg1, index_fqfn
+
+    def test_sharded_registry_loads_only_filtered_tables(self):
+        reg1, index_fqfn = self._create_sharded_registry()
+        reg2 = mod.Registry()
+        reg2.load_registry(index_fqfn)
+        assert sorted(reg2.registry) == ['asset', 'cust', 'event']
+        assert reg2.registry.loaded == {}
+        shards = reg2.registry
+        reg2.filter_registry('cust')
+        reg2.default()
+        reg2.validate()
+        assert list(shards.loaded) == ['cust']
+        assert reg2.registry == {'cust': reg1.registry['cust']}
+
+    def test_sharded_registry_loads_everything_unfiltered(self):
+        reg1, index_fqfn = self._create_sharded_registry()
+        reg2 = mod.Registry()
+        reg2.load_registry(index_fqfn)
+        reg2.filter_registry()
+        reg2.default()
+        reg2.validate()
+        assert reg2.registry == reg1.registry
+
+    def test_sharded_compiled_registry_cache(self):
+        reg1, index_fqfn = self._create_sharded_registry()
+        cache_dir = tempfile.mkdtemp(dir=self.temp_dir)
+        reg2 = mod.Registry()
+        reg2.load_compiled_registry(index_fqfn, cache_dir)
+        reg2.filter_registry('asset')
+        assert reg2.validated
+        assert reg2.registry == {'asset': reg1.registry['asset']}
+        # only the index & the one shard accessed get compiled:
+        assert len(os.listdir(cache_dir)) == 2
+
     def test_loading_bad_registry_extra_comma(self):
         # extra comma before last field in registry
         bad_data = ("""{"asset": {"rule_pk1": {"check_type": "rule", """
@@ -139,6 +255,23 @@ class TestRegistry(object):
 
         assert reg1.registry == reg2.registry
 
+    def test_creating_then_loading_with_description(self):
+        reg1 = mod.Registry()
+        reg1.add_table('asset')
+        reg1.add_check('asset', 'rule_pk1',
+               check_name='rule_uniqueness',
+               check_status='active',
+               check_type='rule',
+               check_mode='full',
+               check_scope='row',
+               check_description='asset ids are unique')
+        reg1.write(pjoin(self.temp_dir, 'registry.json'))
+        reg1.validate_file(pjoin(self.temp_dir, 'registry.json'))
+
+        reg2 = mod.Registry()
+        reg2.load_registry(pjoin(self.temp_dir, 'registry.json'))
+        assert reg2.registry['asset']['rule_pk1']['check_description'] == 'asset ids are unique'
+
     def test_validating_bad_check(self):
         reg1 = mod.Registry()
         reg1.add_table('asset')
@@ -273,6 +406,147 @@ class TestRegistry(object):
         assert 'rule_pk1' in reg1.registry['cust']
         assert 'asset' not in reg1.registry
 
+    def _create_tagged_registry(self):
+        reg1 = mod.Registry()
+        for table in ('asset', 'asset_type', 'cust'):
+            reg1.add_check(table, 'rule_pk1',
+                   check_name='rule_uniqueness', check_status='active',
+                   check_type='rule', check_mode='full', check_scope='row',
+                   check_tags=['severity:low', 'pk'])
+            reg1.add_check(table, 'rule_fk1',
+                   check_name='rule_foreign_key', check_status='active',
+                   check_type='rule', check_mode='full', check_scope='row',
+                   check_tags=['severity:high' if table == 'asset' else 'severity:low', 'fk'])
+        return reg1
+
+    def test_filter_registry_with_table_list_and_glob(self):
+        reg1 = self._create_tagged_registry()
+        reg1.filter_registry(['cust', 'asset_*'])
+        assert sorted(reg1.registry) == ['asset_type', 'cust']
+
+    def test_filter_registry_with_check_glob(self):
+        reg1 = self._create_tagged_registry()
+        reg1.filter_registry('asset*', 'rule_f*')
+        assert sorted(reg1.registry) == ['asset', 'asset_type']
+        assert list(reg1.registry['asset']) == ['rule_fk1']
+
+    def test_filter_registry_with_tags(self):
+        reg1 = self._create_tagged_registry()
+        reg1.filter_registry(filter_tag=['severity:high', 'fk'])
+        assert reg1.registry == {'asset': {'rule_fk1': reg1.registry['asset']['rule_fk1']}}
+
+    def test_filter_registry_with_tag_glob(self):
+        reg1 = self._create_tagged_registry()
+        reg1.filter_registry(filter_check='rule_pk1', filter_tag='severity:*')
+        assert sorted(reg1.registry) == ['asset', 'asset_type', 'cust']
+        reg1.validate()
+
+    def test_filter_sharded_registry_with_tags_from_index(self):
+        reg1 = self._create_tagged_registry()
+        index_fqfn = reg1.write_sharded(pjoin(self.temp_dir, 'index.json'))
+        reg2 = mod.Registry()
+        reg2.load_registry(index_fqfn)
+        shards = reg2.registry
+        reg2.filter_registry(filter_tag='severity:high')
+        assert list(shards.loaded) == ['asset']
+        assert list(reg2.registry['asset']) == ['rule_fk1']
+
+    def test_filter_sharded_registry_with_edited_shard(self):
+        reg1 = self._create_tagged_registry()
+        index_fqfn = reg1.write_sharded(pjoin(self.temp_dir, 'index.json'))
+        #--- shards may be edited without rewriting the index:
+        cust_fqfn = pjoin(self.temp_dir, 'cust.json')
+        with open(cust_fqfn) as f:
+            cust_reg = json.load(f)
+        del cust_reg['rule_pk1']
+        cust_reg['rule_fk1']['check_tags'] = ['severity:high']
+        with open(cust_fqfn, 'w') as f:
+            json.dump(cust_reg, f)
+
+        reg2 = mod.Registry()
+        reg2.load_registry(index_fqfn)
+        shards = reg2.registry
+        reg2.filter_registry(filter_check='rule_*', filter_tag='severity:high')
+        assert sorted(shards.loaded) == ['asset', 'cust']
+        assert sorted(reg2.registry) == ['asset', 'cust']
+        assert list(reg2.registry['cust']) == ['rule_fk1']
+
+        reg3 = mod.Registry()
+        reg3.load_registry(index_fqfn)
+        reg3.filter_registry(filter_check='rule_pk1')
+        assert 'cust' not in reg3.registry
+
+    def _write_templated_registry(self, overrides=None):
+        templated_data = {
+            "hapinsp_templates": [
+                {"table_pattern": "cust*",
+                 "tables": ["asset"],
+                 "checks": {"rule_pk1":    {"check_name": "rule_uniqueness",
+                                            "hapinsp_checkcustom_cols": "id",
+                                            "check_tags": ["pk"]},
+                            "stats_exist": {"check_name": "stats_exist",
+                                            "check_tags": ["stats"]}},
+                 "overrides": overrides or {"asset": {"rule_pk1": {"hapinsp_checkcustom_cols": "asset_id"}}}}
+            ],
+            "cust": {},
+            "cust_type": {},
+            "event": {"rule_fk1": {"check_name": "rule_foreign_key"}},
+            "asset": {"stats_exist": {"check_name": "stats_exist_custom"}}
+        }
+        fqfn = pjoin(self.temp_dir, 'registry.json')
+        with open(fqfn, 'w') as f:
+            json.dump(templated_data, f)
+        return fqfn
+
+    def test_templates_expand_per_table(self):
+        reg1 = mod.Registry()
+        reg1.load_registry(self._write_templated_registry())
+        reg1.filter_registry()
+        reg1.default()
+        reg1.validate()
+        assert reg1.get_tables() == ['asset', 'cust', 'cust_type', 'event']
+        asset = reg1.get_table_checks('asset')
+        assert asset['rule_pk1']['hapinsp_checkcustom_cols'] == 'asset_id'
+        assert asset['stats_exist']['check_name'] == 'stats_exist_custom'  # table def wins
+        cust = reg1.get_table_checks('cust_type')
+        assert cust['rule_pk1']['hapinsp_checkcustom_cols'] == 'id'
+        assert cust['rule_pk1']['check_mode'] == 'full'                    # defaulted
+        assert list(reg1.get_table_checks('event')) == ['rule_fk1']
+        assert reg1.get_table_checks('unknown') == {}
+
+    def test_templates_are_filtered_without_expansion(self):
+        reg1 = mod.Registry()
+        reg1.load_registry(self._write_templated_registry())
+        reg1.filter_registry(['cust', 'asset'], filter_tag='pk')
+        assert reg1.get_tables() == ['asset', 'cust']
+        assert list(reg1.get_table_checks('cust')) == ['rule_pk1']
+        assert reg1.get_table_checks('asset')['rule_pk1']['hapinsp_checkcustom_cols'] == 'asset_id'
+
+    def test_templates_with_bad_override(self):
+        reg1 = mod.Registry()
+        reg1.load_registry(self._write_templated_registry(
+                               {"asset": {"rule_pk1": {"check_mode": "fullish"}}}))
+        reg1.default()
+        with pytest.raises(SystemExit):
+            reg1.validate()
+
+    def test_templates_with_override_of_unknown_check(self):
+        reg1 = mod.Registry()
+        reg1.load_registry(self._write_templated_registry(
+                               {"asset": {"rule_fk9": {"check_status": "inactive"}}}))
+        reg1.default()
+        with pytest.raises(SystemExit):
+            reg1.validate()
+
+    def test_templates_in_compiled_registry(self):
+        fqfn = self._write_templated_registry()
+        cache_dir = tempfile.mkdtemp(dir=self.temp_dir)
+        for _ in range(2):   # miss then hit
+            reg1 = mod.Registry()
+            reg1.load_compiled_registry(fqfn, cache_dir)
+            assert reg1.get_table_checks('cust')['rule_pk1']['check_mode'] == 'full'
+            assert reg1.get_table_checks('asset')['rule_pk1']['hapinsp_checkcustom_cols'] == 'asset_id'
+
     def test_validation(self):
         reg1 = mod.Registry()
         with open(pjoin(self.temp_dir, 'registry.json'), 'w') as f:
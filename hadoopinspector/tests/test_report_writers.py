@@ -0,0 +1,84 @@
+#!/usr/bin/env python2
+"""
+This source code is protected by the BSD license.  See the file "LICENSE"
+in the source code root directory for the full language or refer to it here:
+   http://opensource.org/licenses/BSD-3-Clause
+Copyright 2015, 2016 Will Farmer and Ken Farmer
+"""
+
+from __future__ import division
+import sys, os, shutil
+import logging, datetime
+import tempfile, json, csv
+from datetime import datetime as dtdt
+from pprint import pprint as pp
+from os.path import exists, isdir, isfile
+from os.path import join as pjoin
+from os.path import dirname
+
+sys.path.insert(0, dirname(dirname(dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, dirname(dirname(os.path.abspath(__file__))))
+
+import hadoopinspector.report_writers as mod
+import hadoopinspector.check_results as check_results
+
+logging.basicConfig()
+
+
+
+class TestReportWriters(object):
+
+    def setup_method(self, method):
+        self.temp_dir    = tempfile.mkdtemp(prefix="hadinsp_")
+        self.report_fqfn = pjoin(self.temp_dir, 'report.out')
+        self.db_fqfn     = pjoin(self.temp_dir, 'results.sqlite')
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.temp_dir)
+
+    def add_checks(self, report_format, check_cnt):
+        writer  = mod.get_report_writer(report_format, self.report_fqfn)
+        results = check_results.CheckResults('inst1', 'db1', self.db_fqfn, report_writer=writer)
+        start_dt = dtdt.utcnow() - datetime.timedelta(minutes=1)
+        stop_dt  = dtdt.utcnow()
+        for check_id in range(check_cnt):
+            results.add('customer', 'check_%d' % check_id, 3, 0,
+                        run_start_timestamp=start_dt,
+                        run_stop_timestamp=stop_dt)
+        return writer
+
+    def test_ndjson_is_written_as_checks_complete(self):
+        writer = self.add_checks('ndjson', 2)
+        # records must be readable before the writer is closed:
+        with open(self.report_fqfn) as f:
+            recs = [json.loads(line) for line in f]
+        assert len(recs) == 2
+        assert recs[0]['check'] == 'check_0'
+        assert recs[0]['violation_cnt'] == 3
+        assert recs[0]['instance'] == 'inst1'
+        writer.close()
+
+    def test_json(self):
+        writer = self.add_checks('json', 3)
+        writer.close()
+        with open(self.report_fqfn) as f:
+            recs = json.load(f)
+        assert len(recs) == 3
+        assert recs[2]['check'] == 'check_2'
+        assert recs[2]['table'] == 'customer'
+
+    def test_json_without_records(self):
+        writer = self.add_checks('json', 0)
+        writer.close()
+        with open(self.report_fqfn) as f:
+            assert json.load(f) == []
+
+    def test_csv(self):
+        writer = self.add_checks('csv', 2)
+        writer.close()
+        with open(self.report_fqfn) as f:
+            recs = list(csv.DictReader(f))
+        assert len(recs) == 2
+        assert recs[1]['check'] == 'check_1'
+        assert recs[1]['rc'] == '0'
+        assert recs[1]['data_start_timestamp'] == ''
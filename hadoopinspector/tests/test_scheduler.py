@@ -0,0 +1,186 @@
+#!/usr/bin/env python2
+"""
+This source code is protected by the BSD license.  See the file "LICENSE"
+in the source code root directory for the full language or refer to it here:
+   http://opensource.org/licenses/BSD-3-Clause
+Copyright 2015, 2016 Will Farmer and Ken Farmer
+"""
+
+from __future__ import division
+import sys, os, shutil
+import logging, datetime
+import tempfile, json
+from datetime import datetime as dtdt
+from pprint import pprint as pp
+from os.path import exists, isdir, isfile, basename
+from os.path import join as pjoin
+from os.path import dirname
+import pytest
+import sqlite3
+
+sys.path.insert(0, dirname(dirname(dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, dirname(dirname(os.path.abspath(__file__))))
+
+import hadoopinspector.scheduler as mod
+import hadoopinspector.registry as registry
+import hadoopinspector.tests.test_tooling as testtooling
+
+logging.basicConfig()
+
+formatter_fqfn = pjoin(dirname(dirname(dirname(os.path.abspath(__file__)))), 'scripts', 'hapinsp_formatter.py')
+
+
+
+class TestCronSchedule(object):
+
+    def test_every_minute(self):
+        cron = mod.CronSchedule('* * * * *')
+        assert cron.matches(dtdt(2016, 3, 4, 5, 6))
+        assert cron.get_next_run(dtdt(2016, 3, 4, 5, 6, 30)) == dtdt(2016, 3, 4, 5, 7)
+
+    def test_lists_ranges_and_steps(self):
+        cron = mod.CronSchedule('0,30 9-17/4 * * *')
+        assert cron.hours == {9, 13, 17}
+        assert cron.matches(dtdt(2016, 3, 4, 13, 30))
+        assert not cron.matches(dtdt(2016, 3, 4, 14, 30))
+        assert cron.get_next_run(dtdt(2016, 3, 4, 17, 30)) == dtdt(2016, 3, 5, 9, 0)
+
+    def test_weekday(self):
+        cron = mod.CronSchedule('15 2 * * 7')    # 2016-03-06 is a sunday
+        assert cron.get_next_run(dtdt(2016, 3, 1)) == dtdt(2016, 3, 6, 2, 15)
+
+    def test_day_or_weekday(self):
+        cron = mod.CronSchedule('0 0 1 * 1')     # 2016-03-07 is a monday
+        assert cron.get_next_run(dtdt(2016, 3, 1, 12)) == dtdt(2016, 3, 7)
+        assert cron.get_next_run(dtdt(2016, 3, 28, 12)) == dtdt(2016, 4, 1)
+
+    def test_alias_and_year_end(self):
+        cron = mod.CronSchedule('@yearly')
+        assert cron.get_next_run(dtdt(2016, 3, 1)) == dtdt(2017, 1, 1)
+
+    def test_leap_day(self):
+        cron = mod.CronSchedule('0 0 29 2 *')
+        assert cron.get_next_run(dtdt(2016, 3, 1)) == dtdt(2020, 2, 29)
+
+    def test_invalid(self):
+        for expr in ('* * * *', '60 * * * *', '*/0 * * * *', 'a * * * *', '5-1 * * * *'):
+            with pytest.raises(ValueError):
+                mod.CronSchedule(expr)
+        with pytest.raises(ValueError):
+            mod.CronSchedule('0 0 31 2 *').get_next_run(dtdt(2016, 1, 1))
+
+
+
+class TestScheduler(object):
+
+    def setup_method(self, method):
+        self.temp_dir  = tempfile.mkdtemp(prefix='hadinsp_')
+        self.check_dir = pjoin(self.temp_dir, 'checks')
+        self.log_dir   = pjoin(self.temp_dir, 'logs')
+        os.mkdir(self.check_dir)
+        os.mkdir(self.log_dir)
+        self.registry_fqfn = pjoin(self.temp_dir, 'registry.json')
+        self.schedule_fqfn = pjoin(self.temp_dir, 'schedule.json')
+        self.results_fqfn  = pjoin(self.temp_dir, 'results.sqlite')
+        self.start_dt = dtdt(2016, 3, 4, 5, 0, 30)
+        for table in ('cust', 'asset'):
+            check_fqfn = testtooling.add_check(self.check_dir, table, rc=0, out_count=2,
+                                               formatter_fqfn=formatter_fqfn)
+            testtooling.add_to_registry(self.registry_fqfn, 'inst1', 'db1', table,
+                                        self.check_dir, check_fqfn)
+        self.scheduler = mod.Scheduler(self.check_dir, self.log_dir,
+                                       results_filename=self.results_fqfn)
+
+    def teardown_method(self, method):
+        self.scheduler.close()
+        shutil.rmtree(self.temp_dir)
+
+    def write_schedule(self, jobs):
+        with open(self.schedule_fqfn, 'w') as outfile:
+            json.dump({'jobs': jobs}, outfile)
+
+    def get_result_cnts(self):
+        conn = sqlite3.connect(self.results_fqfn)
+        cur  = conn.cursor()
+        cur.execute("SELECT table_name, count(*) FROM check_results GROUP BY table_name")
+        results = dict(cur.fetchall())
+        conn.close()
+        return results
+
+    def test_run_pending(self):
+        self.write_schedule([{'name': 'hourly', 'schedule': '0 * * * *', 'instance': 'inst1',
+                              'database': 'db1', 'registry_filename': 'registry.json'},
+                             {'name': 'cust_only', 'schedule': '*/15 * * * *', 'instance': 'inst1',
+                              'database': 'db1', 'registry_filename': 'registry.json',
+                              'table': ['cu*']}])
+        assert self.scheduler.load_schedule(self.schedule_fqfn, now=self.start_dt)
+        assert not self.scheduler.load_schedule(self.schedule_fqfn, now=self.start_dt)
+
+        assert self.scheduler.run_pending(dtdt(2016, 3, 4, 5, 5)) == {}
+        assert self.scheduler.run_pending(dtdt(2016, 3, 4, 5, 15)) == {'cust_only': 0}
+        assert self.get_result_cnts() == {'cust': 1}
+        assert self.scheduler.run_pending(dtdt(2016, 3, 4, 6, 0)) == {'cust_only': 0, 'hourly': 0}
+        assert self.get_result_cnts() == {'cust': 3, 'asset': 1}
+
+    def test_registry_stays_warm_until_changed(self):
+        reg1 = self.scheduler.get_registry(self.registry_fqfn)
+        assert reg1.validated
+        assert self.scheduler.get_registry(self.registry_fqfn) is reg1
+
+        check_fqfn = testtooling.add_check(self.check_dir, 'cust', rc=0, out_count=0,
+                                           formatter_fqfn=formatter_fqfn)
+        testtooling.add_to_registry(self.registry_fqfn, 'inst1', 'db1', 'cust',
+                                    self.check_dir, check_fqfn)
+        reg2 = self.scheduler.get_registry(self.registry_fqfn)
+        assert reg2 is not reg1
+        assert len(reg2.registry['cust']) == 2
+
+    def test_sharded_registry_reloaded_when_shard_changes(self):
+        reg = registry.Registry()
+        reg.load_registry(self.registry_fqfn)
+        index_fqfn = reg.write_sharded(pjoin(self.temp_dir, 'index.json'))
+        reg1 = self.scheduler.get_registry(index_fqfn)
+        assert len(reg1.registry['cust']) == 1
+        assert self.scheduler.get_registry(index_fqfn) is reg1
+
+        cust_reg = dict(reg1.registry['cust'])
+        cust_reg['rule_extra'] = dict(cust_reg.values()[0])
+        with open(pjoin(self.temp_dir, 'cust.json'), 'w') as outfile:
+            json.dump(cust_reg, outfile)
+        reg2 = self.scheduler.get_registry(index_fqfn)
+        assert reg2 is not reg1
+        assert len(reg2.registry['cust']) == 2
+
+    def test_filtered_runs_do_not_change_warm_registry(self):
+        self.write_schedule([{'name': 'asset_only', 'schedule': '* * * * *', 'instance': 'inst1',
+                              'database': 'db1', 'registry_filename': 'registry.json',
+                              'table': ['asset']}])
+        self.scheduler.load_schedule(self.schedule_fqfn, now=self.start_dt)
+        self.scheduler.run_pending(dtdt(2016, 3, 4, 5, 1))
+        assert sorted(self.scheduler.get_registry(self.registry_fqfn).get_tables()) == ['asset', 'cust']
+
+    def test_preflight_failure_skips_job(self):
+        self.write_schedule([{'name': 'hourly', 'schedule': '0 * * * *', 'instance': 'inst1',
+                              'database': 'db1', 'registry_filename': 'registry.json'}])
+        self.scheduler.load_schedule(self.schedule_fqfn, now=self.start_dt)
+        os.remove(pjoin(self.check_dir, 'check_cust_0.bash'))
+        assert self.scheduler.run_pending(dtdt(2016, 3, 4, 6, 0)) == {'hourly': 1}
+        assert self.scheduler.next_runs['hourly'] > dtdt(2016, 3, 4, 6, 0)
+
+    def test_job_error_does_not_stop_scheduler(self):
+        self.write_schedule([{'name': 'hourly', 'schedule': '0 * * * *', 'instance': 'inst1',
+                              'database': 'db1', 'registry_filename': 'registry.json'},
+                             {'name': 'cust_only', 'schedule': '0 * * * *', 'instance': 'inst1',
+                              'database': 'db1', 'registry_filename': 'registry.json',
+                              'table': ['cust']}])
+        self.scheduler.load_schedule(self.schedule_fqfn, now=self.start_dt)
+        def failing_get_check_results(results_fqfn, instance, database):
+            raise IOError('results db unavailable')
+        self.scheduler.get_check_results = failing_get_check_results
+        assert self.scheduler.run_pending(dtdt(2016, 3, 4, 6, 0)) == {'hourly': 1, 'cust_only': 1}
+        assert self.scheduler.next_runs == {'hourly': dtdt(2016, 3, 4, 7, 0), 'cust_only': dtdt(2016, 3, 4, 7, 0)}
+
+    def test_invalid_schedule(self):
+        self.write_schedule([{'name': 'hourly', 'schedule': '0 * * * *', 'instance': 'inst1'}])
+        with pytest.raises(ValueError):
+            self.scheduler.load_schedule(self.schedule_fqfn)
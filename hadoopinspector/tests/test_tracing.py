@@ -0,0 +1,92 @@
+#!/usr/bin/env python2
+"""
+This source code is protected by the BSD license.  See the file "LICENSE"
+in the source code root directory for the full language or refer to it here:
+   http://opensource.org/licenses/BSD-3-Clause
+Copyright 2015, 2016 Will Farmer and Ken Farmer
+"""
+
+from __future__ import division
+import sys, os, shutil
+import logging, threading
+import tempfile, json
+from pprint import pprint as pp
+from os.path import exists, isdir, isfile
+from os.path import join as pjoin
+from os.path import dirname
+import pytest
+
+sys.path.insert(0, dirname(dirname(dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, dirname(dirname(os.path.abspath(__file__))))
+
+import hadoopinspector.tracing as mod
+
+logging.basicConfig()
+
+
+
+class TestTraceWriter(object):
+
+    def setup_method(self, method):
+        self.temp_dir   = tempfile.mkdtemp(prefix='hadinsp_')
+        self.trace_fqfn = pjoin(self.temp_dir, 'trace.json')
+        self.tracer     = mod.get_tracer(self.trace_fqfn)
+
+    def teardown_method(self, method):
+        self.tracer.close()
+        shutil.rmtree(self.temp_dir)
+
+    def get_spans(self, events):
+        return [x for x in events if x['ph'] == 'X']
+
+    def test_spans(self):
+        with self.tracer.span('run', 'run'):
+            with self.tracer.span('cust', 'table', table='cust'):
+                with self.tracer.span('ck1', 'check', table='cust', check='ck1') as span_args:
+                    span_args['rc'] = 0
+        self.tracer.close()
+        with open(self.trace_fqfn) as f:
+            spans = self.get_spans(json.load(f))
+        assert [x['name'] for x in spans] == ['ck1', 'cust', 'run']
+        assert spans[0]['args'] == {'table': 'cust', 'check': 'ck1', 'rc': 0, 'worker_id': 1}
+        assert spans[0]['cat'] == 'check'
+        assert spans[2]['ts'] <= spans[0]['ts']
+        assert spans[2]['ts'] + spans[2]['dur'] >= spans[0]['ts'] + spans[0]['dur']
+
+    def test_readable_before_close(self):
+        with self.tracer.span('ck1', 'check'):
+            pass
+        with open(self.trace_fqfn) as f:
+            events = json.loads(f.read() + ']')
+        assert len(self.get_spans(events)) == 1
+
+    def test_span_recorded_on_exception(self):
+        with pytest.raises(ValueError):
+            with self.tracer.span('ck1', 'check'):
+                raise ValueError
+        self.tracer.close()
+        with open(self.trace_fqfn) as f:
+            assert len(self.get_spans(json.load(f))) == 1
+
+    def test_workers(self):
+        def run_check(check):
+            with self.tracer.span(check, 'check'):
+                pass
+        threads = [threading.Thread(target=run_check, args=('ck%d' % x,), name='worker-%d' % x)
+                   for x in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.tracer.close()
+        with open(self.trace_fqfn) as f:
+            events = json.load(f)
+        assert len({x['tid'] for x in self.get_spans(events)}) == 3
+        thread_names = {x['args']['name'] for x in events if x['name'] == 'thread_name'}
+        assert thread_names == {'worker-0', 'worker-1', 'worker-2'}
+
+    def test_null_tracer(self):
+        tracer = mod.get_tracer(None)
+        with tracer.span('ck1', 'check', table='cust') as span_args:
+            span_args['rc'] = 0
+        tracer.close()
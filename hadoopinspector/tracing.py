@@ -0,0 +1,107 @@
+#!/usr/bin/env python2
+"""
+This source code is protected by the BSD license.  See the file "LICENSE"
+in the source code root directory for the full language or refer to it here:
+   http://opensource.org/licenses/BSD-3-Clause
+Copyright 2015, 2016 Will Farmer and Ken Farmer
+"""
+
+import os, sys, time, threading
+import json, contextlib
+
+
+
+def get_tracer(fqfn=None, process_name='hadoopinspector_runner'):
+    """ Returns a TraceWriter for fqfn - or a NullTracer if fqfn is None.
+    """
+    if fqfn is None:
+        return NullTracer()
+    return TraceWriter(fqfn, process_name)
+
+
+
+class TraceWriter(object):
+    """ Writes spans as Chrome trace events - which open in chrome://tracing,
+        Perfetto, speedscope and other trace viewers.
+
+    Each span is written, and flushed, as it completes - so the trace of a
+    run that is still going, or that died, can still be opened: the trace
+    format allows the closing bracket of the event array to be missing.
+    Spans carry the worker id - a small integer per thread - as their tid,
+    so parallel workers appear as separate tracks.
+    """
+
+    def __init__(self, fqfn, process_name='hadoopinspector_runner'):
+        self.fqfn    = fqfn
+        self.pid     = os.getpid()
+        self.lock    = threading.Lock()
+        self.worker_cnt = 0
+        self.local   = threading.local()
+        self.event_cnt = 0
+        self.outfile = open(fqfn, 'w')
+        self.outfile.write('[')
+        self._write_event({'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'tid': 0,
+                           'args': {'name': process_name}})
+
+    def get_worker_id(self):
+        """ Returns the worker id of the current thread - registering it,
+            with its thread name, on first use.
+        """
+        worker_id = getattr(self.local, 'worker_id', None)
+        if worker_id is None:
+            with self.lock:
+                self.worker_cnt += 1
+                worker_id = self.local.worker_id = self.worker_cnt
+                self._write_event({'name': 'thread_name', 'ph': 'M', 'pid': self.pid,
+                                   'tid': worker_id,
+                                   'args': {'name': threading.current_thread().name}})
+        return worker_id
+
+    @contextlib.contextmanager
+    def span(self, name, category, **args):
+        """ Records the enclosed block as a span.
+
+        Yields the span's args dict - which may be added to within the
+        block, ex: to record a check's rc.
+        """
+        worker_id = self.get_worker_id()
+        args['worker_id'] = worker_id
+        start_time = time.time()
+        try:
+            yield args
+        finally:
+            stop_time = time.time()
+            with self.lock:
+                self._write_event({'name': name,
+                                   'cat':  category,
+                                   'ph':   'X',
+                                   'ts':   int(start_time * 1000000),
+                                   'dur':  int((stop_time - start_time) * 1000000),
+                                   'pid':  self.pid,
+                                   'tid':  worker_id,
+                                   'args': args})
+
+    def _write_event(self, event):
+        self.outfile.write(',\n' if self.event_cnt else '\n')
+        self.outfile.write(json.dumps(event, sort_keys=True, default=str))
+        self.outfile.flush()
+        self.event_cnt += 1
+
+    def close(self):
+        with self.lock:
+            if not self.outfile.closed:
+                self.outfile.write('\n]\n')
+                self.outfile.close()
+
+
+
+class NullTracer(object):
+    """ Used in place of a TraceWriter when tracing is off.
+    """
+
+    @contextlib.contextmanager
+    def span(self, name, category, **args):
+        yield args
+
+    def close(self):
+        pass
@@ -0,0 +1,239 @@
+#!/usr/bin/env python2
+""" Benchmarks the runner against a synthetic registry & stub checks.
+
+    Generates a registry of --table-cnt tables with --checks-per-table
+    checks each, plus one stub check file per check - shared by all tables.
+    Each stub check sleeps for --check-latency-ms then echoes a passing
+    result whose log field pads its output to --check-output-bytes - so the
+    runner's own costs can be separated from the checks' costs.
+
+    The runner is then run --repeat times against a fresh results database
+    and log dir, and for each run the following are collected:
+        - wall_secs          - the runner's elapsed time
+        - checks_per_sec     - checks run / wall_secs
+        - overhead_per_check_ms - the runner's time outside of its checks,
+                               per check: (wall_secs - check_exec secs) / checks
+        - max_rss_kb         - peak memory of the runner
+        - results_write_secs - time spent writing the results database
+        - phase_secs         - every phase timing the runner exports
+
+    The parameters, every run and the median of each measure are written to
+    --results-filename as json, so results can be compared between versions.
+
+This source code is protected by the BSD license.  See the file "LICENSE"
+in the source code root directory for the full language or refer to it here:
+   http://opensource.org/licenses/BSD-3-Clause
+Copyright 2015, 2016 Will Farmer and Ken Farmer
+"""
+from __future__ import division
+import os, sys, stat, time, datetime
+import argparse, json, re
+import subprocess, tempfile, shutil, platform
+from os.path import join as pjoin
+from os.path import isfile, isdir, exists, dirname, basename
+
+sys.path.insert(0, dirname(dirname(os.path.abspath(__file__))))
+from hadoopinspector._version import __version__
+import hadoopinspector.registry as registry
+
+runner_fqfn = pjoin(dirname(os.path.abspath(__file__)), 'hadoopinspector_runner.py')
+
+PHASE_RE = re.compile(r'^hadoopinspector_runner_phase_seconds\{.*phase="([^"]+)".*\} (\S+)$')
+SUMMARY_MEASURES = ('wall_secs', 'checks_per_sec', 'overhead_per_check_ms', 'max_rss_kb',
+                    'results_write_secs')
+
+
+
+def main():
+    args = get_args()
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='hadinsp_bench_')
+    try:
+        results = run_benchmark(work_dir, args.table_cnt, args.checks_per_table,
+                                args.check_latency_ms, args.check_output_bytes,
+                                args.repeat, args.runner_arg)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir)
+    with open(args.results_filename, 'w') as outfile:
+        json.dump(results, outfile, indent=2, sort_keys=True)
+    for measure in SUMMARY_MEASURES:
+        print('%-24s %s' % (measure, results['summary'][measure]))
+    print('results written to: %s' % args.results_filename)
+    return 0
+
+
+
+def run_benchmark(work_dir, table_cnt, checks_per_table, check_latency_ms=0,
+                  check_output_bytes=0, repeat=1, runner_args=None):
+    """ Generates the benchmark files within work_dir, runs the runner
+        against them repeat times and returns the results dict.
+    """
+    check_dir = pjoin(work_dir, 'checks')
+    if not isdir(check_dir):
+        os.mkdir(check_dir)
+    registry_fqfn = pjoin(work_dir, 'registry.json')
+    check_names = write_stub_checks(check_dir, checks_per_table, check_latency_ms, check_output_bytes)
+    write_registry(registry_fqfn, table_cnt, check_names)
+
+    runs = []
+    for run_num in range(repeat):
+        run_dir = pjoin(work_dir, 'run_%d' % run_num)
+        os.mkdir(run_dir)
+        runs.append(run_runner(run_dir, registry_fqfn, check_dir,
+                               table_cnt * checks_per_table, runner_args))
+
+    return {'hadoopinspector_version': __version__,
+            'python_version':   platform.python_version(),
+            'platform':         platform.platform(),
+            'timestamp':        datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'params':           {'table_cnt':          table_cnt,
+                                 'checks_per_table':   checks_per_table,
+                                 'check_latency_ms':   check_latency_ms,
+                                 'check_output_bytes': check_output_bytes,
+                                 'repeat':             repeat,
+                                 'runner_args':        runner_args or []},
+            'runs':             runs,
+            'summary':          dict((measure, median([run[measure] for run in runs]))
+                                     for measure in SUMMARY_MEASURES)}
+
+
+def write_stub_checks(check_dir, check_cnt, check_latency_ms, check_output_bytes):
+    """ Writes check_cnt stub checks and returns their file names.
+    """
+    output = json.dumps({'rc': 0, 'violations': 0, 'log': ''})
+    padding = 'x' * max(0, check_output_bytes - len(output))
+    output = json.dumps({'rc': 0, 'violations': 0, 'log': padding})
+
+    check_names = []
+    for check_num in range(check_cnt):
+        check_fqfn = pjoin(check_dir, 'bench_check_%04d.sh' % check_num)
+        with open(check_fqfn, 'w') as outfile:
+            outfile.write('#!/bin/sh\n')
+            if check_latency_ms:
+                outfile.write('sleep %.3f\n' % (check_latency_ms / 1000))
+            outfile.write("echo '%s'\n" % output)
+        os.chmod(check_fqfn, os.stat(check_fqfn).st_mode | stat.S_IEXEC)
+        check_names.append(basename(check_fqfn))
+    return check_names
+
+
+def write_registry(registry_fqfn, table_cnt, check_names):
+    reg = registry.Registry()
+    for table_num in range(table_cnt):
+        table = 'bench_table_%05d' % table_num
+        for check_name in check_names:
+            reg.add_check(table, os.path.splitext(check_name)[0], check_name,
+                          'active', 'rule', 'full', 'row')
+    reg.write(registry_fqfn)
+
+
+def run_runner(run_dir, registry_fqfn, check_dir, check_cnt, runner_args=None):
+    """ Runs the runner once and returns the run's measures.
+    """
+    metrics_fqfn = pjoin(run_dir, 'runner.prom')
+    cmd = [sys.executable, runner_fqfn,
+           '--instance', 'bench',
+           '--database', 'bench',
+           '--registry-filename', registry_fqfn,
+           '--results-filename', pjoin(run_dir, 'results.sqlite'),
+           '--check-dir', check_dir,
+           '--log-dir', run_dir,
+           '--log-level', 'info',
+           '--no-console-log',
+           '--metrics-textfile', metrics_fqfn]
+    cmd.extend(runner_args or [])
+
+    start_time = time.time()
+    with open(os.devnull, 'w') as devnull:
+        process = subprocess.Popen(cmd, stdout=devnull, close_fds=True)
+        #--- ru_maxrss of the reaped runner includes its checks, but the runner dominates:
+        _, status, rusage = os.wait4(process.pid, 0)
+    wall_secs = time.time() - start_time
+    rc = os.WEXITSTATUS(status)
+    if rc != 0:
+        raise ValueError('runner failed with rc: %s - see logs in %s' % (rc, run_dir))
+
+    phase_secs = read_phase_secs(metrics_fqfn)
+    max_rss_kb = rusage.ru_maxrss
+    if sys.platform == 'darwin':
+        max_rss_kb = max_rss_kb // 1024    # reported in bytes rather than kb
+    return {'wall_secs':             round(wall_secs, 6),
+            'checks_per_sec':        round(check_cnt / wall_secs, 3),
+            'overhead_per_check_ms': round((wall_secs - phase_secs.get('check_exec', 0.0))
+                                           / check_cnt * 1000, 3),
+            'max_rss_kb':            max_rss_kb,
+            'results_write_secs':    phase_secs.get('results_write', 0.0),
+            'phase_secs':            phase_secs}
+
+
+def read_phase_secs(metrics_fqfn):
+    """ Returns the phase timings from a runner --metrics-textfile file.
+    """
+    phase_secs = {}
+    with open(metrics_fqfn) as infile:
+        for line in infile:
+            match = PHASE_RE.match(line.strip())
+            if match:
+                phase_secs[match.group(1)] = float(match.group(2))
+    return phase_secs
+
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2
+
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Benchmarks the runner against stub checks at scale')
+    parser.add_argument('--results-filename',
+                        required=True,
+                        help='json file to write the benchmark results to')
+    parser.add_argument('--table-cnt',
+                        type=int,
+                        default=100,
+                        help='number of tables in the generated registry - default of 100')
+    parser.add_argument('--checks-per-table',
+                        type=int,
+                        default=20,
+                        help='number of checks per table - default of 20')
+    parser.add_argument('--check-latency-ms',
+                        type=int,
+                        default=0,
+                        help='time each stub check sleeps for - default of 0')
+    parser.add_argument('--check-output-bytes',
+                        type=int,
+                        default=0,
+                        help='pads each stub check output to about this size - default of 0')
+    parser.add_argument('--repeat',
+                        type=int,
+                        default=1,
+                        help='number of runner runs - the summary holds the median of each measure')
+    parser.add_argument('--work-dir',
+                        help='directory to generate checks, registry, logs & results in - and keep.  '
+                             'By default a temp dir is used then deleted')
+    parser.add_argument('--runner-arg',
+                        action='append',
+                        help='extra arg to pass to the runner, ex: --runner-arg=--run-log-format=jsonl '
+                             '- may be repeated')
+    parser.add_argument('--version',
+                        action='version',
+                        version=__version__,
+                        help='displays version number')
+    args = parser.parse_args()
+
+    if args.table_cnt < 1 or args.checks_per_table < 1 or args.repeat < 1:
+        parser.error('table-cnt, checks-per-table and repeat must all be at least 1')
+    if args.work_dir and not isdir(args.work_dir):
+        parser.error('Supplied work-dir does not exist.  Please create.')
+    if not isdir(dirname(os.path.abspath(args.results_filename))):
+        parser.error('Supplied results-filename directory does not exist.  Please create.')
+    return args
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -18,6 +18,12 @@ import hadoopinspector.core as core
 import hadoopinspector.registry as registry
 import hadoopinspector.check_runner as check_engine
 import hadoopinspector.check_results as chk_results
+import hadoopinspector.report_writers as report_writers
+import hadoopinspector.check_logging as check_logging
+import hadoopinspector.metrics as run_metrics
+import hadoopinspector.tracing as tracing
+import hadoopinspector.events as run_events
+import hadoopinspector.profiling as profiling
 
 runner_logger = None
 
@@ -33,21 +39,61 @@ def main():
     if args.user_table_vars:
         runner_logger.info("user table vars: %s", args.user_table_vars)
 
+    profiler = None
+    if args.profile:
+        profiler = profiling.RunProfiler(args.log_dir)
+        profiler.start()
+    metrics = run_metrics.RunMetrics()
+    tracer  = tracing.get_tracer(args.trace)
+    events  = run_events.get_event_writer(args.events_file)
     reg = registry.Registry()
-    reg.load_registry(args.registry_filename)
-    reg.default()
-    reg.filter_registry(args.table, args.check)
-    reg.validate()
+    with metrics.timer('registry_load'), tracer.span('registry_load', 'startup'):
+        if args.registry_cache_dir:
+            reg.load_compiled_registry(args.registry_filename, args.registry_cache_dir)
+        else:
+            reg.load_registry(args.registry_filename)
+    #--- filter first so that only selected shards of a sharded registry get loaded:
+    with metrics.timer('registry_filter'), tracer.span('registry_filter', 'startup'):
+        reg.filter_registry(args.table, args.check, args.tag)
+    if not reg.validated:
+        with metrics.timer('registry_validate'), tracer.span('registry_validate', 'startup'):
+            reg.default()
+            reg.validate()
 
-    check_repo = core.CheckRepo(args.check_dir)
-    check_results = chk_results.CheckResults(args.instance, args.database, db_fqfn=args.results_filename)
+    with metrics.timer('check_repo_index'), tracer.span('check_repo_index', 'startup'):
+        check_repo = core.CheckRepo(args.check_dir)
+    #--- find missing or broken checks now rather than part-way through the run:
+    with metrics.timer('preflight'), tracer.span('preflight', 'startup'):
+        preflight_errors = check_repo.preflight(reg)
+    if preflight_errors:
+        for error in preflight_errors:
+            runner_logger.critical("preflight failed: %s", error)
+        tracer.close()
+        events.close()
+        stop_profiler(profiler)
+        sys.exit(1)
+    report_writer = None
+    if args.report_format:
+        report_writer = report_writers.get_report_writer(args.report_format, args.report_filename)
+    check_results = chk_results.CheckResults(args.instance, args.database, db_fqfn=args.results_filename,
+                                             report_writer=report_writer)
 
     checker = check_engine.CheckRunner(reg, check_repo, check_results, args.instance, args.database,
-                                       args.log_dir, args.log_level, args.user_table_vars)
+                                       args.log_dir, args.log_level, args.user_table_vars,
+                                       args.run_log_format, metrics, tracer, events)
     checker.add_db_var('hapinsp_instance', args.instance)
     checker.add_db_var('hapinsp_database', args.database)
     checker.add_db_var('hapinsp_ssl',      args.ssl)
-    checker.run_checks_for_tables()
+    with metrics.timer('run_checks'):
+        checker.run_checks_for_tables()
+    checker.close()
+    tracer.close()
+    events.close()
+    if report_writer:
+        report_writer.close()
+    metrics.count_outcomes(check_results)
+    write_metrics(args, metrics)
+    stop_profiler(profiler)
 
     if args.report:
         print('')
@@ -68,6 +114,25 @@ def main():
 
 
 
+def write_metrics(args, metrics):
+    labels = {'instance': args.instance, 'database': args.database}
+    if args.metrics_textfile:
+        run_metrics.write_prometheus_textfile(metrics, args.metrics_textfile, labels)
+    if args.metrics_statsd:
+        host, port = args.metrics_statsd
+        run_metrics.send_statsd(metrics, host, port)
+    for phase, secs in metrics.phase_secs.items():
+        runner_logger.debug("phase: %s, secs: %.3f, calls: %d", phase, secs, metrics.phase_calls[phase])
+
+
+
+def stop_profiler(profiler):
+    if profiler:
+        for fqfn in profiler.stop():
+            runner_logger.info("profile written: %s", fqfn)
+
+
+
 def get_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('--instance',
@@ -78,10 +143,17 @@ def get_args():
                         help='specifies name of database to check')
     parser.add_argument('--table',
                         required=False,
-                        help='specifies a single table to test against')
+                        action='append',
+                        help='specifies a table or glob pattern to test against - may be repeated')
     parser.add_argument('--check',
                         required=False,
-                        help='specifies a single check to test against')
+                        action='append',
+                        help='specifies a check or glob pattern to test against - may be repeated')
+    parser.add_argument('--tag',
+                        required=False,
+                        action='append',
+                        help='only runs checks with a matching check_tags entry (ex: severity:high) - '
+                             'may be repeated, checks must match every tag')
     parser.add_argument('-r', '--report',
                         action='store_true',
                         default=False,
@@ -90,9 +162,17 @@ def get_args():
                         action='store_true',
                         default=False,
                         help='indicates that a detailed report should be generated')
+    parser.add_argument('--report-format',
+                        choices=report_writers.REPORT_FORMATS,
+                        help='writes a machine-readable record as each check completes')
+    parser.add_argument('--report-filename',
+                        default='-',
+                        help='file for --report-format records - default of - writes to stdout')
     parser.add_argument('--registry-filename',
                         required=True,
-                        help='registry file contains check config')
+                        help='registry file contains check config - or the index file of a sharded registry')
+    parser.add_argument('--registry-cache-dir',
+                        help='directory to cache the compiled registry in - skips validation on later runs')
     parser.add_argument('--user-table-vars',
                         default=None,
                         nargs='*',
@@ -106,6 +186,29 @@ def get_args():
     parser.add_argument('--log-dir',
                         required=True,
                         help='specifies directory to log output to')
+    parser.add_argument('--run-log-format',
+                        choices=check_logging.RUN_LOG_FORMATS,
+                        default='dirs',
+                        help='dirs writes a rotating log per check under log-dir/instance/database/table/check, '
+                             'jsonl writes one gzipped json-lines log with an index per run')
+    parser.add_argument('--metrics-textfile',
+                        help='writes runner phase timings & check outcome counts to this prometheus '
+                             'textfile-collector file (ex: .../hadoopinspector_inst1_db1.prom)')
+    parser.add_argument('--metrics-statsd',
+                        help='sends runner phase timings & check outcome counts to a statsd-compatible '
+                             'udp host:port')
+    parser.add_argument('--trace',
+                        help='writes a chrome trace-event timeline of the run, tables & checks to this '
+                             'json file - for chrome://tracing, perfetto or other trace viewers')
+    parser.add_argument('--events-file',
+                        help='writes the progress of the run - run, table & check starts and finishes - '
+                             'to this newline-delimited json file as it happens.  The dashboard\'s live '
+                             'view follows it')
+    parser.add_argument('--profile',
+                        action='store_true',
+                        default=False,
+                        help='profiles the runner itself - writes pstats, collapsed flame-graph stacks '
+                             'and a top-allocations report into the log-dir')
     parser.add_argument('--ssl',
                         action='store_true',
                         dest='ssl')
@@ -136,8 +239,21 @@ def get_args():
         parser.error('Supplied log directory does not exist.  Please create.')
     if not isfile(args.registry_filename):
         parser.error('Supplied registry-filename does not exist.  Please correct.')
+    if args.registry_cache_dir and not isdir(args.registry_cache_dir):
+        parser.error('Supplied registry-cache-dir does not exist.  Please create.')
     if args.detail_report:
         args.report = True
+    if args.report and args.report_format and args.report_filename == '-':
+        parser.error('Report and report-format both write to stdout.  Please provide a report-filename.')
+    if args.metrics_textfile and not isdir(dirname(os.path.abspath(args.metrics_textfile))):
+        parser.error('Supplied metrics-textfile directory does not exist.  Please create.')
+    if args.events_file and not isdir(dirname(os.path.abspath(args.events_file))):
+        parser.error('Supplied events-file directory does not exist.  Please create.')
+    if args.metrics_statsd:
+        host, _, port = args.metrics_statsd.rpartition(':')
+        if not host or not port.isdigit():
+            parser.error('Invalid metrics-statsd: must be host:port')
+        args.metrics_statsd = (host, int(port))
     if args.ssl is None:
         args.ssl = False
     if args.user_table_vars is not None:
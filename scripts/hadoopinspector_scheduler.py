@@ -0,0 +1,153 @@
+#!/usr/bin/env python2
+"""
+This source code is protected by the BSD license.  See the file "LICENSE"
+in the source code root directory for the full language or refer to it here:
+   http://opensource.org/licenses/BSD-3-Clause
+Copyright 2015, 2016 Will Farmer and Ken Farmer
+
+Runs checks on cron-style schedules as a long-running daemon - keeping
+registries, the check repo index and results connections warm between
+runs.  The schedule file is json, ex:
+    {"jobs": [{"name":              "cust_hourly",
+               "schedule":          "5 * * * *",
+               "instance":          "prod1",
+               "database":          "cust",
+               "registry_filename": "cust_registry.json",
+               "table":             ["cust*"],
+               "tag":               ["severity:high"],
+               "user_table_vars":   {"foo": "bar"}}]}
+Relative filenames are relative to the schedule file's directory.  Both
+the schedule and the registries are reloaded when they change.
+"""
+import sys, os, argparse
+import logging
+import logging.handlers
+from pprint import pprint as pp
+from os.path import dirname, basename, isdir, isfile, exists
+from os.path import join as pjoin
+
+sys.path.insert(0, dirname(dirname(os.path.abspath(__file__))))
+from hadoopinspector._version import __version__
+import hadoopinspector.scheduler as scheduler
+import hadoopinspector.check_logging as check_logging
+
+runner_logger = None
+
+
+def main():
+    global runner_logger
+    args = get_args()
+    runner_logger = setup_runner_logger(args.log_dir, args.log_level, args.log_to_console)
+    runner_logger.info("scheduler starting now")
+    runner_logger.info("schedule: %s", args.schedule_filename)
+    runner_logger.info("log_level: %s", args.log_level)
+
+    sched = scheduler.Scheduler(args.check_dir, args.log_dir, args.log_level,
+                                registry_cache_dir=args.registry_cache_dir,
+                                results_filename=args.results_filename,
+                                run_log_format=args.run_log_format)
+    try:
+        sched.run_forever(args.schedule_filename, args.max_sleep_secs)
+    except KeyboardInterrupt:
+        runner_logger.info("scheduler terminating now")
+    finally:
+        sched.close()
+    return 0
+
+
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--schedule-filename',
+                        required=True,
+                        help='json file of the jobs to run and their cron schedules')
+    parser.add_argument('--results-filename',
+                        help='results sqlite file for jobs that do not specify their own')
+    parser.add_argument('--registry-cache-dir',
+                        help='directory to cache compiled registries in - skips validation on reloads')
+    parser.add_argument('--check-dir',
+                        required=True,
+                        help='which directory to look for the tests in')
+    parser.add_argument('--log-dir',
+                        required=True,
+                        help='specifies directory to log output to')
+    parser.add_argument('--run-log-format',
+                        choices=check_logging.RUN_LOG_FORMATS,
+                        default='dirs',
+                        help='dirs writes a rotating log per check, jsonl writes one gzipped '
+                             'json-lines log with an index per run')
+    parser.add_argument('--max-sleep-secs',
+                        type=int,
+                        default=60,
+                        help='longest time to go without checking the schedule file for changes')
+    parser.add_argument('--console-log',
+                        action='store_true',
+                        dest='log_to_console')
+    parser.add_argument('--no-console-log',
+                        action='store_false',
+                        dest='log_to_console')
+    parser.add_argument('--log-level',
+                        default='debug',
+                        choices=['debug', 'info', 'warning', 'error', 'critical'])
+    parser.add_argument('--version',
+                        action='version',
+                        version=__version__,
+                        help='displays version number')
+
+    args = parser.parse_args()
+
+    if not isdir(args.check_dir):
+        parser.error('Supplied check directory does not exist. Please correct.')
+    if not isdir(args.log_dir):
+        parser.error('Supplied log directory does not exist.  Please create.')
+    if not isfile(args.schedule_filename):
+        parser.error('Supplied schedule-filename does not exist.  Please correct.')
+    if args.registry_cache_dir and not isdir(args.registry_cache_dir):
+        parser.error('Supplied registry-cache-dir does not exist.  Please create.')
+    if args.max_sleep_secs < 1:
+        parser.error('max-sleep-secs must be at least 1')
+
+    return args
+
+
+
+def setup_runner_logger(logdir, log_level, log_to_console):
+    assert isdir(logdir)
+    assert log_level in ('debug', 'info', 'warning', 'error', 'critical')
+    assert log_to_console in (True, False)
+    log_filename = pjoin(logdir, 'scheduler.log')
+
+    #--- create logger
+    logger = logging.getLogger('RunnerLogger')
+    logger.setLevel(log_level.upper())
+
+    #--- add formatting:
+    log_format = '%(asctime)s : %(name)-12s : %(levelname)-8s : %(message)s'
+    date_format = '%Y-%m-%d %H.%M.%S'
+    formatter = logging.Formatter(log_format, date_format)
+
+    #--- create rotating file handler
+    file_handler = logging.handlers.RotatingFileHandler(log_filename, maxBytes=1000000, backupCount=20)
+    file_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
+
+    #--- create console handler:
+    if log_to_console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        logger.addHandler(console_handler)
+
+    #--- ensure any uncaught exceptions get logged:
+    sys.excepthook = excepthook
+
+    return logger
+
+
+def excepthook(*args):
+    runner_logger.critical('uncaught exception - exiting now', exc_info=args)
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+#!/usr/bin/env python2
+"""
+This source code is protected by the BSD license.  See the file "LICENSE"
+in the source code root directory for the full language or refer to it here:
+   http://opensource.org/licenses/BSD-3-Clause
+Copyright 2015, 2016 Will Farmer and Ken Farmer
+"""
+
+from __future__ import division
+import sys, os, shutil
+import json, subprocess
+import tempfile
+from os.path import join as pjoin
+from os.path import dirname, isfile
+
+sys.path.insert(0, dirname(dirname(os.path.abspath(__file__))))
+import hadoopinspector_benchmark as mod
+
+
+class TestRunBenchmark(object):
+
+    def setup_method(self, method):
+        self.work_dir = tempfile.mkdtemp(prefix='hadinsp_bench_')
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.work_dir)
+
+    def test_results(self):
+        results = mod.run_benchmark(self.work_dir, table_cnt=3, checks_per_table=2,
+                                    check_latency_ms=10, check_output_bytes=500, repeat=2)
+        assert results['params']['table_cnt'] == 3
+        assert len(results['runs']) == 2
+        for run in results['runs']:
+            assert run['wall_secs'] >= 6 * 0.01
+            assert run['checks_per_sec'] == round(6 / run['wall_secs'], 3)
+            assert run['max_rss_kb'] > 0
+            assert run['results_write_secs'] > 0
+            assert 'check_exec' in run['phase_secs']
+        assert sorted(results['summary']) == sorted(mod.SUMMARY_MEASURES)
+
+    def test_stub_check_output(self):
+        check_names = mod.write_stub_checks(self.work_dir, 1, 0, 500)
+        output = subprocess.check_output([pjoin(self.work_dir, check_names[0])])
+        assert json.loads(output)['violations'] == 0
+        assert 495 <= len(output) <= 505
+
+    def test_median(self):
+        assert mod.median([3, 1, 2]) == 2
+        assert mod.median([4, 1, 2, 3]) == 2.5
+
+    def test_main(self):
+        results_fqfn = pjoin(self.work_dir, 'bench.json')
+        subprocess.check_call([sys.executable, pjoin(dirname(mod.__file__), 'hadoopinspector_benchmark.py'),
+                               '--results-filename', results_fqfn,
+                               '--table-cnt', '2', '--checks-per-table', '2',
+                               '--runner-arg=--run-log-format=jsonl'])
+        with open(results_fqfn) as f:
+            results = json.load(f)
+        assert results['params']['runner_args'] == ['--run-log-format=jsonl']
+        assert results['summary']['checks_per_sec'] > 0
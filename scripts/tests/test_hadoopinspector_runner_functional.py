@@ -8,7 +8,8 @@ Copyright 2015 Will Farmer and Ken Farmer
 
 from __future__ import division
 import sys, os, shutil, time, glob
-import tempfile, subprocess, collections, fileinput
+import json
+import tempfile, subprocess, collections, fileinput, pstats
 from pprint import pprint as pp
 
 from os.path import exists, isdir, isfile, basename, dirname
@@ -21,6 +22,7 @@ pgm         = os.path.join(script_path, 'hadoopinspector_runner.py')
 sys.path.insert(0, dirname(dirname(os.path.abspath(__file__))))
 sys.path.insert(0, dirname(dirname(dirname(os.path.abspath(__file__)))))
 import hadoopinspector.core as core
+import hadoopinspector.check_logging as core_check_logging
 import hadoopinspector.tests.test_tooling   as testtooling
 
 Record = collections.namedtuple('Record', 'instance db table check check_rc violation_cnt')
@@ -43,7 +45,7 @@ class TestWithMockedCheckFiles(object):
         shutil.rmtree(self.log_dir)
         shutil.rmtree(self.misc_dir)
 
-    def run_cmd(self, table=None):
+    def run_cmd(self, table=None, extra_args=None):
         assert isfile(self.registry_fqfn)
         assert isdir(self.check_dir)
         assert isdir(self.log_dir)
@@ -62,6 +64,8 @@ class TestWithMockedCheckFiles(object):
                '--detail-report' ]
         if table:
             cmd.extend(['--table', table])
+        if extra_args:
+            cmd.extend(extra_args)
 
         p = subprocess.Popen(cmd, stdout=subprocess.PIPE, close_fds=True)
         results =  p.communicate()[0].decode()
@@ -218,6 +222,125 @@ class TestWithMockedCheckFiles(object):
         testtooling.report_checker(report, expected_check_cnt=2, expected_check_rc=0, expected_violation_cnt=1)
 
 
+    def test_streaming_ndjson_report(self):
+        table        = 'customer'
+        report_fqfn  = pjoin(self.misc_dir, 'report.ndjson')
+        self._add_rule_check(table, '0', '3')
+        self._add_rule_check(table, '0', '3')
+        report, run_rc = self.run_cmd(extra_args=['--report-format', 'ndjson',
+                                                  '--report-filename', report_fqfn])
+        assert run_rc == 0
+        with open(report_fqfn) as f:
+            recs = [json.loads(line) for line in f]
+        assert len(recs) == 2
+        for rec in recs:
+            assert rec['table'] == table
+            assert rec['rc'] == 0
+            assert str(rec['violation_cnt']) == '3'
+
+
+    def test_report_format_to_stdout_rejected_with_report(self):
+        self._add_rule_check('customer', '0', '3')
+        report, run_rc = self.run_cmd(extra_args=['--report-format', 'ndjson'])
+        assert run_rc == 2
+        assert report == []
+
+
+    def test_metrics_textfile(self):
+        prom_fqfn = pjoin(self.misc_dir, 'runner.prom')
+        self._add_rule_check('customer', '0', '0')
+        self._add_rule_check('customer', '0', '3')
+        report, run_rc = self.run_cmd(extra_args=['--metrics-textfile', prom_fqfn])
+        assert run_rc == 0
+        with open(prom_fqfn) as f:
+            lines = f.read().splitlines()
+        assert 'hadoopinspector_runner_checks{database="db1",instance="inst1",outcome="violations"} 1' in lines
+        assert 'hadoopinspector_runner_phase_calls{database="db1",instance="inst1",phase="check_exec"} 2' in lines
+        for phase in ('registry_load', 'registry_validate', 'preflight', 'check_output_parse', 'results_write'):
+            assert any('phase="%s"' % phase in line for line in lines)
+
+
+    def test_trace(self):
+        trace_fqfn = pjoin(self.misc_dir, 'trace.json')
+        self._add_setup_check('customer', 'hapinsp_tablecustom_foo', 'bar')
+        self._add_rule_check('customer', '0', '0')
+        self._add_rule_check('asset', '0', '0')
+        report, run_rc = self.run_cmd(extra_args=['--trace', trace_fqfn])
+        assert run_rc == 0
+        with open(trace_fqfn) as f:
+            spans = [x for x in json.load(f) if x['ph'] == 'X']
+        cats = collections.Counter(x['cat'] for x in spans)
+        assert cats['run'] == 1
+        assert cats['table'] == 2
+        assert cats['setup_check'] == 1
+        assert cats['check'] == 2
+        assert cats['results'] == 1
+        assert cats['startup'] >= 4
+        check_span = [x for x in spans if x['cat'] == 'check' and x['args']['table'] == 'asset'][0]
+        assert check_span['args']['rc'] == 0
+
+
+    def test_events_file(self):
+        events_fqfn = pjoin(self.misc_dir, 'events.ndjson')
+        self._add_setup_check('customer', 'hapinsp_tablecustom_foo', 'bar')
+        self._add_rule_check('customer', '0', '3')
+        self._add_rule_check('asset', '0', '0')
+        report, run_rc = self.run_cmd(extra_args=['--events-file', events_fqfn])
+        assert run_rc == 0
+        with open(events_fqfn) as f:
+            events = [json.loads(line) for line in f]
+        assert [x['event'] for x in events] == ['run_started',
+                                                'table_started', 'check_started', 'check_finished',
+                                                'table_started', 'check_started', 'check_finished',
+                                                'check_started', 'check_finished',
+                                                'run_finished']
+        assert events[0]['table_cnt'] == 2
+        assert [x['check_type'] for x in events if x['event'] == 'check_finished'] == ['rule', 'setup', 'rule']
+        customer_check = [x for x in events if x['event'] == 'check_finished' and x['table'] == 'customer'][-1]
+        assert customer_check['violations'] == 3
+        assert customer_check['rc'] == 0
+        assert events[-1]['check_cnt'] == 3
+        assert len(set(x['run_id'] for x in events)) == 1
+
+
+    def test_profile(self):
+        self._add_rule_check('customer', '0', '0')
+        report, run_rc = self.run_cmd(extra_args=['--profile'])
+        assert run_rc == 0
+        profile_fqfns = glob.glob(pjoin(self.log_dir, 'profile_*'))
+        assert sorted(basename(x).split('.', 1)[1] for x in profile_fqfns) == ['allocations.txt', 'collapsed',
+                                                                     'pstats', 'pstats.txt']
+        stats = pstats.Stats([x for x in profile_fqfns if x.endswith('.pstats')][0])
+        assert any(func[2] == 'run_checks_for_tables' for func in stats.stats)
+
+
+    def test_jsonl_run_log(self):
+        table        = 'customer'
+        check_fqfn   = self._add_rule_check(table, '0', '3')
+        report, run_rc = self.run_cmd(extra_args=['--run-log-format', 'jsonl'])
+        assert run_rc == 0
+        run_logs = glob.glob(pjoin(self.log_dir, self.inst, self.db, 'run_*.jsonl.gz'))
+        assert len(run_logs) == 1
+        assert not isdir(pjoin(self.log_dir, self.inst, self.db, table))
+        check = os.path.splitext(basename(check_fqfn))[0]
+        recs = core_check_logging.read_check_log(run_logs[0], table, check)
+        assert recs[0]['message'] == 'check started'
+
+
+    def test_templated_checks(self):
+        expected_violation_cnt = '2'
+        check_fqfn = self._add_rule_check('any', '0', expected_violation_cnt, register=False)
+        with open(self.registry_fqfn, 'w') as f:
+            json.dump({'hapinsp_templates': [{'tables': ['customer', 'asset'],
+                                              'checks': {'rule_count': {'check_name': basename(check_fqfn)}}}]},
+                      f)
+        report, run_rc = self.run_cmd()
+        testtooling.report_checker(report, expected_check_cnt=2, expected_check_rc=0,
+                                   expected_violation_cnt=expected_violation_cnt)
+        assert sorted(rec.table for rec in report) == ['asset', 'customer']
+        assert run_rc == 0
+
+
 
 class EmptyRecError(Exception):
     def __init__(self, value=None):
@@ -8,11 +8,18 @@
 """
 
 import sys, os
+import time
 import json
 import re
 import sqlite3
 import datetime
-from flask import Flask, render_template, Markup, request
+import threading
+import collections
+import functools
+import hashlib
+import Queue
+from flask import Flask, render_template, Markup, request, make_response, abort, url_for, Response
+from flask import g, has_app_context
 
 
 app = Flask(__name__)
@@ -20,6 +27,62 @@ app = Flask(__name__)
 #TODO: Actually use config and determine configurable fields
 config = None
 
+# The results db path is resolved once - walking the tree for every query
+# was far slower than the queries themselves.
+database_file = None
+
+# The runner --events-file that the live run view follows - from the
+# optional events_file of config.json:
+events_file = None
+
+# Connections are pooled rather than kept by each thread, since the server
+# starts a new thread for every request.  A request checks a connection out
+# of the pool and returns it on teardown - only POOL_SIZE idle connections
+# are kept.  Outside of a request, ex: in tests, a thread keeps its own.
+POOL_SIZE = 8
+connection_pool = Queue.Queue(maxsize=POOL_SIZE)
+thread_local = threading.local()
+
+STATEMENT_CACHE_SIZE = 200
+
+PAGE_CACHE_SIZE = 256
+
+PAGE_SIZE     = 50
+MAX_PAGE_SIZE = 500
+
+SEARCH_LIMIT     = 10
+MAX_SEARCH_LIMIT = 100
+
+EVENTS_POLL_SECS      = 0.5
+EVENTS_KEEPALIVE_SECS = 15
+
+# strftime formats of the periods that history can be grouped by:
+GRANULARITY_FORMATS = {'day': '%Y-%m-%d', 'month': '%Y-%m'}
+
+# history series are downsampled to at most this many points:
+HISTORY_POINTS     = 200
+MAX_HISTORY_POINTS = 1000
+
+# the default granularity, window of latest periods and points of each chart tab:
+HISTORY_TABS = {'week':  {'granularity': 'day', 'window': 8,   'points': HISTORY_POINTS},
+                'month': {'granularity': 'day', 'window': 32,  'points': HISTORY_POINTS},
+                'year':  {'granularity': 'day', 'window': 366, 'points': 180}}
+
+# violation counts of -1 - or NULL - are unknown, ex: unparseable check output:
+VIOLATIONS_SQL = 'CASE WHEN check_violation_cnt > 0 THEN check_violation_cnt ELSE 0 END'
+
+# a check is failing if it has violations or a non-zero rc, ex: unparseable check output:
+FAILING_SQL = 'CASE WHEN check_rc != 0 OR check_violation_cnt > 0 THEN 1 ELSE 0 END'
+
+# restricts check_names to the rows whose full-text index entry matches a query:
+MATCH_SQL = 'AND rowid IN (SELECT docid FROM check_names_fts WHERE check_names_fts MATCH ?) '
+
+CHECK_DETAIL_FIELDS = ('check_type', 'check_mode', 'check_unit', 'check_status', 'run_id',
+                       'run_start_timestamp', 'run_stop_timestamp')
+
+# the entity levels, from the top - each is listed within the one above it:
+SCOPE_LEVELS = ('instance', 'database', 'table', 'check')
+
 colors = [
     '#5DA5DA', # (blue)
     '#B276B2', # (purple)
@@ -36,10 +99,242 @@ colors = [
 
 def main():
     global config
+    global events_file
     config = get_config()
+    FrontEnd().get_database()
+    events_file = config.get('events_file')
     app.run(host='localhost',
             port=config['port'],
-            debug=True)
+            debug=True,
+            threaded=True)
+
+class PageCache(object):
+    """
+    LRU cache of rendered pages - keyed by url, and only valid for the
+    version of the results db they were rendered from.
+    """
+    def __init__(self, max_entries=PAGE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.pages = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, db_version):
+        with self.lock:
+            try:
+                page_db_version, content = self.pages.pop(key)
+            except KeyError:
+                return None
+            if page_db_version != db_version:
+                return None
+            self.pages[key] = (page_db_version, content)
+            return content
+
+    def put(self, key, db_version, content):
+        with self.lock:
+            self.pages.pop(key, None)
+            self.pages[key] = (db_version, content)
+            while len(self.pages) > self.max_entries:
+                self.pages.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.pages.clear()
+
+page_cache = PageCache()
+
+
+def cached_page(view):
+    """
+    Serve GETs of a route from page_cache while the results db is unchanged,
+    with ETag & Last-Modified headers so that browsers can revalidate with
+    a 304 rather than downloading the page again.  Searches (POSTs) always
+    run their queries.
+    """
+    @functools.wraps(view)
+    def wrapper(**view_args):
+        if request.method != 'GET':
+            return view(**view_args)
+        db_version = FrontEnd().get_database_version()
+        content = page_cache.get(request.full_path, db_version)
+        if content is None:
+            content = view(**view_args)
+            page_cache.put(request.full_path, db_version, content)
+        response = make_response(content)
+        response.set_etag(hashlib.md5(repr((db_version, request.full_path))).hexdigest())
+        response.last_modified = datetime.datetime.utcfromtimestamp(db_version[0])
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    return wrapper
+
+
+def checkout_connection(pool_key):
+    """
+    Take a read-only connection to the (db file, st_dev, st_ino) of pool_key
+    out of the pool - or open one if there are none.  Pooled connections to
+    a db file that has since been replaced are closed.
+    """
+    while True:
+        try:
+            connection_key, connection = connection_pool.get_nowait()
+        except Queue.Empty:
+            break
+        if connection_key == pool_key:
+            return connection
+        connection.close()
+    connection = sqlite3.connect(pool_key[0], cached_statements=STATEMENT_CACHE_SIZE,
+                                 check_same_thread=False)
+    connection.execute('PRAGMA query_only = ON')
+    return connection
+
+
+@app.teardown_appcontext
+def return_connection(exception=None):
+    """
+    Return the connection checked out by a request to the pool - or close
+    it if the pool is full.
+    """
+    checked_out = getattr(g, 'connection', None)
+    if checked_out is None:
+        return
+    g.connection = None
+    try:
+        connection_pool.put_nowait(checked_out)
+    except Queue.Full:
+        checked_out[1].close()
+
+
+def get_scope(instance=None, database=None, table=None, check=None):
+    """
+    Get the (name column, where clause, where args) that select the
+    entities listed within a level - ex: the tables of a database - or,
+    given a check, that check alone.  Setup checks are always excluded.
+    """
+    if check is not None:
+        return ('check_name',
+                'instance_name=? AND database_name=? AND table_name=? AND check_name=?',
+                (instance, database, table, check))
+    elif table is not None:
+        return ('check_name',
+                'instance_name=? AND database_name=? AND table_name=? AND check_name NOT LIKE "setup_%"',
+                (instance, database, table))
+    elif database is not None:
+        return ('table_name',
+                'instance_name=? AND database_name=? AND check_type NOT LIKE "setup_%"',
+                (instance, database))
+    elif instance is not None:
+        return ('database_name',
+                'instance_name=? AND check_type NOT LIKE "setup_%"',
+                (instance,))
+    else:
+        return ('instance_name',
+                'check_type NOT LIKE "setup_%"',
+                ())
+
+
+def get_window_sql(from_date=None, to_date=None):
+    """
+    Get the (sql, args) that limit check_results to the runs started from
+    from_date to to_date - inclusive YYYY-MM-DD dates, either may be None.
+    The bounds are constants, so sqlite seeks the run_start_timestamp of
+    the check_results indexes rather than reading every row of the scope.
+    """
+    sql, args = '', []
+    if from_date:
+        sql += ' AND run_start_timestamp >= ?'
+        args.append(from_date)
+    if to_date:
+        sql += ' AND run_start_timestamp < date(?, "+1 day")'
+        args.append(to_date)
+    return sql, args
+
+
+def get_match_queries(search, columns=None):
+    """
+    Get the fts MATCH queries for a search - one per token of the search,
+    each of which must prefix a token of any of the columns - or of any
+    column if none are given.  A row matches if it matches every query:
+    unlike a single query this needs no parentheses, which not every
+    sqlite build supports.  Tokens are split on the same characters as the
+    fts tokenizer, so cust_ev finds cust_asset_events.
+    """
+    tokens = re.findall(ur'[^\W_]+', search.lower(), re.UNICODE)
+    if not tokens:
+        return [u'""']
+    return [u' OR '.join(u'%s:%s*' % (column, token) for column in columns) if columns else u'%s*' % token
+            for token in tokens]
+
+
+def follow_events(events_fqfn, last_event_id=None, poll_secs=EVENTS_POLL_SECS,
+                  keepalive_secs=EVENTS_KEEPALIVE_SECS):
+    """
+    Generate the server-sent events stream of a runner events file: every
+    event already in it, then each event as it's appended.  The runner
+    replaces the file for each run, so when its inode changes the new file
+    is followed from its start.  Each event's id is "<run_id>:<offset>" -
+    so a reconnecting EventSource resumes after the last event it got, or
+    from the start of a newer run.  The run of a file is that of its first
+    event - inodes can't identify it, since a new run's file may reuse the
+    inode of the last.  A comment is sent whenever keepalive_secs pass
+    without an event, to keep proxies from closing the stream.
+    """
+    run_id, _, offset = (last_event_id or '').rpartition(':')
+    offset = int(offset) if offset.isdigit() else 0
+    infile = None
+    inode  = None
+    file_run_id = None
+    last_sent = time.time()
+    yield 'retry: 2000\n\n'
+    try:
+        while True:
+            try:
+                stat = os.stat(events_fqfn)
+            except OSError:
+                stat = None
+            if stat is not None and (infile is None or stat.st_ino != inode):
+                if infile:
+                    infile.close()
+                infile = open(events_fqfn, 'rb')
+                inode, file_run_id = stat.st_ino, None
+            if infile and file_run_id is None:
+                infile.seek(0)
+                first_line = infile.readline()
+                if first_line.endswith('\n'):
+                    file_run_id = get_event_run_id(first_line)
+                    # resume only within the same run, and only at the start of a line:
+                    if offset and file_run_id == run_id:
+                        infile.seek(offset - 1)
+                        if infile.read(1) != '\n':
+                            offset = 0
+                    else:
+                        offset = 0
+                    run_id = file_run_id
+            if file_run_id is not None:
+                # only whole lines - the runner may be part way through writing one:
+                infile.seek(offset)
+                chunk = infile.read()
+                for line in chunk[:chunk.rfind('\n') + 1].split('\n')[:-1]:
+                    offset += len(line) + 1
+                    if line.strip():
+                        yield 'id: %s:%d\ndata: %s\n\n' % (run_id, offset, line)
+                        last_sent = time.time()
+            if time.time() - last_sent >= keepalive_secs:
+                yield ': keepalive\n\n'
+                last_sent = time.time()
+            time.sleep(poll_secs)
+    finally:
+        if infile:
+            infile.close()
+
+
+def get_event_run_id(line):
+    """
+    Get the run_id of an events file line - or '' if it has none.
+    """
+    try:
+        return str(json.loads(line).get('run_id') or '')
+    except (ValueError, AttributeError):
+        return ''
+
 
 def get_config():
     """
@@ -68,21 +363,52 @@ class FrontEnd(object):
                     return os.path.join(dirname, filename)
 
     def get_database(self):
-        database_file = self.find_file('.', config['db']) or self.find_file('..', config['db'])
+        global database_file
         if database_file is None:
-            print("Missing Database")
-            sys.exit(0)
+            database_file = self.find_file('.', config['db']) or self.find_file('..', config['db'])
+            if database_file is None:
+                print("Missing Database")
+                sys.exit(0)
         return database_file
 
+    def get_database_version(self):
+        """
+        Get a version of the results db that changes whenever a run writes
+        to it - or the file is replaced.  Unlike PRAGMA data_version this
+        is the same for every connection, so it can key a shared cache.
+        """
+        db_stat = os.stat(self.get_database())
+        return (db_stat.st_mtime, db_stat.st_size, db_stat.st_ino)
+
+    def get_connection(self):
+        """
+        Get the read-only connection to the results db checked out of the
+        pool for this request - or for this thread, outside of a request.
+        The connection is reopened if the db file has been replaced, ex: by
+        a restore, since an open connection would keep reading the old file.
+        """
+        db_file  = self.get_database()
+        db_stat  = os.stat(db_file)
+        pool_key = (db_file, db_stat.st_dev, db_stat.st_ino)
+        holder   = g if has_app_context() else thread_local
+        checked_out = getattr(holder, 'connection', None)
+        if checked_out is not None:
+            if checked_out[0] == pool_key:
+                return checked_out[1]
+            checked_out[1].close()
+        holder.connection = (pool_key, checkout_connection(pool_key))
+        return holder.connection[1]
+
     def submit_query(self, query_string, args=None, flat=False):
-        database_file = self.get_database()
-        connection = sqlite3.connect(database_file)
-        cursor = connection.cursor()
-        if args is None:
-            cursor.execute(query_string)
-        else:
-            cursor.execute(query_string, args)
-        results = list(cursor.fetchall())
+        cursor = self.get_connection().cursor()
+        try:
+            if args is None:
+                cursor.execute(query_string)
+            else:
+                cursor.execute(query_string, args)
+            results = list(cursor.fetchall())
+        finally:
+            cursor.close()
         if flat:
             if results == []:
                 return results
@@ -101,284 +427,366 @@ class FrontEnd(object):
         new_strings = [re.sub(ur'-', u'_', s, re.UNICODE) for s in strings]
         return new_strings
 
-    def get_row_names(self, method, form, query, query_args=None, search_query=None, search_args=None):
-        # First get all names
-        if query_args:
-            names = self.submit_query(query, args=query_args, flat=True)
+    def get_page_names(self, name_col, where_sql, where_args=(), search=None,
+                       after=None, before=None, page_size=PAGE_SIZE, order='asc', from_date=None, to_date=None):
+        """
+        Get one page of the distinct names matching where_sql - with results
+        within from_date to to_date, if given.
+        Pages are found by keyset - seeking past the last name of the prior
+        page, or before the first name of the next one - rather than by
+        offset, so that later pages cost no more than the first.
+        Returns: (names, prev_key, next_key) - a key is None if there is no
+        page that way.
+        """
+        backward  = before is not None
+        # seek in the direction of travel, then put the page in display order:
+        seek_desc = (order == 'desc') != backward
+        window_sql, window_args = get_window_sql(from_date, to_date)
+        args = list(where_args)
+        if not search:
+            query = 'SELECT DISTINCT {0} FROM check_results WHERE {1}%s ' % window_sql
+            args.extend(window_args)
+        elif self.has_table('check_names_fts'):
+            # prefix search of each token of the search within the listed names:
+            search_cols = [name_col] + (['check_description'] if name_col == 'check_name' else [])
+            match_queries = get_match_queries(search, search_cols)
+            query = 'SELECT DISTINCT {0} FROM check_names WHERE {1} ' + MATCH_SQL * len(match_queries)
+            args.extend(match_queries)
+        elif self.has_table('check_names'):
+            query = 'SELECT DISTINCT {0} FROM check_names WHERE {1} AND {0} LIKE ? '
+            args.append('%' + search + '%')
         else:
-            names = self.submit_query(query, flat=True)
-        # Apply search if applicable.
-        if method == 'POST':
-            # If empty search, reset to full
-            if form['searchquery'] == '':
-                names = self.submit_query(query, flat=True)
-            else:
-                names = self.submit_query(search_query, args=search_args, flat=True)
-        clean_names = self.clean_strings(names)
-        return names, clean_names
-
-    def get_all_data(self, names, clean_names, month_query, day_query, passing_query):
-        # Now get history in nested dict.
-        history  = {}
-        metadata = {}
-        for i in range(len(names)):
-            name                 = names[i]
-            clean_name           = clean_names[i]
-            history[clean_name]  = {}
-            metadata[clean_name] = {}
-            row_history          = []
-            for row in self.submit_query(month_query.format(name)):
-                row_history.append([self.reformat_time(row[0], input_format="%Y-%m"), row[1]])
-            history[clean_name]['year'] = row_history
-            row_history = []
-            for row in self.submit_query(day_query.format(name)):
-                row_history.append([self.reformat_time(row[0], input_format="%Y-%m-%d"), row[1]])
-            history[clean_name]['month']   = row_history[-32:]
-            history[clean_name]['week']    = row_history[-8:]
+            query = 'SELECT DISTINCT {0} FROM check_results WHERE {1}%s AND {0} LIKE ? ' % window_sql
+            args.extend(window_args + ['%' + search + '%'])
+            window_sql = ''
+        if search and window_sql:
+            # check_names has no history - keep the names with results in the window:
+            query += 'AND {0} IN (SELECT {0} FROM check_results WHERE {1}%s) ' % window_sql
+            args.extend(list(where_args) + window_args)
+        key = before if backward else after
+        if key is not None:
+            query += 'AND {0} %s ? ' % ('<' if seek_desc else '>')
+            args.append(key)
+        query += 'ORDER BY {0} %s LIMIT ?' % ('DESC' if seek_desc else 'ASC')
+        args.append(page_size + 1)
+
+        names = self.submit_query(query.format(name_col, where_sql), args=args, flat=True)
+        more  = len(names) > page_size
+        names = names[:page_size]
+        if backward:
+            names.reverse()
+            prev_key = names[0] if (more and names) else None
+            next_key = names[-1] if names else None
+        else:
+            prev_key = names[0] if (after is not None and names) else None
+            next_key = names[-1] if more else None
+        return names, prev_key, next_key
+
+    def has_table(self, table):
+        return bool(self.submit_query("SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+                                      args=(table,)))
+
+    def search_names(self, search, limit=SEARCH_LIMIT):
+        """
+        Get the checks - with their instance, database & table - any of
+        whose names or description contain every token of search as a
+        prefix.  Uses the full-text name index written by the runner.
+        """
+        if self.has_table('check_names_fts'):
+            match_queries = get_match_queries(search)
+            query = ('SELECT instance_name, database_name, table_name, check_name, check_description '
+                     'FROM check_names '
+                     'WHERE check_type NOT IN ("setup", "teardown") ' + MATCH_SQL * len(match_queries) +
+                     'ORDER BY instance_name, database_name, table_name, check_name '
+                     'LIMIT ?')
+            args = match_queries + [limit]
+        elif self.has_table('check_names'):
+            query = ('SELECT instance_name, database_name, table_name, check_name, check_description '
+                     'FROM check_names '
+                     'WHERE (instance_name || " " || database_name || " " || table_name || " " || check_name) LIKE ? '
+                     'AND check_type NOT IN ("setup", "teardown") '
+                     'ORDER BY instance_name, database_name, table_name, check_name '
+                     'LIMIT ?')
+            args = ('%' + search + '%', limit)
+        else:
+            return []
+        return [dict(zip(SCOPE_LEVELS + ('description',), row)) for row in self.submit_query(query, args=args)]
+
+    def get_history(self, name_col, where_sql, where_args=(), granularity='day', window=None, points=None,
+                    from_date=None, to_date=None, names=None):
+        """
+        Get the violations per period of every name matching where_sql - or
+        of just the given names - as an OrderedDict of
+        name: [[period start date, violations], ...].
+        Rather than querying once per name, the query covers every name -
+        grouped by name_col.  The history may be limited to from_date to
+        to_date, and a window limits it to the latest periods up to to_date
+        - or up to the latest results of the scope.
+
+        Points downsamples each name's series to at most that many points by
+        min/max bucketing: the time range is split into points/2 buckets,
+        and only the periods with the min and max violations of each bucket
+        are kept - so spikes stay visible however long the history is.  Both
+        are computed by the query, so only the kept periods are returned.
+        """
+        if names is not None and not names:
+            return collections.OrderedDict()
+        period_format = GRANULARITY_FORMATS[granularity]
+        window_sql, window_args = get_window_sql(from_date, to_date)
+        args = list(where_args) + window_args
+        if window:
+            window_start = 'date({0}, "start of {1}", "-{2} {1}s")'.format(
+                    '?' if to_date else '(SELECT MAX(run_start_timestamp) FROM check_results WHERE %s)' % where_sql,
+                    granularity, window - 1)
+            window_sql += ' AND run_start_timestamp >= %s' % window_start
+            args.extend([to_date] if to_date else where_args)
+        where_sql += window_sql
+        if names is not None:
+            where_sql += ' AND {0} IN ({1})'.format(name_col, ', '.join(['?'] * len(names)))
+            args.extend(names)
+        query = ('WITH periods AS ('
+                    'SELECT {0} AS name, strftime("{2}", run_start_timestamp) AS period, '
+                        'MIN(julianday(run_start_timestamp)) AS day_num, SUM(check_violation_cnt) AS tot '
+                    'FROM check_results '
+                    'WHERE {1} '
+                    'GROUP BY name, period) ').format(name_col, where_sql, period_format)
+        if points:
+            query += (', buckets AS ('
+                        'SELECT name, period, tot, '
+                            'CAST((day_num - first_day_num) * ? / (last_day_num - first_day_num + 0.000001) '
+                                 'AS INTEGER) AS bucket '
+                        'FROM periods, '
+                            '(SELECT MIN(day_num) AS first_day_num, MAX(day_num) AS last_day_num FROM periods)) '
+                      # sqlite takes the bare period from the row with the max - or min - tot:
+                      'SELECT name, period, MAX(tot) FROM buckets GROUP BY name, bucket '
+                      'UNION ALL '
+                      'SELECT name, period, MIN(tot) FROM buckets GROUP BY name, bucket '
+                      'ORDER BY 1, 2')
+            args.append(max(points // 2, 1))
+        else:
+            query += 'SELECT name, period, tot FROM periods ORDER BY name, period'
+
+        history = collections.OrderedDict()
+        for name, period, tot in self.submit_query(query, args=args):
+            values = history.setdefault(name, [])
+            date = self.reformat_time(period, input_format=period_format)
+            # a bucket's min & max are the same period when it holds just one:
+            if not values or values[-1][0] != date:
+                values.append([date, tot])
+        return history
+
+    def get_status(self, name_col, where_sql, where_args=(), names=None, from_date=None, to_date=None):
+        """
+        Get the violation count of the latest results of every name
+        matching where_sql - or of just the given names.  See get_rollups.
+        """
+        rollups = self.get_rollups(name_col, where_sql, where_args, names, from_date, to_date)
+        return dict((name, violation_cnt) for name, (violation_cnt, failing_check_cnt) in rollups.items())
+
+    def get_rollups(self, name_col, where_sql, where_args=(), names=None, from_date=None, to_date=None):
+        """
+        Get the (violation count, failing check count) of the latest results
+        of every name matching where_sql - or of just the given names -
+        over each name's active checks.  Counts of -1 - unknown, ex:
+        unparseable check output - count as 0 violations, but the check's
+        rc still counts it as failing.  Read from the latest_results table
+        the runner keeps, which has just one row per check - or, for a
+        results db written by an older runner or for the latest results
+        within from_date to to_date, found within check_results.
+        """
+        args = list(where_args)
+        if names is not None:
+            if not names:
+                return {}
+            where_sql += ' AND {0} IN ({1})'.format(name_col, ', '.join(['?'] * len(names)))
+            args.extend(names)
+        window_sql, window_args = get_window_sql(from_date, to_date)
+        if not window_sql:
             try:
-                metadata[clean_name]['passing'] = self.submit_query(passing_query.format(name))[0][1]
-            except IndexError:
-                # If no tests have been run, return 0, or "Passing"
-                metadata[clean_name]['passing'] = 0
-            metadata[clean_name]['yearlen'] = len(history[clean_name]['year'])
-            metadata[clean_name]['monthlen'] = len(history[clean_name]['month'])
-            metadata[clean_name]['weeklen'] = len(history[clean_name]['week'])
-        return history, metadata
+                return dict((row[0], row[1:]) for row in self.submit_query(
+                        ('SELECT {0}, SUM(%s), SUM(%s) '
+                            'FROM latest_results '
+                            'WHERE {1} AND check_status IS NOT \'inactive\' '
+                            'GROUP BY {0}' % (VIOLATIONS_SQL, FAILING_SQL)).format(name_col, where_sql),
+                        args=args))
+            except sqlite3.OperationalError as e:
+                if 'no such table' not in str(e):
+                    raise
+        where_sql += window_sql
+        args.extend(window_args)
+        # sqlite takes the bare columns from the row with the max timestamp of each check:
+        return dict((row[0], row[1:]) for row in self.submit_query(
+                ('SELECT name, SUM(%s), SUM(%s) '
+                    'FROM (SELECT {0} AS name, MAX(run_start_timestamp), check_status, check_rc, '
+                                 'check_violation_cnt '
+                          'FROM check_results '
+                          'WHERE {1} '
+                          'GROUP BY instance_name, database_name, table_name, check_name) '
+                    'WHERE check_status IS NOT \'inactive\' '
+                    'GROUP BY name' % (VIOLATIONS_SQL, FAILING_SQL)).format(name_col, where_sql), args=args))
+
+    def get_metadata(self, names, clean_names, name_col, where_sql, where_args=(), from_date=None, to_date=None):
+        rollups = self.get_rollups(name_col, where_sql, where_args, names, from_date, to_date)
+        # If no tests have been run, return 0, or "Passing"
+        return dict((clean_name, {'passing': rollups.get(name, (0, 0))[0],
+                                  'failing': rollups.get(name, (0, 0))[1]})
+                    for name, clean_name in zip(names, clean_names))
+
+    def get_check_details(self, instance, database, table, check,
+                          after=None, before=None, page_size=PAGE_SIZE, order='desc', from_date=None, to_date=None):
+        """
+        Get one page of the results of a check - started within from_date to
+        to_date, if given - ordered by start time.
+        Pages are found by keyset, as with get_page_names, on the
+        (run_start_timestamp, rowid) of the rows - rowid breaks ties.
+        Returns: (rows, prev_key, next_key)
+        """
+        backward  = before is not None
+        seek_desc = (order == 'desc') != backward
+        query = ('SELECT rowid, check_type, '
+                    'check_mode, check_unit, check_status, run_id, '
+                    'run_start_timestamp, run_stop_timestamp '
+                'FROM check_results '
+                'WHERE instance_name=? '
+                'AND database_name=? '
+                'AND table_name=? '
+                'AND check_name=?')
+        window_sql, window_args = get_window_sql(from_date, to_date)
+        query += window_sql + ' '
+        args = [instance, database, table, check] + window_args
+        key = before if backward else after
+        if key is not None:
+            query += ('AND (run_start_timestamp {0} ? '
+                      'OR (run_start_timestamp = ? AND rowid {0} ?)) ').format('<' if seek_desc else '>')
+            args.extend([key[0], key[0], key[1]])
+        query += 'ORDER BY run_start_timestamp {0}, rowid {0} LIMIT ?'.format('DESC' if seek_desc else 'ASC')
+        args.append(page_size + 1)
+
+        rows = [dict(zip(CHECK_DETAIL_FIELDS, row[1:]), id=row[0])
+                for row in self.submit_query(query, args=args)]
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backward:
+            rows.reverse()
+        get_key = lambda row: (row['run_start_timestamp'], row['id'])
+        if backward:
+            prev_key = get_key(rows[0]) if (more and rows) else None
+            next_key = get_key(rows[-1]) if rows else None
+        else:
+            prev_key = get_key(rows[0]) if (after is not None and rows) else None
+            next_key = get_key(rows[-1]) if more else None
+        return rows, prev_key, next_key
 
 
-@app.route('/', methods=['GET', 'POST'])
-def root():
+def get_page_args(default_order='asc'):
+    page_size = request.args.get('page_size', PAGE_SIZE, type=int)
+    order     = request.args.get('order', default_order)
+    if not 0 < page_size <= MAX_PAGE_SIZE or order not in ('asc', 'desc'):
+        abort(400)
+    return page_size, order
+
+
+def get_window_args():
+    """
+    Get the from & to dates of a request - whichever of them are given, as
+    a dict that can be passed on to url_for.
+    """
+    window = {}
+    for arg in ('from', 'to'):
+        value = request.values.get(arg)
+        if value:
+            try:
+                datetime.datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                abort(400)
+            window[arg] = value
+    return window
+
+
+def get_list_page(name_col, where_sql, where_args):
+    """
+    Get the template args of one page of a list route - the names, their
+    status and the pager links.  Searches are posted from the search form,
+    but are then carried in the pager links.
+    """
     data_gen = FrontEnd()
-    try:
-        search_form_query = request.form['searchquery']
-    except KeyError:
-        search_form_query = ''
-
-    names, clean_names = data_gen.get_row_names(request.method, request.form,
-        'SELECT DISTINCT instance_name FROM check_results',
-        search_query=('SELECT DISTINCT(instance_name) '
-                            'FROM check_results '
-                            'WHERE instance_name LIKE ?'),
-        search_args=('%' + search_form_query + '%',))
-
-    history, metadata = data_gen.get_all_data(names, clean_names,
-        ('SELECT strftime("%Y-%m", run_start_timestamp) as yr_mon, SUM(check_violation_cnt) as tot '
-            'FROM check_results '
-            'WHERE instance_name="{}" '
-            'AND check_type NOT LIKE "setup_%" '
-            'GROUP BY yr_mon '
-            'ORDER BY yr_mon'),
-        ('SELECT strftime("%Y-%m-%d", run_start_timestamp) as yr_mon_day, SUM(check_violation_cnt) as tot '
-            'FROM check_results '
-            'WHERE instance_name="{}" '
-            'AND check_type NOT LIKE "setup_%" '
-            'GROUP BY yr_mon_day '
-            'ORDER BY yr_mon_day'),
-        ('SELECT run_start_timestamp, check_violation_cnt '
-            'FROM check_results '
-            'WHERE instance_name="{}" '
-            'AND check_type NOT LIKE "setup_%" '
-            'ORDER BY run_start_timestamp DESC '
-            'LIMIT 1'))
+    page_size, order = get_page_args()
+    window = get_window_args()
+    search = request.values.get('searchquery', '')
+    names, prev_key, next_key = data_gen.get_page_names(name_col, where_sql, where_args,
+                                                        search=search,
+                                                        after=request.args.get('after'),
+                                                        before=request.args.get('before'),
+                                                        page_size=page_size,
+                                                        order=order,
+                                                        from_date=window.get('from'),
+                                                        to_date=window.get('to'))
+    clean_names = data_gen.clean_strings(names)
+    url_args = dict(request.view_args, page_size=page_size, order=order, **window)
+    if search:
+        url_args['searchquery'] = search
+    pager = {'order':    order,
+             'prev_url': None if prev_key is None else url_for(request.endpoint, before=prev_key, **url_args),
+             'next_url': None if next_key is None else url_for(request.endpoint, after=next_key, **url_args),
+             'asc_url':  url_for(request.endpoint, **dict(url_args, order='asc')),
+             'desc_url': url_for(request.endpoint, **dict(url_args, order='desc'))}
+    return {'names':       names,
+            'clean_names': clean_names,
+            'metadata':    data_gen.get_metadata(names, clean_names, name_col, where_sql, where_args,
+                                                 from_date=window.get('from'), to_date=window.get('to')),
+            'pager':       pager}
 
+
+@app.route('/', methods=['GET', 'POST'])
+@cached_page
+def root():
     content = render_template('instances.html',
                         colors=colors,
-                        names=names,
-                        clean_names=clean_names,
-                        history=history,
-                        metadata=metadata)
+                        scope=get_window_args(),
+                        **get_list_page(*get_scope()))
     return content
 
 
 @app.route('/inspect/<instance>', methods=['GET', 'POST'])
+@cached_page
 def instance(instance):
-    data_gen = FrontEnd()
-    try:
-        search_form_query = request.form['searchquery']
-    except KeyError:
-        search_form_query = ''
-
-    names, clean_names = data_gen.get_row_names(request.method, request.form,
-        ('SELECT DISTINCT(database_name) '
-            'FROM check_results '
-            'WHERE instance_name=?'),
-        (instance,),
-        ('SELECT DISTINCT(database_name) '
-            'FROM check_results '
-            'WHERE instance_name=? '
-            'AND database_name LIKE ?'),
-        (instance, '%' + search_form_query + '%'))
-
-    history, metadata = data_gen.get_all_data(names, clean_names,
-        (('SELECT strftime("%Y-%m", run_start_timestamp) as yr_mon, SUM(check_violation_cnt) as tot '
-            'FROM check_results '
-            'WHERE instance_name="{}" '.format(instance)) +
-            ('AND check_type NOT LIKE "setup_%" '
-            'AND database_name="{}" '
-            'GROUP BY yr_mon '
-            'ORDER BY yr_mon')),
-        (('SELECT strftime("%Y-%m-%d", run_start_timestamp) as yr_mon_day, SUM(check_violation_cnt) as tot '
-            'FROM check_results '
-            'WHERE instance_name="{}" '.format(instance)) +
-            ('AND check_type NOT LIKE "setup_%" '
-            'AND database_name="{}" '
-            'GROUP BY yr_mon_day '
-            'ORDER BY yr_mon_day')),
-        (('SELECT run_start_timestamp, check_violation_cnt '
-            'FROM check_results '
-            'WHERE instance_name="{}" '.format(instance)) +
-            ('AND check_type NOT LIKE "setup_%" '
-            'AND database_name="{}" '
-            'ORDER BY run_start_timestamp DESC '
-            'LIMIT 1')))
-
     content = render_template('databases.html',
                                 instance=instance,
                                 colors=colors,
-                                names=names,
-                                clean_names=clean_names,
-                                history=history,
-                                metadata=metadata)
+                                scope=dict(get_window_args(), instance=instance),
+                                **get_list_page(*get_scope(instance)))
     return content
 
 
 @app.route('/inspect/<instance>/<database>', methods=['GET', 'POST'])
+@cached_page
 def database(instance, database):
-    data_gen = FrontEnd()
-    try:
-        search_form_query = request.form['searchquery']
-    except KeyError:
-        search_form_query = ''
-
-    names, clean_names = data_gen.get_row_names(request.method, request.form,
-        ('SELECT DISTINCT table_name '
-            'FROM check_results '
-            'WHERE instance_name=? '
-            'AND database_name=?'),
-        (instance, database),
-        ('SELECT DISTINCT table_name '
-            'FROM check_results '
-            'WHERE instance_name=? '
-            'AND database_name=? '
-            'AND table_name LIKE ?'),
-        (instance, database, '%' + search_form_query + '%'))
-
-    history, metadata = data_gen.get_all_data(names, clean_names,
-        (('SELECT strftime("%Y-%m", run_start_timestamp) as yr_mon, SUM(check_violation_cnt) as tot '
-            'FROM check_results '
-            'WHERE instance_name="{}" '
-            'AND check_type NOT LIKE "setup_%" '
-            'AND database_name="{}" '.format(instance, database)) +
-            ('AND table_name="{}" '
-            'GROUP BY yr_mon '
-            'ORDER BY yr_mon')),
-        (('SELECT strftime("%Y-%m-%d", run_start_timestamp) as yr_mon_day, SUM(check_violation_cnt) as tot '
-            'FROM check_results '
-            'WHERE instance_name="{}" '
-            'AND check_type NOT LIKE "setup_%" '
-            'AND database_name="{}" '.format(instance, database)) +
-            ('AND table_name="{}" '
-            'GROUP BY yr_mon_day '
-            'ORDER BY yr_mon_day')),
-        (('SELECT run_start_timestamp, check_violation_cnt '
-            'FROM check_results '
-            'WHERE instance_name="{}" '
-            'AND check_type NOT LIKE "setup_%" '
-            'AND database_name="{}" '.format(instance, database)) +
-            ('AND table_name="{}" '
-            'ORDER BY run_start_timestamp DESC '
-            'LIMIT 1')))
-
     content = render_template('tables.html',
                                 database=database,
                                 instance=instance,
                                 colors=colors,
-                                names=names,
-                                clean_names=clean_names,
-                                history=history,
-                                metadata=metadata)
+                                scope=dict(get_window_args(), instance=instance, database=database),
+                                **get_list_page(*get_scope(instance, database)))
     return content
 
 
 @app.route('/inspect/<instance>/<database>/<table>', methods=['GET', 'POST'])
+@cached_page
 def table(instance, database, table):
-    data_gen = FrontEnd()
-    try:
-        search_form_query = request.form['searchquery']
-    except KeyError:
-        search_form_query = ''
-
-    names, clean_names = data_gen.get_row_names(request.method, request.form,
-        ('SELECT DISTINCT check_name '
-            'FROM check_results '
-            'WHERE instance_name=? '
-            'AND database_name=? '
-            'AND check_name NOT LIKE "setup_%" '
-            'AND table_name=?'),
-        (instance, database, table),
-        ('SELECT DISTINCT table_name '
-            'FROM check_results '
-            'WHERE instance_name=? '
-            'AND database_name=? '
-            'AND table_name=? '
-            'AND check_name NOT LIKE "setup_%" '
-            'AND check_name LIKE ?'),
-        (instance, database, table, '%' + search_form_query + '%'))
-
-    history, metadata = data_gen.get_all_data(names, clean_names,
-        (('SELECT strftime("%Y-%m", run_start_timestamp) as yr_mon, SUM(check_violation_cnt) as tot '
-            'FROM check_results '
-            'WHERE instance_name="{}" '
-            'AND check_name NOT LIKE "setup_%" '
-            'AND database_name="{}" '
-            'AND table_name="{}" '.format(instance, database, table)) +
-            ('AND check_name="{}" '
-            'GROUP BY yr_mon '
-            'ORDER BY yr_mon')),
-        (('SELECT strftime("%Y-%m-%d", run_start_timestamp) as yr_mon_day, SUM(check_violation_cnt) as tot '
-            'FROM check_results '
-            'WHERE instance_name="{}" '
-            'AND check_name NOT LIKE "setup_%" '
-            'AND database_name="{}" '
-            'AND table_name="{}" '.format(instance, database, table)) +
-            ('AND check_name="{}" '
-            'GROUP BY yr_mon_day '
-            'ORDER BY yr_mon_day')),
-        (('SELECT run_start_timestamp, check_violation_cnt '
-            'FROM check_results '
-            'WHERE instance_name="{}" '
-            'AND check_name NOT LIKE "setup_%" '
-            'AND database_name="{}" '
-            'AND table_name="{}" '.format(instance, database, table)) +
-            ('AND check_name="{}" '
-            'ORDER BY run_start_timestamp DESC '
-            'LIMIT 1')))
-
     content = render_template('checks.html',
                                 instance=instance,
                                 database=database,
                                 table=table,
                                 colors=colors,
-                                names=names,
-                                clean_names=clean_names,
-                                history=history,
-                                metadata=metadata)
+                                scope=dict(get_window_args(), instance=instance, database=database, table=table),
+                                **get_list_page(*get_scope(instance, database, table)))
     return content
 
 
 @app.route('/inspect/<instance>/<database>/<table>/<check>', methods=['GET', 'POST'])
+@cached_page
 def checkdetails(instance, database, table, check):
     data_gen = FrontEnd()
-    raw_history = data_gen.submit_query(('SELECT check_type, '
-                                    'check_mode, check_unit, check_status, run_id, '
-                                    'run_start_timestamp, run_stop_timestamp '
-                                'FROM check_results '
-                                'WHERE instance_name=? '
-                                'AND database_name=? '
-                                'AND table_name=? '
-                                'AND check_name=?'),
-                                args=(instance, database, table, check))
-
     get_tables = lambda : data_gen.submit_query(('SELECT DISTINCT(table_name) '
                                         'FROM check_results '
                                         'WHERE instance_name=? '
@@ -388,31 +796,6 @@ def checkdetails(instance, database, table, check):
                                     args=(instance, database, table, check), flat=True)
     tables = get_tables()
 
-    history = {'year':[], 'month':[], 'week':[]}
-    for row in data_gen.submit_query(('SELECT strftime("%Y-%m", run_start_timestamp) as yr_mon, SUM(check_violation_cnt) as tot '
-                                'FROM check_results '
-                                'WHERE instance_name=? '
-                                'AND database_name=? '
-                                'AND table_name=? '
-                                'AND check_name=? '
-                                'GROUP BY yr_mon '
-                                'ORDER BY yr_mon'),
-                                args=(instance, database, table, check)):
-        history['year'].append([data_gen.reformat_time(row[0], input_format="%Y-%m"), row[1]])
-    for row in data_gen.submit_query(('SELECT strftime("%Y-%m-%d", run_start_timestamp) as yr_mon_day, SUM(check_violation_cnt) as tot '
-                                'FROM check_results '
-                                'WHERE instance_name=? '
-                                'AND database_name=? '
-                                'AND table_name=? '
-                                'AND check_name=? '
-                                'GROUP BY yr_mon_day '
-                                'ORDER BY yr_mon_day'),
-                                args=(instance, database, table, check)):
-        history['month'].append([data_gen.reformat_time(row[0], input_format="%Y-%m-%d"), row[1]])
-        history['week'].append([data_gen.reformat_time(row[0], input_format="%Y-%m-%d"), row[1]])
-    history['month'] = history['month'][-32:]
-    history['week'] = history['week'][-8:]
-
     #desc = 'Proin suscipit luctus orci placerat fringilla. Donec hendrerit laoreet risus eget adipiscing. Suspendisse in urna ligula, a volutpat mauris. Sed enim mi, bibendum eu pulvinar vel, sodales vitae dui. Pellentesque sed sapien lorem, at lacinia urna. In hac habitasse platea dictumst. Vivamus vel justo in leo laoreet ullamcorper non vitae lorem. Lorem ipsum dolor sit amet, consectetur adipiscing elit. Proin bibendum ullamcorper rutrum.'
     desc = ''
 
@@ -421,13 +804,142 @@ def checkdetails(instance, database, table, check):
                         database=database,
                         table=table,
                         check=check,
-                        raw_history=raw_history,
                         tables=tables,
                         desc=desc,
                         colors=colors,
-                        history=history)
+                        scope=dict(get_window_args(), instance=instance, database=database, table=table,
+                                   check=check))
     return content
 
 
+def get_api_scope():
+    """
+    Get the scope args of an api request - a level may only be given
+    along with every level above it.
+    """
+    scope = dict((level, request.args.get(level)) for level in SCOPE_LEVELS)
+    given = [scope[level] is not None for level in SCOPE_LEVELS]
+    if given != sorted(given, reverse=True):
+        abort(400)
+    return scope
+
+
+def json_response(data):
+    return (json.dumps(data), 200, {'Content-Type': 'application/json'})
+
+
+@app.route('/api/v1/history')
+@cached_page
+def api_history():
+    """
+    Violations per period of every entity within a level - or of one check.
+    Args: the scope levels, from & to dates, a chart tab whose defaults
+    apply to the rest - a granularity of day or month, a window of the
+    latest periods to return and the max points per series - and any
+    number of name args, that limit the entities to those of a list page.
+    An empty name arg limits them to none.
+    """
+    tab = request.args.get('tab')
+    if tab is not None and tab not in HISTORY_TABS:
+        abort(400)
+    defaults = HISTORY_TABS.get(tab, {})
+    granularity = request.args.get('granularity', defaults.get('granularity', 'day'))
+    if granularity not in GRANULARITY_FORMATS:
+        abort(400)
+    window = request.args.get('window', defaults.get('window'), type=int)
+    points = request.args.get('points', defaults.get('points', HISTORY_POINTS), type=int)
+    if not 2 <= points <= MAX_HISTORY_POINTS:
+        abort(400)
+    dates = get_window_args()
+    names = request.args.getlist('name')
+    history = FrontEnd().get_history(*get_scope(**get_api_scope()), granularity=granularity, window=window,
+                                     points=points, from_date=dates.get('from'), to_date=dates.get('to'),
+                                     names=[x for x in names if x] if names else None)
+    series = [{'key': name, 'color': colors[i % len(colors)], 'values': values}
+              for i, (name, values) in enumerate(history.items())]
+    return json_response({'granularity': granularity, 'points': points, 'series': series})
+
+
+@app.route('/api/v1/status')
+@cached_page
+def api_status():
+    """
+    Violation count of the latest result of every entity within a level.
+    Args: the scope levels, from & to dates.
+    """
+    dates = get_window_args()
+    return json_response({'status': FrontEnd().get_status(*get_scope(**get_api_scope()),
+                                                          from_date=dates.get('from'), to_date=dates.get('to'))})
+
+
+@app.route('/api/v1/search')
+@cached_page
+def api_search():
+    """
+    Typeahead search of the checks.
+    Args: q - the search, limit - the max number of checks to return.
+    """
+    limit = request.args.get('limit', SEARCH_LIMIT, type=int)
+    if not 0 < limit <= MAX_SEARCH_LIMIT:
+        abort(400)
+    checks = FrontEnd().search_names(request.args.get('q', ''), limit)
+    for check in checks:
+        check['url'] = url_for('checkdetails', **dict((level, check[level]) for level in SCOPE_LEVELS))
+    return json_response({'checks': checks})
+
+
+@app.route('/api/v1/events')
+def api_events():
+    """
+    Server-sent events stream of the progress of the latest run - see
+    follow_events.  Not found unless config.json has an events_file.
+    """
+    if not events_file:
+        abort(404)
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return Response(follow_events(events_file, last_event_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/live')
+def live():
+    """
+    Live view of the latest run - follows /api/v1/events.
+    """
+    return render_template('live.html', events_enabled=bool(events_file))
+
+
+@app.route('/api/v1/checkdetails')
+@cached_page
+def api_checkdetails():
+    """
+    One page of the results of a check.
+    Args: the scope levels down to check, from & to dates, page_size, order
+    of start time (desc by default) and the after or before key of a prior
+    response.
+    Keys are "<run_start_timestamp>,<id>".
+    """
+    scope = get_api_scope()
+    if scope['check'] is None:
+        abort(400)
+    page_size, order = get_page_args(default_order='desc')
+    keys = {}
+    for direction in ('after', 'before'):
+        if request.args.get(direction) is not None:
+            run_start_timestamp, _, rowid = request.args[direction].rpartition(',')
+            if not rowid.isdigit():
+                abort(400)
+            keys[direction] = (run_start_timestamp, int(rowid))
+    dates = get_window_args()
+    rows, prev_key, next_key = FrontEnd().get_check_details(page_size=page_size, order=order,
+                                                            from_date=dates.get('from'), to_date=dates.get('to'),
+                                                            **dict(scope, **keys))
+    url_args = dict(scope, page_size=page_size, order=order, **dates)
+    return json_response({
+        'rows':     rows,
+        'prev_url': None if prev_key is None else url_for('api_checkdetails', before='%s,%d' % prev_key, **url_args),
+        'next_url': None if next_key is None else url_for('api_checkdetails', after='%s,%d' % next_key, **url_args)})
+
+
 if __name__ == '__main__':
     sys.exit(main())
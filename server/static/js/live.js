@@ -0,0 +1,85 @@
+/*
+    This source code is protected by the BSD license.  See the file "LICENSE"
+    in the source code root directory for the full language or refer to it here:
+    http://opensource.org/licenses/BSD-3-Clause
+    Copyright 2015 Will Farmer and Ken Farmer
+*/
+
+var MAX_FINISHED_ROWS = 500;
+
+function newRun(event) {
+    return {run_id: event.run_id, instance: event.instance, database: event.database,
+            table_cnt: event.table_cnt || 0, tables_started: 0, start_ts: event.ts, stop_ts: null,
+            max_rc: 0, finished_cnt: 0, failed_cnt: 0, running: {}, finished: []};
+};
+
+function applyEvent(run, event) {
+    var key = event.table + '.' + event.check;
+    if (event.event == 'table_started') {
+        run.tables_started = event.table_num + 1;
+    } else if (event.event == 'check_started') {
+        run.running[key] = event;
+    } else if (event.event == 'check_finished') {
+        delete run.running[key];
+        run.max_rc = Math.max(run.max_rc, event.rc);
+        run.finished_cnt += 1;
+        if (event.rc != 0 || event.violations > 0) {
+            run.failed_cnt += 1;
+        }
+        // only the latest rows are kept - finished_cnt counts them all:
+        run.finished.unshift(event);
+        run.finished.length = Math.min(run.finished.length, MAX_FINISHED_ROWS);
+    } else if (event.event == 'run_finished') {
+        run.stop_ts = event.ts;
+        run.max_rc = event.max_rc;
+        run.running = {};
+    }
+};
+
+function formatTs(ts) {
+    return new Date(ts * 1000).toLocaleTimeString();
+};
+
+function renderRun(run) {
+    var now = run.stop_ts || Date.now() / 1000;
+    var state = run.stop_ts ? 'finished with rc ' + run.max_rc : 'running';
+    $('#runSummary').text(run.instance + ' > ' + run.database + ' - run ' + run.run_id + ' ' + state +
+                          ' - table ' + run.tables_started + ' of ' + run.table_cnt +
+                          ' - ' + run.finished_cnt + ' checks finished, ' + run.failed_cnt +
+                          ' with errors or violations - ' + Math.round(now - run.start_ts) + ' secs');
+    var pct = run.stop_ts ? 100 : (run.table_cnt ? 100 * Math.max(run.tables_started - 1, 0) / run.table_cnt : 0);
+    $('#runProgress').css('width', pct + '%').toggleClass('progress-bar-danger', run.max_rc != 0);
+
+    var running = $.map(run.running, function(event) {
+        return {table: event.table, check: event.check, check_type: event.check_type,
+                started: formatTs(event.ts), elapsed: Math.round(now - event.ts)};
+    }).sort(function(a, b) { return b.elapsed - a.elapsed; });
+    $('#runningTable').bootstrapTable('load', running);
+    $('#finishedTable').bootstrapTable('load', $.map(run.finished, function(event) {
+        return $.extend({finished: formatTs(event.ts)}, event);
+    }));
+};
+
+function followRun(url) {
+    // Events are applied as they arrive, but only rendered once a second -
+    // following a run part way through replays all of its events at once:
+    var run = null;
+    var changed = false;
+    var source = new EventSource(url);
+    source.onmessage = function(message) {
+        var event = JSON.parse(message.data);
+        if (run === null || event.run_id != run.run_id) {
+            run = newRun(event);
+        }
+        applyEvent(run, event);
+        changed = true;
+    };
+    setInterval(function() {
+        // elapsed times of running checks change even without events:
+        if (run && (changed || !run.stop_ts)) {
+            renderRun(run);
+            changed = false;
+        }
+    }, 1000);
+    return source;
+};
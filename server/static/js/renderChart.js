@@ -33,3 +33,36 @@ function addGraphTo(location, datafunc) {
 
     return chart;
 };
+
+function loadGraphInto(location, url) {
+    // Render an empty chart now, then fill it in once its series arrive:
+    var chart = addGraphTo(location, function() { return []; });
+    $.getJSON(url, function(data) {
+        d3.select(location)
+                .datum(toChartSeries(data.series))
+                .call(chart);
+    });
+    return chart;
+};
+
+function toChartSeries(series) {
+    return series.map(function(s) {
+        return {
+            key: s.key,
+            color: s.color,
+            values: s.values.map(function(row) {
+                return {x: new Date(row[0]), y: row[1]};
+            })
+        };
+    });
+};
+
+function getHistoryUrl(scope, tab) {
+    // scope holds the levels - and any from & to dates & names - of the page:
+    var args = $.extend({tab: tab}, scope);
+    if (args.name && args.name.length == 0) {
+        // a page without names charts none of them, rather than its whole scope:
+        args.name = [''];
+    }
+    return '/api/v1/history?' + $.param(args, true);
+};
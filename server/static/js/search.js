@@ -0,0 +1,28 @@
+/*
+    This source code is protected by the BSD license.  See the file "LICENSE"
+    in the source code root directory for the full language or refer to it here:
+    http://opensource.org/licenses/BSD-3-Clause
+    Copyright 2015 Will Farmer and Ken Farmer
+*/
+
+function addTypeahead(input, menu) {
+    // Suggest checks as the search is typed - waiting for a pause in typing:
+    var timer = null;
+    $(input).on('input', function() {
+        var q = $(this).val();
+        clearTimeout(timer);
+        if (!q) {
+            $(menu).hide();
+            return;
+        }
+        timer = setTimeout(function() {
+            $.getJSON('/api/v1/search', {q: q}, function(data) {
+                var items = data.checks.map(function(check) {
+                    var label = [check.instance, check.database, check.table, check.check].join(' > ');
+                    return $('<li>').append($('<a>').attr('href', check.url).attr('title', check.description || '').text(label));
+                });
+                $(menu).empty().append(items).toggle(items.length > 0);
+            });
+        }, 150);
+    });
+};
@@ -9,7 +9,39 @@
 
 # Run PyTest 2!!!!!
 
+import sys, os, shutil
+import tempfile, datetime, threading, sqlite3, json
+import pytest
+from os.path import dirname
+from os.path import join as pjoin
+
+sys.path.insert(0, dirname(dirname(dirname(os.path.abspath(__file__)))))
 import hadinsp_httpserver as server
+import hadoopinspector.check_results as check_results
+
+# the server is imported through a symlink - point flask at its real templates:
+server.app.root_path = dirname(dirname(os.path.abspath(__file__)))
+
+
+def create_results_db(db_fqfn, day_cnt=40, table_cnt=3):
+    """ Writes one run per day - the last day of which has violations on
+        table_0.
+    """
+    start_dt = datetime.datetime(2016, 1, 1, 1, 0, 0)
+    for day in range(day_cnt):
+        run_dt  = start_dt + datetime.timedelta(days=day)
+        results = check_results.CheckResults('inst1', 'db1', db_fqfn)
+        for table_num in range(table_cnt):
+            table = 'table_%d' % table_num
+            results.add(table, 'setup_check', 0, 0, check_type='setup',
+                        run_start_timestamp=run_dt, run_stop_timestamp=run_dt)
+            for check in ('check-a', 'check_b'):
+                violations = 5 if (day == day_cnt - 1 and table_num == 0) else 0
+                results.add(table, check, violations, 0,
+                            run_start_timestamp=run_dt, run_stop_timestamp=run_dt)
+        results.write_to_sqlite()
+
+
 
 class TestServer(object):
     def setup_method(self, method):
@@ -19,3 +51,564 @@ class TestServer(object):
     def test_python_versioning(self):
         assert(self.frontend.python2 == True)
         assert(self.frontend.python3 == False)
+
+
+
+class TestHistoryAndStatus(object):
+
+    def setup_method(self, method):
+        self.temp_dir = tempfile.mkdtemp(prefix='hadinsp_')
+        self.db_fqfn  = pjoin(self.temp_dir, 'results.sqlite')
+        create_results_db(self.db_fqfn)
+        self.frontend = server.FrontEnd()
+        self.frontend.get_database = lambda: self.db_fqfn
+        self.queries  = []
+        submit_query  = self.frontend.submit_query
+        def counting_submit_query(query_string, args=None, flat=False):
+            self.queries.append(query_string)
+            return submit_query(query_string, args, flat)
+        self.frontend.submit_query = counting_submit_query
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.temp_dir)
+
+    def test_history(self):
+        scope = server.get_scope('inst1', 'db1')
+        year = self.frontend.get_history(*scope, granularity='month')
+        week = self.frontend.get_history(*scope, granularity='day', window=8)
+        assert len(self.queries) == 2
+        assert list(year) == ['table_0', 'table_1', 'table_2']
+        assert year['table_0'] == [['2016-01-01', 0], ['2016-02-01', 10]]
+        assert len(week['table_0']) == 8
+        assert week['table_0'][-1] == ['2016-02-09', 10]
+        assert week['table_1'][-1] == ['2016-02-09', 0]
+        assert len(self.frontend.get_history(*scope)['table_0']) == 40
+
+    def test_history_of_names(self):
+        scope = server.get_scope('inst1', 'db1')
+        history = self.frontend.get_history(*scope, window=8, names=['table_0', 'table_2'])
+        assert list(history) == ['table_0', 'table_2']
+        assert history['table_0'][-1] == ['2016-02-09', 10]
+        assert self.frontend.get_history(*scope, names=[]) == {}
+
+    def test_window_in_query(self):
+        week = self.frontend.get_history(*server.get_scope('inst1', 'db1', 'table_0'), window=8)
+        assert len(self.queries) == 1
+        assert 'SUM(check_violation_cnt)' in self.queries[0]
+        assert '"start of day", "-7 days")' in self.queries[0]
+        assert [x[0] for x in week['check-a']] == ['2016-02-%02d' % day for day in range(2, 10)]
+
+    def test_dates(self):
+        scope = server.get_scope('inst1', 'db1', 'table_0')
+        history = self.frontend.get_history(*scope, from_date='2016-01-10', to_date='2016-01-12')
+        assert history['check-a'] == [['2016-01-10', 0], ['2016-01-11', 0], ['2016-01-12', 0]]
+        #--- a window ends at the to date:
+        history = self.frontend.get_history(*scope, window=3, to_date='2016-02-09')
+        assert [x[0] for x in history['check-a']] == ['2016-02-07', '2016-02-08', '2016-02-09']
+        assert self.frontend.get_status(*scope) == {'check-a': 5, 'check_b': 5}
+        assert self.frontend.get_status(*scope, to_date='2016-02-08') == {'check-a': 0, 'check_b': 0}
+        assert self.frontend.get_page_names(*server.get_scope('inst1', 'db1'), from_date='2017-01-01') == \
+            ([], None, None)
+        assert self.frontend.get_page_names(*server.get_scope('inst1', 'db1'), search='_1',
+                                            to_date='2016-01-01') == (['table_1'], None, None)
+        assert self.frontend.get_page_names(*server.get_scope('inst1', 'db1'), search='_1',
+                                            to_date='2015-12-31') == ([], None, None)
+        rows, prev_key, next_key = self.frontend.get_check_details('inst1', 'db1', 'table_0', 'check_b',
+                                                                   from_date='2016-01-30')
+        assert [x['run_start_timestamp'][:10] for x in rows] == ['2016-02-%02d' % day for day in range(9, 0, -1)] + \
+                                                               ['2016-01-31', '2016-01-30']
+        assert 'run_start_timestamp >= ?' in self.queries[-1]
+
+    def test_downsampled_history(self):
+        conn = sqlite3.connect(self.db_fqfn)
+        conn.execute("UPDATE check_results SET check_violation_cnt = 100 "
+                     "WHERE table_name = 'table_1' AND check_name = 'check-a' "
+                     "AND run_start_timestamp LIKE '2016-01-17%'")
+        conn.commit()
+        conn.close()
+        scope = server.get_scope('inst1', 'db1')
+        history = self.frontend.get_history(*scope, points=10)
+        assert len(self.queries) == 1
+        assert all(len(values) <= 10 for values in history.values())
+        assert ['2016-01-17', 100] in history['table_1']
+        assert history['table_0'][-1] == ['2016-02-09', 10]
+        assert history['table_2'] == [x for x in history['table_2'] if x[1] == 0]
+        #--- a series shorter than the points is untouched:
+        assert self.frontend.get_history(*scope, points=100) == self.frontend.get_history(*scope)
+        assert self.frontend.get_history(*scope, granularity='month', points=2)['table_0'] == \
+            [['2016-01-01', 0], ['2016-02-01', 10]]
+
+    def test_status(self):
+        assert self.frontend.get_status(*server.get_scope('inst1', 'db1')) == {'table_0': 10, 'table_1': 0,
+                                                                               'table_2': 0}
+        assert self.frontend.get_status(*server.get_scope('inst1', 'db1', 'table_0', 'check-a')) == {'check-a': 5}
+        assert self.frontend.get_status(*server.get_scope()) == {'inst1': 10}
+        assert len(self.queries) == 3
+        assert all('FROM latest_results' in x for x in self.queries)
+
+    def test_status_without_latest_results(self):
+        conn = sqlite3.connect(self.db_fqfn)
+        conn.execute('DROP VIEW latest_table_status')
+        conn.execute('DROP VIEW latest_database_status')
+        conn.execute('DROP TABLE latest_results')
+        conn.commit()
+        conn.close()
+        assert self.frontend.get_status(*server.get_scope('inst1', 'db1')) == {'table_0': 10, 'table_1': 0,
+                                                                               'table_2': 0}
+        assert self.frontend.get_status(*server.get_scope('inst1', 'db1', 'table_0')) == {'check-a': 5,
+                                                                                         'check_b': 5}
+
+    def test_status_skips_sentinels(self):
+        run_dt  = datetime.datetime(2016, 2, 9, 1, 0, 0)
+        results = check_results.CheckResults('inst1', 'db1', self.db_fqfn)
+        results.add('table_1', 'check_inactive', -1, -1, check_status='inactive',
+                    run_start_timestamp=run_dt, run_stop_timestamp=run_dt)
+        results.add('table_1', 'check_unparseable', -1, 202,
+                    run_start_timestamp=run_dt, run_stop_timestamp=run_dt)
+        results.write_to_sqlite()
+        scope = server.get_scope('inst1', 'db1')
+        assert self.frontend.get_status(*scope)['table_1'] == 0
+        assert self.frontend.get_status(*scope, to_date='2016-02-09')['table_1'] == 0
+        assert self.frontend.get_status(*server.get_scope('inst1', 'db1', 'table_1')) == \
+            {'check-a': 0, 'check_b': 0, 'check_unparseable': 0}
+        #--- an unparseable check has no known violations, but is still failing:
+        for to_date in (None, '2016-02-09'):
+            assert self.frontend.get_rollups(*scope, to_date=to_date)['table_1'] == (0, 1)
+            metadata = self.frontend.get_metadata(['check-a', 'check_unparseable'], ['check_a', 'check_unparseable'],
+                                                  *server.get_scope('inst1', 'db1', 'table_1'), to_date=to_date)
+            assert metadata == {'check_a': {'passing': 0, 'failing': 0},
+                                'check_unparseable': {'passing': 0, 'failing': 1}}
+
+    def test_metadata_with_clean_names(self):
+        names = ['check-a', 'check_b', 'missing']
+        metadata = self.frontend.get_metadata(names, self.frontend.clean_strings(names),
+                                              *server.get_scope('inst1', 'db1', 'table_0'))
+        assert len(self.queries) == 1
+        assert metadata == {'check_a': {'passing': 5, 'failing': 1}, 'check_b': {'passing': 5, 'failing': 1},
+                            'missing': {'passing': 0, 'failing': 0}}
+
+    def test_scope_excludes_setup_checks(self):
+        assert list(self.frontend.get_history(*server.get_scope('inst1', 'db1', 'table_0'))) == ['check-a',
+                                                                                                 'check_b']
+
+    def test_status_of_names(self):
+        scope = server.get_scope('inst1', 'db1')
+        assert self.frontend.get_status(*scope, names=['table_0', 'table_2']) == {'table_0': 10, 'table_2': 0}
+        assert self.frontend.get_status(*scope, names=[]) == {}
+
+    def test_page_names(self):
+        scope = server.get_scope('inst1', 'db1')
+        assert self.frontend.get_page_names(*scope, page_size=2) == (['table_0', 'table_1'], None, 'table_1')
+        assert self.frontend.get_page_names(*scope, after='table_1', page_size=2) == (['table_2'], 'table_2', None)
+        assert self.frontend.get_page_names(*scope, before='table_2', page_size=2) == (['table_0', 'table_1'],
+                                                                                        None, 'table_1')
+        assert self.frontend.get_page_names(*scope, before='table_2', page_size=1) == (['table_1'],
+                                                                                        'table_1', 'table_1')
+        assert self.frontend.get_page_names(*scope, page_size=2, order='desc') == (['table_2', 'table_1'],
+                                                                                    None, 'table_1')
+        assert self.frontend.get_page_names(*scope, after='table_1', order='desc') == (['table_0'], 'table_0',
+                                                                                        None)
+        assert self.frontend.get_page_names(*scope, search='_2') == (['table_2'], None, None)
+        assert all('LIMIT' in x for x in self.queries if 'sqlite_master' not in x)
+
+    def test_search_names(self):
+        assert self.frontend.get_page_names(*server.get_scope('inst1', 'db1', 'table_0'),
+                                            search='check b') == (['check_b'], None, None)
+        assert self.frontend.get_page_names(*server.get_scope('inst1', 'db1', 'table_0'),
+                                            search='setup') == ([], None, None)
+        checks = self.frontend.search_names('tab_1 chec')
+        assert [x['check'] for x in checks] == ['check-a', 'check_b']
+        assert checks[0] == {'instance': 'inst1', 'database': 'db1', 'table': 'table_1', 'check': 'check-a',
+                             'description': None}
+        assert len(self.frontend.search_names('inst1', limit=4)) == 4
+        assert self.frontend.search_names('missing') == []
+        assert self.frontend.search_names('') == []
+
+    def test_search_without_fts(self):
+        conn = sqlite3.connect(self.db_fqfn)
+        conn.execute('DROP TABLE check_names_fts')
+        conn.commit()
+        conn.close()
+        assert self.frontend.get_page_names(*server.get_scope('inst1', 'db1'), search='_2') == (['table_2'],
+                                                                                              None, None)
+        assert [x['table'] for x in self.frontend.search_names('table_2')] == ['table_2', 'table_2']
+
+    def test_match_queries(self):
+        assert server.get_match_queries(u'Cust_Ev') == [u'cust*', u'ev*']
+        assert server.get_match_queries(u'cust', ['table_name']) == [u'table_name:cust*']
+        assert server.get_match_queries(u'ck', ['check_name', 'check_description']) == \
+            [u'check_name:ck* OR check_description:ck*']
+        assert server.get_match_queries(u'"*:-') == [u'""']
+
+    def test_check_details_pages(self):
+        rows, prev_key, next_key = self.frontend.get_check_details('inst1', 'db1', 'table_0', 'check_b',
+                                                                   page_size=15)
+        assert len(rows) == 15
+        assert sorted(rows[0]) == sorted(server.CHECK_DETAIL_FIELDS + ('id',))
+        assert rows[0]['run_start_timestamp'] == '2016-02-09 01:00:00'
+        assert prev_key is None
+        assert next_key == (rows[-1]['run_start_timestamp'], rows[-1]['id'])
+        seen = [x['id'] for x in rows]
+        while next_key:
+            rows, prev_key, next_key = self.frontend.get_check_details('inst1', 'db1', 'table_0', 'check_b',
+                                                                       after=next_key, page_size=15)
+            seen.extend(x['id'] for x in rows)
+        assert len(rows) == 10
+        assert len(set(seen)) == 40
+        rows, prev_key, next_key = self.frontend.get_check_details('inst1', 'db1', 'table_0', 'check_b',
+                                                                   before=prev_key, page_size=15)
+        assert [x['id'] for x in rows] == seen[15:30]
+        rows, prev_key, next_key = self.frontend.get_check_details('inst1', 'db1', 'table_0', 'check_b',
+                                                                   page_size=15, order='asc')
+        assert rows[0]['run_start_timestamp'] == '2016-01-01 01:00:00'
+
+
+
+class TestConnections(object):
+
+    def setup_method(self, method):
+        self.temp_dir = tempfile.mkdtemp(prefix='hadinsp_')
+        self.db_fqfn  = pjoin(self.temp_dir, 'results.sqlite')
+        create_results_db(self.db_fqfn, day_cnt=2)
+        server.database_file = self.db_fqfn
+        server.connection_pool.queue.clear()
+        self.frontend = server.FrontEnd()
+
+    def teardown_method(self, method):
+        server.database_file = None
+        server.connection_pool.queue.clear()
+        shutil.rmtree(self.temp_dir)
+
+    def test_database_resolved_once(self):
+        self.frontend.find_file = None   # would fail if called
+        assert self.frontend.get_database() == self.db_fqfn
+
+    def test_connection_per_thread(self):
+        connection = self.frontend.get_connection()
+        assert self.frontend.get_connection() is connection
+        thread_connections = []
+        thread = threading.Thread(target=lambda: thread_connections.append(self.frontend.get_connection()))
+        thread.start()
+        thread.join()
+        assert thread_connections[0] is not connection
+
+    def test_requests_share_pooled_connection(self):
+        client = server.app.test_client()
+        responses = [client.get('/api/v1/status?instance=inst1&database=db1')]
+        assert server.connection_pool.qsize() == 1
+        pooled = server.connection_pool.queue[0]
+        #--- the server runs each request in a new thread:
+        thread = threading.Thread(target=lambda: responses.append(
+                    client.get('/api/v1/status?instance=inst1&database=db1')))
+        thread.start()
+        thread.join()
+        assert [x.status_code for x in responses] == [200, 200]
+        assert list(server.connection_pool.queue) == [pooled]
+
+    def test_read_only(self):
+        with pytest.raises(sqlite3.OperationalError):
+            self.frontend.submit_query('DELETE FROM check_results')
+
+    def test_reconnects_after_db_replaced(self):
+        connection = self.frontend.get_connection()
+        new_db_fqfn = pjoin(self.temp_dir, 'new_results.sqlite')
+        create_results_db(new_db_fqfn, day_cnt=3)
+        os.rename(new_db_fqfn, self.db_fqfn)
+        assert self.frontend.get_connection() is not connection
+        assert self.frontend.submit_query('SELECT COUNT(DISTINCT run_start_timestamp) FROM check_results',
+                                          flat=True) == [3]
+
+    def test_routes(self):
+        client = server.app.test_client()
+        for url in ('/', '/inspect/inst1', '/inspect/inst1/db1', '/inspect/inst1/db1/table_0',
+                    '/inspect/inst1/db1/table_0/check_b'):
+            response = client.get(url)
+            assert response.status_code == 200
+        assert 'table_2' in client.get('/inspect/inst1/db1').data
+
+
+
+class TestPageCache(object):
+
+    def setup_method(self, method):
+        self.temp_dir = tempfile.mkdtemp(prefix='hadinsp_')
+        self.db_fqfn  = pjoin(self.temp_dir, 'results.sqlite')
+        create_results_db(self.db_fqfn, day_cnt=2)
+        server.database_file = self.db_fqfn
+        server.page_cache.clear()
+        self.client   = server.app.test_client()
+        self.queries  = []
+        submit_query  = server.FrontEnd.submit_query
+        def counting_submit_query(frontend, query_string, args=None, flat=False):
+            self.queries.append(query_string)
+            return submit_query(frontend, query_string, args, flat)
+        server.FrontEnd.submit_query = counting_submit_query
+        self.submit_query = submit_query
+
+    def teardown_method(self, method):
+        server.FrontEnd.submit_query = self.submit_query
+        server.database_file = None
+        shutil.rmtree(self.temp_dir)
+
+    def test_repeat_views_run_no_queries(self):
+        first = self.client.get('/inspect/inst1/db1')
+        assert self.queries
+        del self.queries[:]
+        second = self.client.get('/inspect/inst1/db1')
+        assert self.queries == []
+        assert second.data == first.data
+        assert second.headers['ETag'] == first.headers['ETag']
+        assert 'Last-Modified' in second.headers
+
+    def test_invalidated_by_results_write(self):
+        first = self.client.get('/inspect/inst1/db1')
+        del self.queries[:]
+        results = check_results.CheckResults('inst1', 'db1', self.db_fqfn)
+        run_dt  = datetime.datetime(2016, 3, 1)
+        results.add('table_9', 'check_b', 0, 0, run_start_timestamp=run_dt, run_stop_timestamp=run_dt)
+        results.write_to_sqlite()
+        second = self.client.get('/inspect/inst1/db1')
+        assert self.queries
+        assert 'table_9' in second.data
+        assert second.headers['ETag'] != first.headers['ETag']
+
+    def test_not_modified(self):
+        etag = self.client.get('/inspect/inst1/db1/table_0').headers['ETag']
+        response = self.client.get('/inspect/inst1/db1/table_0', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == ''
+
+    def test_searches_not_cached(self):
+        self.client.get('/inspect/inst1/db1')
+        del self.queries[:]
+        response = self.client.post('/inspect/inst1/db1', data={'searchquery': 'table_1'})
+        assert self.queries
+        assert 'table_1' in response.data
+        assert 'table_2' not in response.data
+
+    def test_lru(self):
+        cache = server.PageCache(max_entries=2)
+        cache.put('/a', 1, 'a')
+        cache.put('/b', 1, 'b')
+        assert cache.get('/a', 1) == 'a'
+        cache.put('/c', 1, 'c')
+        assert cache.get('/b', 1) is None
+        assert cache.get('/a', 1) == 'a'
+        assert cache.get('/a', 2) is None
+
+
+
+class TestApi(object):
+
+    def setup_method(self, method):
+        self.temp_dir = tempfile.mkdtemp(prefix='hadinsp_')
+        self.db_fqfn  = pjoin(self.temp_dir, 'results.sqlite')
+        create_results_db(self.db_fqfn)
+        server.database_file = self.db_fqfn
+        self.client   = server.app.test_client()
+
+    def teardown_method(self, method):
+        server.database_file = None
+        shutil.rmtree(self.temp_dir)
+
+    def get_json(self, url):
+        response = self.client.get(url)
+        assert response.status_code == 200
+        assert response.headers['Content-Type'] == 'application/json'
+        return json.loads(response.data)
+
+    def test_history(self):
+        data = self.get_json('/api/v1/history?instance=inst1&database=db1&granularity=day&window=8')
+        assert data['granularity'] == 'day'
+        assert [x['key'] for x in data['series']] == ['table_0', 'table_1', 'table_2']
+        assert data['series'][0]['values'][-1] == ['2016-02-09', 10]
+        assert len(data['series'][0]['values']) == 8
+        assert data['series'][0]['color'] == server.colors[0]
+        data = self.get_json('/api/v1/history?instance=inst1&database=db1&table=table_0&check=check-a'
+                             '&granularity=month')
+        assert data['series'] == [{'key': 'check-a', 'color': server.colors[0],
+                                   'values': [['2016-01-01', 0], ['2016-02-01', 5]]}]
+
+    def test_downsampled_history(self):
+        data = self.get_json('/api/v1/history?instance=inst1&database=db1&granularity=day&points=6')
+        assert data['points'] == 6
+        assert all(len(x['values']) <= 6 for x in data['series'])
+        assert data['series'][0]['values'][-1] == ['2016-02-09', 10]
+        assert self.get_json('/api/v1/history?instance=inst1')['points'] == server.HISTORY_POINTS
+        assert self.client.get('/api/v1/history?instance=inst1&points=1').status_code == 400
+        assert self.client.get('/api/v1/history?instance=inst1&points=5000').status_code == 400
+
+    def test_dates(self):
+        data = self.get_json('/api/v1/history?instance=inst1&database=db1&tab=week')
+        assert [x[0] for x in data['series'][0]['values']] == ['2016-02-%02d' % day for day in range(2, 10)]
+        data = self.get_json('/api/v1/history?instance=inst1&database=db1&tab=month&to=2016-01-31')
+        assert len(data['series'][0]['values']) == 31
+        assert data['series'][0]['values'][-1][0] == '2016-01-31'
+        data = self.get_json('/api/v1/history?instance=inst1&database=db1&tab=year&from=2016-02-01')
+        assert data['points'] == 180
+        assert len(data['series'][0]['values']) == 9
+        assert self.get_json('/api/v1/status?instance=inst1&database=db1&to=2016-02-01') == \
+            {'status': {'table_0': 0, 'table_1': 0, 'table_2': 0}}
+        data = self.get_json('/api/v1/checkdetails?instance=inst1&database=db1&table=table_0&check=check_b'
+                             '&page_size=5&from=2016-02-01')
+        assert 'from=2016-02-01' in data['next_url']
+        assert len(self.get_json(data['next_url'])['rows']) == 4
+        page = self.client.get('/inspect/inst1/db1?page_size=2&from=2016-01-05&to=2016-01-06').data
+        assert '"from": "2016-01-05"' in page
+        assert 'from=2016-01-05' in page and 'to=2016-01-06' in page
+        assert self.client.get('/api/v1/history?instance=inst1&tab=decade').status_code == 400
+        assert self.client.get('/api/v1/history?instance=inst1&from=2016-13-01').status_code == 400
+        assert self.client.get('/inspect/inst1?to=yesterday').status_code == 400
+
+    def test_status(self):
+        assert list(self.get_json('/api/v1/status')['status']) == ['inst1']
+        assert self.get_json('/api/v1/status?instance=inst1&database=db1&table=table_0') == \
+            {'status': {'check-a': 5, 'check_b': 5}}
+
+    def test_history_of_page(self):
+        data = self.get_json('/api/v1/history?instance=inst1&database=db1&tab=week&name=table_1&name=table_2')
+        assert [x['key'] for x in data['series']] == ['table_1', 'table_2']
+        assert self.get_json('/api/v1/history?instance=inst1&database=db1&tab=week&name=')['series'] == []
+        #--- the list page's charts only request its own names:
+        page = self.client.get('/inspect/inst1/db1?page_size=2').data
+        assert '"name": ["table_0", "table_1"]' in page
+
+    def test_checkdetails(self):
+        data = self.get_json('/api/v1/checkdetails?instance=inst1&database=db1&table=table_0&check=check_b'
+                             '&page_size=30')
+        assert len(data['rows']) == 30
+        assert data['prev_url'] is None
+        data = self.get_json(data['next_url'])
+        assert len(data['rows']) == 10
+        assert data['next_url'] is None
+        data = self.get_json(data['prev_url'])
+        assert len(data['rows']) == 30
+        assert self.client.get('/api/v1/checkdetails?instance=inst1&database=db1&table=table_0&check=check_b'
+                               '&after=2016-01-01').status_code == 400
+
+    def test_search(self):
+        data = self.get_json('/api/v1/search?q=table_2+check_b')
+        assert data == {'checks': [{'instance': 'inst1', 'database': 'db1', 'table': 'table_2',
+                                    'check': 'check_b', 'description': None,
+                                    'url': '/inspect/inst1/db1/table_2/check_b'}]}
+        assert len(self.get_json('/api/v1/search?q=check&limit=3')['checks']) == 3
+        assert self.client.get('/api/v1/search?q=check&limit=0').status_code == 400
+
+    def test_bad_requests(self):
+        assert self.client.get('/api/v1/history?database=db1').status_code == 400
+        assert self.client.get('/api/v1/history?instance=inst1&granularity=hour').status_code == 400
+        assert self.client.get('/api/v1/checkdetails?instance=inst1&database=db1').status_code == 400
+
+    def test_pages_load_charts_from_api(self):
+        page = self.client.get('/inspect/inst1/db1').data
+        assert 'var chartScope = {' in page
+        assert '"database": "db1"' in page
+        assert '2016-02-09' not in page
+        page = self.client.get('/inspect/inst1/db1/table_0/check_b').data
+        assert 'loadCheckDetails("/api/v1/checkdetails?' in page
+
+    def test_list_pages(self):
+        page = self.client.get('/inspect/inst1/db1?page_size=2').data
+        assert 'table_1' in page
+        assert 'table_2' not in page
+        assert 'after=table_1' in page
+        page = self.client.get('/inspect/inst1/db1?page_size=2&after=table_1').data
+        assert 'table_2' in page
+        assert 'before=table_2' in page
+        page = self.client.post('/inspect/inst1/db1?page_size=1', data={'searchquery': 'table'}).data
+        assert 'searchquery=table' in page
+        assert self.client.get('/inspect/inst1/db1?page_size=0').status_code == 400
+        assert self.client.get('/inspect/inst1/db1?order=sideways').status_code == 400
+
+
+
+class TestLiveEvents(object):
+
+    def setup_method(self, method):
+        self.temp_dir    = tempfile.mkdtemp(prefix='hadinsp_')
+        self.events_fqfn = pjoin(self.temp_dir, 'events.ndjson')
+        self.client      = server.app.test_client()
+
+    def teardown_method(self, method):
+        server.events_file = None
+        shutil.rmtree(self.temp_dir)
+
+    def write_events(self, *lines, **kwargs):
+        with open(self.events_fqfn, kwargs.get('mode', 'a')) as f:
+            f.write(''.join(lines))
+
+    def get_messages(self, stream, cnt):
+        messages = []
+        while len(messages) < cnt:
+            message = next(stream)
+            if message.startswith('id: '):
+                event_id, data = message.strip().split('\n')
+                messages.append((event_id[len('id: '):], json.loads(data[len('data: '):])))
+        return messages
+
+    def test_follow_events(self):
+        run_started = '{"event": "run_started", "run_id": "1"}\n'
+        self.write_events(run_started, '{"event": "table_started", "run_id": "1"}\n{"event": "check_')
+        stream = server.follow_events(self.events_fqfn, poll_secs=0)
+        assert next(stream) == 'retry: 2000\n\n'
+        messages = self.get_messages(stream, 2)
+        assert [x[1]['event'] for x in messages] == ['run_started', 'table_started']
+        assert messages[0][0] == '1:%d' % len(run_started)
+
+        #--- the partial event is sent once it's complete:
+        self.write_events('started", "run_id": "1"}\n')
+        assert self.get_messages(stream, 1)[0][1] == {'event': 'check_started', 'run_id': '1'}
+
+        #--- a reconnect resumes after its last event:
+        resumed = server.follow_events(self.events_fqfn, last_event_id=messages[1][0], poll_secs=0)
+        assert self.get_messages(resumed, 1)[0][1] == {'event': 'check_started', 'run_id': '1'}
+
+        #--- a new run replaces the file - and is followed from its start:
+        os.remove(self.events_fqfn)
+        self.write_events('{"event": "run_started", "run_id": "2"}\n', mode='w')
+        assert self.get_messages(stream, 1)[0] == ('2:%d' % len(run_started),
+                                                   {'event': 'run_started', 'run_id': '2'})
+        stream.close()
+        resumed.close()
+
+    def test_resume_with_reused_inode(self):
+        self.write_events('{"event": "run_started", "run_id": "1"}\n',
+                          '{"event": "table_started", "run_id": "1"}\n')
+        stream = server.follow_events(self.events_fqfn, poll_secs=0)
+        last_event_id = self.get_messages(stream, 2)[1][0]
+        stream.close()
+        #--- a new run's file at the same inode - past the last offset, so that it isn't a line start:
+        self.write_events('{"event": "run_started", "run_id": "22"}\n',
+                          '{"event": "table_started", "run_id": "22"}\n', mode='w')
+        resumed = server.follow_events(self.events_fqfn, last_event_id=last_event_id, poll_secs=0)
+        assert [x[1]['run_id'] for x in self.get_messages(resumed, 2)] == ['22', '22']
+        #--- an offset within a line isn't resumed from, even within the run:
+        resumed.close()
+        resumed = server.follow_events(self.events_fqfn, last_event_id='22:5', poll_secs=0)
+        assert self.get_messages(resumed, 1)[0][1]['event'] == 'run_started'
+        resumed.close()
+
+    def test_keepalive_while_waiting_for_a_run(self):
+        stream = server.follow_events(self.events_fqfn, poll_secs=0, keepalive_secs=0)
+        assert next(stream) == 'retry: 2000\n\n'
+        assert next(stream) == ': keepalive\n\n'
+        self.write_events('{"event": "run_started", "run_id": "1"}\n')
+        assert self.get_messages(stream, 1)[0][1] == {'event': 'run_started', 'run_id': '1'}
+        stream.close()
+
+    def test_routes(self):
+        assert self.client.get('/api/v1/events').status_code == 404
+        assert 'set events_file in config.json' in self.client.get('/live').data
+        server.events_file = self.events_fqfn
+        self.write_events('{"event": "run_started"}\n')
+        response = self.client.get('/api/v1/events')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        assert response.headers['Cache-Control'] == 'no-cache'
+        stream = response.response
+        next(stream)
+        assert self.get_messages(stream, 1)[0][1] == {'event': 'run_started'}
+        response.close()
+        page = self.client.get('/live').data
+        assert 'followRun("/api/v1/events")' in page
+        assert 'loadGraphInto' not in page
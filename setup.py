@@ -44,7 +44,9 @@ setup(name             = 'hadoop-inspector',
             'Topic :: Scientific/Engineering :: Information Analysis',
             ],
       scripts          = ['scripts/hadoopinspector_demogen.py',
-                          'scripts/hadoopinspector_runner.py' ],
+                          'scripts/hadoopinspector_runner.py',
+                          'scripts/hadoopinspector_benchmark.py',
+                          'scripts/hadoopinspector_scheduler.py' ],
       install_requires = REQUIREMENTS,
       packages         = find_packages(),
       include_package_data = True,